@@ -1,5 +1,13 @@
+from datetime import datetime
+
 from flask import Flask, request, jsonify
-import sqlite3
+
+from db import get_connection
+import health_checks
+import key_filter
+
+# База бота, с которой работает этот API
+BOT_DATABASE_PATH = 'bot_secure.db'
 
 app = Flask(__name__)
 
@@ -9,22 +17,37 @@ def home():
         "service": "License Bot API",
         "endpoints": [
             "/health",
+            "/livez",
+            "/readyz",
             "/check_license/<key>/<account>"
         ]
     }
 
 @app.route('/health')
 def health_check():
+    body, status = health_checks.readiness(BOT_DATABASE_PATH)
     return {
-        "status": "healthy", 
-        "timestamp": "2025-06-26T07:55:50+05:00",
-        "database": "connected"
-    }
+        "status": "healthy" if status == 200 else "unhealthy",
+        "timestamp": datetime.now().isoformat(),
+        "database": "connected" if body["checks"]["database"]["status"] == "ok" else "unavailable"
+    }, 200 if status == 200 else 500
+
+@app.route('/livez')
+def livez():
+    return health_checks.liveness()
+
+@app.route('/readyz')
+def readyz():
+    return health_checks.readiness(BOT_DATABASE_PATH)
+
 @app.route('/check_license/<key>/<account>')
 def check_license(key, account):
+    # Неверный формат / неизвестный ключ - отказ без обращения к БД
+    if not key_filter.get_filter(BOT_DATABASE_PATH, 'users').check(key):
+        return jsonify({"valid": False, "error": "invalid"})
         
-    # Подключение к той же базе данных
-    conn = sqlite3.connect('bot_secure.db')
+    # Подключение к той же базе данных (теплое соединение из пула)
+    conn = get_connection(BOT_DATABASE_PATH)
     c = conn.cursor()
     
     # Проверка лицензии (упрощенная)
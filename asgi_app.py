@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+ASGI-версия API лицензий (те же эндпоинты и схема ответов, что в main.py).
+
+Запуск:  uvicorn asgi_app:app --host 0.0.0.0 --port $PORT
+
+Попадания в кэш вердиктов отдаются прямо из event loop, только если лимиты
+частоты не ходят в SQLite (RATE_LIMIT_BACKEND=memory или RATE_LIMIT_ENABLED=0);
+иначе проверка целиком идет в пул потоков.
+"""
+import re
+import json
+import logging
+from urllib.parse import parse_qs
+from collections.abc import Iterator
+
+import db
+import async_db
+from async_db import run_db
+import license_service
+import expiry_scheduler
+import stats_counters
+import license_changes
+from rate_limit import client_address
+from request_logging import setup_request_logging
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Записи о проверках лицензий идут через очередь в отдельный поток
+setup_request_logging()
+
+# Максимальный размер тела запроса (пакетная проверка)
+MAX_BODY_BYTES = 1024 * 1024
+
+# ============================================================================
+# 🔧 СЕРИАЛИЗАЦИЯ (КАК flask.jsonify)
+# ============================================================================
+
+def _json_bytes(body):
+    """JSON в том же виде, что отдает Flask: ключи отсортированы, компактно, \\n в конце"""
+    return json.dumps(body, ensure_ascii=True, sort_keys=True, separators=(',', ':')).encode('ascii') + b'\n'
+
+
+async def _send_json(send, body, status=200, headers=None):
+    payload = _json_bytes(body)
+    raw_headers = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(payload)).encode('ascii'))
+    ]
+    for name, value in (headers or {}).items():
+        raw_headers.append((name.lower().encode('latin-1'), str(value).encode('latin-1')))
+
+    await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+async def _send_empty(send, status, headers=None):
+    """Ответ без тела (304 Not Modified)"""
+    raw_headers = [(name.lower().encode('latin-1'), str(value).encode('latin-1')) for name, value in (headers or {}).items()]
+    await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def _send_stream(send, chunks, status=200, headers=None):
+    """Потоковый ответ: куски итератора читаются в пуле потоков БД по одному"""
+    raw_headers = [(name.lower().encode('latin-1'), str(value).encode('latin-1')) for name, value in (headers or {}).items()]
+    await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+    while True:
+        chunk = await run_db(next, chunks, None)
+        if chunk is None:
+            break
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def _read_body(receive):
+    """Чтение тела запроса целиком (с ограничением размера)"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise ValueError("Request body too large")
+        chunks.append(chunk)
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+def _query_args(scope):
+    """Параметры строки запроса: первое значение каждого (как request.args.get)"""
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return {name: values[0] for name, values in query.items()}
+
+
+def _header(scope, name):
+    """Значение заголовка запроса (name - в нижнем регистре, bytes) или None"""
+    for header_name, value in scope.get('headers', ()):
+        if header_name == name:
+            return value.decode('latin-1')
+    return None
+
+
+def _admin_denied(scope):
+    """Все /admin/* - только с токеном админа (журнал изменений - и с токеном реплики); None - доступ разрешен"""
+    if not scope['path'].startswith('/admin/'):
+        return None
+    token = _header(scope, license_service.ADMIN_TOKEN_HEADER.lower().encode('latin-1'))
+    return license_service.admin_denied(token, scope['path'])
+
+
+def _client_ip(scope):
+    """IP клиента (с учетом доверенных прокси, RATE_LIMIT_TRUSTED_PROXIES)"""
+    client = scope.get('client')
+    return client_address(client[0] if client else None, _header(scope, b'x-forwarded-for'))
+
+
+# ============================================================================
+# 🔐 API ENDPOINTS
+# ============================================================================
+
+async def home(scope, params, receive):
+    """Главная страница API"""
+    return license_service.service_info()
+
+
+async def health_check(scope, params, receive):
+    """Проверка состояния сервиса"""
+    return await run_db(license_service.health)
+
+
+async def livez(scope, params, receive):
+    """Liveness-проба (без обращения к БД)"""
+    return license_service.livez()
+
+
+def _executor_check(executor):
+    """Насыщение пула потоков БД: запросы сверх числа воркеров ждут в очереди"""
+    queued = max(0, executor["in_flight"] - executor["workers"])
+    return dict(executor, queued=queued, status="warn" if queued else "ok")
+
+
+async def readyz(scope, params, receive):
+    """Readiness-проба: свежий кэш отдаем прямо из event loop"""
+    # Снимок загрузки пула берем до того, как сама проба займет воркер
+    executor = async_db.stats()
+    extra_checks = {"db_executor": lambda: _executor_check(executor)}
+    result = license_service.readyz(extra_checks, cache_only=True)
+    if result is not None:
+        return result
+    return await run_db(license_service.readyz, extra_checks)
+
+
+async def get_stats(scope, params, receive):
+    """Статистика системы"""
+    return await run_db(license_service.stats)
+
+
+async def get_metrics(scope, params, receive):
+    """Технические метрики процесса (+ пул потоков БД)"""
+    return license_service.metrics(extra={"db_executor": async_db.stats()})
+
+
+async def check_license(scope, params, receive):
+    """🔐 ОСНОВНАЯ ФУНКЦИЯ: Проверка лицензионного ключа"""
+    license_key = params['license_key']
+    account_number = params.get('account_number', "")
+    client_ip = _client_ip(scope)
+    if_none_match = _header(scope, b'if-none-match')
+
+    # Попадание в кэш отвечаем прямо из event loop, без похода в пул потоков
+    result = license_service.check_license(
+        license_key, account_number, client_ip=client_ip, cache_only=True, if_none_match=if_none_match
+    )
+    if result is not None:
+        return result
+    return await run_db(
+        license_service.check_license, license_key, account_number,
+        client_ip=client_ip, if_none_match=if_none_match
+    )
+
+
+async def check_licenses_batch(scope, params, receive):
+    """🔐 Пакетная проверка лицензий для терминальных ферм"""
+    try:
+        raw = await _read_body(receive)
+    except ValueError as e:
+        return {"error": str(e)}, 413, license_service.NO_HEADERS
+
+    try:
+        data = json.loads(raw) if raw else None
+    except ValueError:
+        data = None
+    return await run_db(license_service.check_licenses_batch, data, client_ip=_client_ip(scope))
+
+
+async def get_license_token(scope, params, receive):
+    """Выдача подписанного токена для локальной проверки в советнике"""
+    return await run_db(license_service.license_token, params['license_key'], params['account_number'],
+                        client_ip=_client_ip(scope))
+
+
+async def get_revoked_licenses(scope, params, receive):
+    """Список отозванных ключей"""
+    return await run_db(license_service.revoked_licenses)
+
+
+async def admin_get_licenses(scope, params, receive):
+    """Админ: Лицензии постранично с фильтрами; ?format=ndjson - потоковая выгрузка всех"""
+    args = _query_args(scope)
+    if args.get('format') == 'ndjson':
+        return license_service.admin_licenses_export(args)
+    return await run_db(license_service.admin_licenses, args)
+
+
+async def admin_get_license_changes(scope, params, receive):
+    """Админ/реплики: Журнал изменений лицензий после курсора; ?format=ndjson - поток до текущего конца"""
+    args = _query_args(scope)
+    if args.get('format') == 'ndjson':
+        return await run_db(license_service.admin_license_changes_export, args)
+    return await run_db(license_service.admin_license_changes, args)
+
+
+async def admin_verify_payment(scope, params, receive):
+    """Админ: Подтвердить оплату лицензии"""
+    return await run_db(license_service.admin_verify_payment, params['license_key'])
+
+
+async def admin_revoke_license(scope, params, receive):
+    """Админ: Отозвать лицензию"""
+    return await run_db(license_service.admin_revoke_license, params['license_key'])
+
+
+async def admin_pending_payments(scope, params, receive):
+    """Админ: Очередь чеков на проверку (?limit=&cursor=)"""
+    args = _query_args(scope)
+    return await run_db(license_service.admin_pending_payments, args.get('limit'), args.get('cursor'))
+
+
+async def admin_review_payments(scope, params, receive):
+    """Админ: Одобрить / отклонить пачку чеков одной транзакцией"""
+    try:
+        raw = await _read_body(receive)
+    except ValueError as e:
+        return {"error": str(e)}, 413, license_service.NO_HEADERS
+
+    try:
+        data = json.loads(raw) if raw else None
+    except ValueError:
+        data = None
+    return await run_db(license_service.admin_review_payments, data)
+
+
+# Маршруты: (метод, шаблон пути, обработчик); <name> совпадает с одним сегментом
+ROUTES = [
+    ('GET', '/', home),
+    ('GET', '/health', health_check),
+    ('GET', '/livez', livez),
+    ('GET', '/readyz', readyz),
+    ('GET', '/stats', get_stats),
+    ('GET', '/metrics', get_metrics),
+    ('GET', '/check_license/<license_key>/<account_number>', check_license),
+    ('GET', '/check_license/<license_key>', check_license),
+    ('POST', '/check_licenses', check_licenses_batch),
+    ('GET', '/license_token/<license_key>/<account_number>', get_license_token),
+    ('GET', '/revoked_licenses', get_revoked_licenses),
+    ('GET', '/admin/licenses', admin_get_licenses),
+    ('GET', '/admin/license_changes', admin_get_license_changes),
+    ('POST', '/admin/verify_payment/<license_key>', admin_verify_payment),
+    ('POST', '/admin/revoke_license/<license_key>', admin_revoke_license),
+    ('GET', '/admin/pending_payments', admin_pending_payments),
+    ('POST', '/admin/review_payments', admin_review_payments),
+]
+
+
+def _compile_routes(routes):
+    compiled = []
+    for method, pattern, handler in routes:
+        regex = re.sub(r'<(\w+)>', r'(?P<\1>[^/]+)', pattern)
+        compiled.append((method, re.compile(f'^{regex}$'), handler))
+    return compiled
+
+
+_COMPILED_ROUTES = _compile_routes(ROUTES)
+
+
+def _match(method, path):
+    """Обработчик и параметры пути; (None, allowed_methods) если не нашли"""
+    allowed = []
+    for route_method, regex, handler in _COMPILED_ROUTES:
+        match = regex.match(path)
+        if match is None:
+            continue
+        if route_method == method or (method == 'HEAD' and route_method == 'GET'):
+            return handler, match.groupdict()
+        allowed.append(route_method)
+    return None, allowed
+
+
+# ============================================================================
+# 🚀 ASGI ПРИЛОЖЕНИЕ
+# ============================================================================
+
+async def _lifespan(receive, send):
+    """Инициализация схемы и планировщика истечения при старте, их остановка при завершении"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await run_db(lambda: db.init_schema(db.get_connection(license_service.DATABASE_PATH)))
+                expiry_scheduler.start_sweeper(license_service.DATABASE_PATH)
+                # Сверка счетчиков /stats (первая - сразу, полным сканированием)
+                await run_db(stats_counters.start_reconciler, license_service.DATABASE_PATH)
+                # Изменения лицензий из бота сбрасывают кэш вердиктов сразу, а не по TTL
+                await run_db(
+                    license_changes.start_follower, license_service.DATABASE_PATH, license_service.apply_license_changes
+                )
+                logger.info("🚀 ASGI License API запущен")
+                await send({'type': 'lifespan.startup.complete'})
+            except Exception as e:
+                logger.error(f"❌ Ошибка инициализации БД API: {e}")
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+        elif message['type'] == 'lifespan.shutdown':
+            expiry_scheduler.get_scheduler(license_service.DATABASE_PATH).stop()
+            async_db.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """Точка входа ASGI"""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    handler, params = _match(scope['method'], scope['path'])
+    if handler is None:
+        if params:
+            await _send_json(send, {"error": "Method not allowed"}, 405, {"Allow": ", ".join(params)})
+        else:
+            await _send_json(send, {"error": "Not found"}, 404)
+        return
+
+    try:
+        body, status, headers = _admin_denied(scope) or await handler(scope, params, receive)
+    except Exception as e:
+        logger.exception(f"❌ Необработанная ошибка ASGI: {e}")
+        body, status, headers = {"error": "Internal server error"}, 500, license_service.NO_HEADERS
+
+    if body is None:
+        await _send_empty(send, status, headers)
+    elif isinstance(body, Iterator):
+        await _send_stream(send, body, status, headers)
+    else:
+        await _send_json(send, body, status, headers)
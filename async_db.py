@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# ============================================================================
+# ⚡ НЕБЛОКИРУЮЩИЙ ДОСТУП К БД ДЛЯ ASYNC-КОДА (БОТ)
+# ============================================================================
+
+# Ограниченный пул потоков: работа с SQLite никогда не выполняется в event loop
+DB_EXECUTOR_WORKERS = int(os.environ.get('DB_EXECUTOR_WORKERS', 4))
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = 0
+_completed = 0
+
+
+def get_executor():
+    """Пул потоков для БД (создается при первом обращении)"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=DB_EXECUTOR_WORKERS,
+                    thread_name_prefix='db-executor'
+                )
+    return _executor
+
+
+async def run_db(fn, *args, **kwargs):
+    """Выполнить синхронную функцию БД в пуле потоков и дождаться результата"""
+    global _in_flight, _completed
+    loop = asyncio.get_running_loop()
+    _in_flight += 1
+    try:
+        return await loop.run_in_executor(get_executor(), functools.partial(fn, *args, **kwargs))
+    finally:
+        _in_flight -= 1
+        _completed += 1
+
+
+def shutdown(wait=True):
+    """Остановить пул (при завершении приложения)"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def stats():
+    """Загрузка пула для мониторинга"""
+    return {
+        "workers": DB_EXECUTOR_WORKERS,
+        "in_flight": _in_flight,
+        "completed": _completed
+    }
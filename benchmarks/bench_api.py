@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк API проверки лицензий: Flask (gunicorn, sync-воркер) против
+ASGI-версии (uvicorn). Считает requests/sec и задержки p50/p99.
+
+По умолчанию поднимает оба сервера сам на временной БД с тестовыми ключами:
+    python benchmarks/bench_api.py --requests 5000 --concurrency 64
+
+Или замер уже запущенных серверов:
+    python benchmarks/bench_api.py --flask-url http://127.0.0.1:5000 --asgi-url http://127.0.0.1:8000
+"""
+import os
+import sys
+import time
+import socket
+import random
+import asyncio
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timedelta
+
+import aiohttp
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import db
+
+
+def seed_database(path, licenses):
+    """Временная БД: licenses действующих ключей с привязанными счетами"""
+    conn = sqlite3.connect(path)
+    db.init_schema(conn)
+    expires_at = datetime.now() + timedelta(days=30)
+    keys = [(f"BENCH-{i:06d}", str(100000 + i)) for i in range(licenses)]
+    conn.executemany('''
+        INSERT INTO licenses (license_key, account_number, plan_type, telegram_user_id, expires_at, is_active, payment_verified)
+        VALUES (?, ?, 'monthly', '1', ?, 1, 1)
+    ''', [(key, account, expires_at) for key, account in keys])
+    conn.commit()
+    conn.close()
+    return keys
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind, db_path, workers):
+    """Запуск сервера в отдельном процессе; возвращает (process, url)"""
+    port = free_port()
+    # Вся нагрузка идет с одного адреса: лимит по IP (включен по умолчанию) отключаем
+    env = dict(os.environ, DATABASE_PATH=db_path, PYTHONPATH=PROJECT_DIR, REQUEST_LOG_SAMPLE_RATE='0',
+               RATE_LIMIT_ENABLED='0')
+    if kind == 'flask':
+        cmd = ['gunicorn', 'main:app', '-b', f'127.0.0.1:{port}', '-w', str(workers), '-k', 'sync', '--log-level', 'warning']
+    else:
+        cmd = ['uvicorn', 'asgi_app:app', '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers), '--log-level', 'warning']
+    process = subprocess.Popen(cmd, cwd=PROJECT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def wait_ready(url, timeout=15):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{url}/") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Сервер {url} не поднялся за {timeout}s")
+
+
+async def run_load(url, keys, total, concurrency, miss_ratio):
+    """total запросов check_license, concurrency одновременных клиентов"""
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker(session):
+        nonlocal errors
+        for _ in counter:
+            if random.random() < miss_ratio:
+                path = f"/check_license/UNKNOWN-{random.randrange(10 ** 9)}/1"
+            else:
+                key, account = random.choice(keys)
+                path = f"/check_license/{key}/{account}"
+            started = time.perf_counter()
+            try:
+                async with session.get(url + path) as response:
+                    await response.read()
+                    if response.status >= 500:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p99": latencies[max(0, int(len(latencies) * 0.99) - 1)],
+        "errors": errors
+    }
+
+
+async def bench(name, url, keys, args):
+    await wait_ready(url)
+    # Прогрев (соединения пула, кэш вердиктов)
+    await run_load(url, keys, min(500, args.requests), args.concurrency, args.miss_ratio)
+    result = await run_load(url, keys, args.requests, args.concurrency, args.miss_ratio)
+    print(
+        f"{name:>6}: {result['rps']:8.1f} req/s | p50 {result['p50']:6.2f}ms | "
+        f"p99 {result['p99']:7.2f}ms | ошибок: {result['errors']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--licenses', type=int, default=1000, help='ключей в тестовой БД')
+    parser.add_argument('--miss-ratio', type=float, default=0.1, help='доля запросов с несуществующим ключом')
+    parser.add_argument('--workers', type=int, default=1, help='воркеров на сервер')
+    parser.add_argument('--flask-url', help='уже запущенный Flask API')
+    parser.add_argument('--asgi-url', help='уже запущенный ASGI API')
+    args = parser.parse_args()
+
+    processes = []
+    keys = None
+    try:
+        if args.flask_url and args.asgi_url:
+            # Чужие серверы: ключи берем из их БД
+            conn = sqlite3.connect(db.DATABASE_PATH)
+            keys = [(k, a or "") for k, a in conn.execute("SELECT license_key, account_number FROM licenses LIMIT ?", (args.licenses,))]
+            conn.close()
+            targets = [('flask', args.flask_url), ('asgi', args.asgi_url)]
+        else:
+            db_path = os.path.join(tempfile.mkdtemp(prefix='bench_api_'), 'bench.db')
+            keys = seed_database(db_path, args.licenses)
+            targets = []
+            for kind in ('flask', 'asgi'):
+                process, url = start_server(kind, db_path, args.workers)
+                processes.append(process)
+                targets.append((kind, url))
+
+        print(f"запросов: {args.requests}, клиентов: {args.concurrency}, ключей: {len(keys)}, промахов: {args.miss_ratio:.0%}")
+        for name, url in targets:
+            asyncio.run(bench(name, url, keys, args))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: пропускная способность апдейтов бота при работе с БД
+из event loop (blocking) и через пул потоков async_db (executor).
+
+Запуск:  python benchmarks/bench_bot_db.py --users 200 --updates 5
+"""
+import os
+import sys
+import time
+import logging
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+# Отдельная временная БД - до импорта модулей проекта
+_tmp_dir = tempfile.mkdtemp(prefix='bench_bot_db_')
+os.environ['DATABASE_PATH'] = os.path.join(_tmp_dir, 'bench.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import async_db
+import telegram_bot
+
+# Логи каждой записи искажают замер
+logging.getLogger('telegram_bot').setLevel(logging.WARNING)
+
+
+async def simulate_update(mode, user_id, n):
+    """Один апдейт: покупка лицензии (запись в БД) + ответ в Telegram"""
+    license_key = f"BENCH-{mode}-{user_id}-{n}"
+    if mode == 'blocking':
+        telegram_bot.save_license_to_db(license_key, "monthly", user_id, 30, telegram_bot.MONTHLY_PRICE)
+    else:
+        await async_db.run_db(telegram_bot.save_license_to_db, license_key, "monthly", user_id, 30, telegram_bot.MONTHLY_PRICE)
+    # Имитация сетевого вызова edit_message_text
+    await asyncio.sleep(0.005)
+
+
+async def simulate_user(mode, user_id, updates):
+    """Пользователь шлет апдейты последовательно"""
+    for n in range(updates):
+        await simulate_update(mode, user_id, n)
+
+
+async def heartbeat(lags, stop):
+    """Измерение задержки event loop (насколько он был заблокирован)"""
+    interval = 0.001
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - started - interval) * 1000)
+
+
+async def run(mode, users, updates):
+    lags = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(lags, stop))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(simulate_user(mode, 100000 + u, updates) for u in range(users)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await beat
+
+    total = users * updates
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99) - 1] if lags else 0.0
+    print(
+        f"{mode:>9}: {total} апдейтов за {elapsed:.2f}s -> {total / elapsed:8.1f} upd/s | "
+        f"лаг event loop: median {statistics.median(lags) if lags else 0:.2f}ms, "
+        f"p99 {p99:.2f}ms, max {max(lags) if lags else 0:.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200, help='одновременных пользователей')
+    parser.add_argument('--updates', type=int, default=5, help='апдейтов на пользователя')
+    args = parser.parse_args()
+
+    init = db.get_connection()
+    db.init_schema(init)
+    print(f"БД: {db.DATABASE_PATH}, пул потоков: {async_db.DB_EXECUTOR_WORKERS}")
+
+    for mode in ('blocking', 'executor'):
+        asyncio.run(run(mode, args.users, args.updates))
+    async_db.shutdown()
+
+
+if __name__ == '__main__':
+    main()
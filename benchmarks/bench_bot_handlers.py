@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Микро-бенчмарк: CPU-время обработчиков бота на один апдейт
+(построение клавиатур и текстов, без сети: ответы Telegram - заглушки).
+
+Запуск:  python benchmarks/bench_bot_handlers.py --iterations 5000
+"""
+import os
+import sys
+import time
+import types
+import asyncio
+import logging
+import argparse
+import tempfile
+
+# Отдельная временная БД - до импорта модулей проекта
+_tmp_dir = tempfile.mkdtemp(prefix='bench_bot_handlers_')
+os.environ['DATABASE_PATH'] = os.path.join(_tmp_dir, 'bench.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telegram_bot
+
+logging.getLogger('telegram_bot').setLevel(logging.WARNING)
+
+USER_ID = 424242
+
+
+class FakeMessage:
+    async def reply_text(self, text, **kwargs):
+        pass
+
+
+class FakeQuery:
+    """CallbackQuery без сети"""
+
+    def __init__(self, data=''):
+        self.data = data
+        self.from_user = types.SimpleNamespace(id=USER_ID, first_name='Bench', username='bench')
+
+    async def answer(self):
+        pass
+
+    async def edit_message_text(self, text, **kwargs):
+        pass
+
+
+def fake_update():
+    user = types.SimpleNamespace(id=USER_ID, first_name='Bench', username='bench')
+    return types.SimpleNamespace(effective_user=user, message=FakeMessage())
+
+
+CASES = {
+    'start': lambda: telegram_bot.start(fake_update(), None),
+    'back_to_main': lambda: telegram_bot.start_from_callback(FakeQuery('back_to_main')),
+    'verify_payment': lambda: telegram_bot.start_payment_verification(FakeQuery('verify_payment')),
+    'payment_details': lambda: telegram_bot.show_payment_details(FakeQuery(), 'visa', 'RFX-BENCH-KEY0-0000-000-00'),
+    'button_router': lambda: telegram_bot.button_handler(
+        types.SimpleNamespace(callback_query=FakeQuery('back_to_main')), None
+    ),
+}
+
+
+async def measure(name, factory, iterations):
+    # Прогрев (кэш пользователя, ленивые импорты)
+    for _ in range(min(100, iterations)):
+        await factory()
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    for _ in range(iterations):
+        await factory()
+    cpu_us = (time.process_time() - cpu_started) / iterations * 1e6
+    wall_us = (time.perf_counter() - wall_started) / iterations * 1e6
+    print(f"{name:>16}: CPU {cpu_us:8.1f} мкс/апдейт | wall {wall_us:8.1f} мкс/апдейт")
+
+
+async def run(args):
+    telegram_bot.init_database()
+    for name in args.cases.split(','):
+        await measure(name, CASES[name], args.iterations)
+    telegram_bot.shutdown_db_executor()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=5000)
+    parser.add_argument('--cases', default=','.join(CASES))
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
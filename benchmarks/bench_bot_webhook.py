@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк задержки обработки апдейтов бота: polling против webhook,
+полностью офлайн (фейковый Bot API из benchmarks/fake_bot_api.py).
+
+Бот запускается отдельным процессом (BOT_API_BASE_URL указывает на фейк),
+на каждый /start от нового пользователя меряется время до sendMessage.
+
+Запуск:  python benchmarks/bench_bot_webhook.py --updates 300 --concurrency 32 --concurrent-updates 8
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import aiohttp
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import start_fake_api
+
+WEBHOOK_SECRET = 'bench-secret'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_update(update_id, user_id):
+    """JSON апдейта: команда /start от пользователя user_id"""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}]
+        }
+    }
+
+
+def start_bot(mode, api_url, webhook_port, db_path, concurrent_updates, workers):
+    env = dict(
+        os.environ,
+        BOT_MODE=mode,
+        BOT_API_BASE_URL=api_url,
+        BOT_CONCURRENT_UPDATES=str(concurrent_updates),
+        WEBHOOK_HOST='127.0.0.1',
+        WEBHOOK_PORT=str(webhook_port),
+        WEBHOOK_URL=f"http://127.0.0.1:{webhook_port}/telegram/webhook",
+        WEBHOOK_SECRET=WEBHOOK_SECRET,
+        DATABASE_PATH=db_path
+    )
+    # Несколько воркеров webhook слушают один порт (SO_REUSEPORT); у каждого
+    # апдейта в нагрузке свой пользователь, так что порядок между процессами не важен
+    count = workers if mode == 'webhook' else 1
+    if count > 1:
+        env['WEBHOOK_REUSE_PORT'] = '1'
+    return [
+        subprocess.Popen([sys.executable, 'telegram_bot.py'], cwd=PROJECT_DIR, env=env,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for _ in range(count)
+    ]
+
+
+async def wait_ready(api, mode, webhook_port, timeout=15):
+    """Бот готов: webhook зарегистрирован и слушает / пошел первый getUpdates"""
+    if mode == 'polling':
+        await api.wait_for(lambda method, params: method == 'getUpdates', timeout)
+        return
+    await api.wait_for(lambda method, params: method == 'setWebhook', timeout)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', webhook_port), timeout=0.2):
+                return
+        except OSError:
+            await asyncio.sleep(0.05)
+    raise RuntimeError("Webhook-приемник не поднялся")
+
+
+async def run_load(api, mode, webhook_url, total, concurrency, first_user):
+    latencies = []
+    counter = iter(range(total))
+
+    async def worker(session):
+        for n in counter:
+            user_id = first_user + n
+            update = start_update(user_id, user_id)
+            reply = asyncio.ensure_future(api.wait_for(
+                lambda method, params, uid=user_id: method == 'sendMessage' and int(params.get('chat_id', 0)) == uid,
+                timeout=30
+            ))
+            started = time.perf_counter()
+            if mode == 'webhook':
+                headers = {'X-Telegram-Bot-Api-Secret-Token': WEBHOOK_SECRET}
+                async with session.post(webhook_url, json=update, headers=headers) as response:
+                    await response.read()
+            else:
+                await api.push_update(update)
+            await reply
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    async with aiohttp.ClientSession() as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p99": latencies[max(0, int(len(latencies) * 0.99) - 1)]
+    }
+
+
+async def bench(mode, args):
+    api, runner, api_url = await start_fake_api()
+    webhook_port = free_port()
+    db_path = os.path.join(tempfile.mkdtemp(prefix='bench_bot_webhook_'), 'bench.db')
+    processes = start_bot(mode, api_url, webhook_port, db_path, args.concurrent_updates, args.workers)
+    try:
+        await wait_ready(api, mode, webhook_port)
+        webhook_url = f"http://127.0.0.1:{webhook_port}/telegram/webhook"
+        # Прогрев (соединения, пул БД), затем замер на новых пользователях
+        await run_load(api, mode, webhook_url, min(50, args.updates), args.concurrency, 1_000_000)
+        result = await run_load(api, mode, webhook_url, args.updates, args.concurrency, 2_000_000)
+        print(f"{mode:>8}: {result['rps']:7.1f} upd/s | p50 {result['p50']:7.2f}ms | p99 {result['p99']:7.2f}ms")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=32, help='одновременных пользователей')
+    parser.add_argument('--concurrent-updates', type=int, default=8, help='BOT_CONCURRENT_UPDATES бота')
+    parser.add_argument('--workers', type=int, default=1, help='процессов бота в режиме webhook')
+    parser.add_argument('--modes', default='polling,webhook')
+    args = parser.parse_args()
+
+    print(f"апдейтов: {args.updates}, пользователей одновременно: {args.concurrency}, "
+          f"concurrent_updates: {args.concurrent_updates}, воркеров webhook: {args.workers}")
+    for mode in args.modes.split(','):
+        asyncio.run(bench(mode, args))
+
+
+if __name__ == '__main__':
+    main()
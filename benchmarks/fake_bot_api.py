@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Фейковый Telegram Bot API для офлайн-проверки бота (без доступа к api.telegram.org).
+
+Отвечает на методы, которые использует бот (getMe, setWebhook, sendMessage,
+editMessageText, answerCallbackQuery, getFile, ...), и запоминает вызовы.
+Бот направляется сюда через BOT_API_BASE_URL:
+
+    python benchmarks/fake_bot_api.py --port 8081
+    BOT_API_BASE_URL=http://127.0.0.1:8081 BOT_MODE=webhook WEBHOOK_PORT=8443 python telegram_bot.py
+"""
+import json
+import time
+import asyncio
+import argparse
+import itertools
+
+from aiohttp import web
+
+BOT_USER = {"id": 1000000001, "is_bot": True, "first_name": "RFX Test Bot", "username": "rfx_test_bot"}
+
+
+class FakeBotApi:
+    """Bot API в памяти: вызовы пишутся в calls, ожидающие ответов получают события"""
+
+    def __init__(self):
+        self.calls = []
+        self.webhook_url = None
+        self.webhook_secret = None
+        self.files = {}
+        self._message_ids = itertools.count(1)
+        self._waiters = []
+        self._updates = []
+        self._updates_changed = None
+
+    def add_file(self, file_id, content):
+        """Файл для getFile / скачивания (фото чека)"""
+        self.files[file_id] = content
+
+    def _condition(self):
+        if self._updates_changed is None:
+            self._updates_changed = asyncio.Condition()
+        return self._updates_changed
+
+    async def push_update(self, update):
+        """Обновление для бота в режиме polling (отдается через getUpdates)"""
+        async with self._condition():
+            self._updates.append(update)
+            self._condition().notify_all()
+
+    async def _get_updates(self, params):
+        """Long polling: ждем обновлений не дольше timeout"""
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        async with self._condition():
+            # Подтвержденные (update_id < offset) больше не нужны
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            if not self._updates and timeout > 0:
+                try:
+                    await asyncio.wait_for(self._condition().wait_for(lambda: self._updates), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return self._updates[:limit]
+
+    async def wait_for(self, predicate, timeout=10):
+        """Дождаться вызова, удовлетворяющего predicate(method, params)"""
+        for method, params, _ in self.calls:
+            if predicate(method, params):
+                return method, params
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((predicate, future))
+        return await asyncio.wait_for(future, timeout)
+
+    def _message(self, params):
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", "")
+        }
+
+    def _result(self, method, params):
+        if method == "getMe":
+            return BOT_USER
+        if method == "setWebhook":
+            self.webhook_url = params.get("url")
+            self.webhook_secret = params.get("secret_token")
+            return True
+        if method == "deleteWebhook":
+            self.webhook_url = None
+            return True
+        if method == "getWebhookInfo":
+            return {"url": self.webhook_url or "", "has_custom_certificate": False, "pending_update_count": 0}
+        if method in ("sendMessage", "sendPhoto", "sendDocument"):
+            return self._message(params)
+        if method == "editMessageText":
+            return self._message(params) if "chat_id" in params else True
+        if method == "getFile":
+            file_id = params.get("file_id")
+            content = self.files.get(file_id, b"")
+            return {"file_id": file_id, "file_unique_id": file_id, "file_size": len(content), "file_path": f"photos/{file_id}.jpg"}
+        return True
+
+    async def handle_method(self, request):
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = {}
+            for name, value in (await request.post()).items():
+                # PTB кодирует сложные параметры в JSON-строки
+                try:
+                    params[name] = json.loads(value) if isinstance(value, str) else value
+                except ValueError:
+                    params[name] = value
+
+        received_at = time.perf_counter()
+        self.calls.append((method, params, received_at))
+        for waiter in list(self._waiters):
+            predicate, future = waiter
+            if not future.done() and predicate(method, params):
+                future.set_result((method, params))
+                self._waiters.remove(waiter)
+
+        if method == "getUpdates":
+            result = await self._get_updates(params)
+        else:
+            result = self._result(method, params)
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_file(self, request):
+        file_id = request.match_info["file_path"].rsplit("/", 1)[-1].split(".", 1)[0]
+        if file_id not in self.files:
+            return web.Response(status=404)
+        return web.Response(body=self.files[file_id])
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle_method)
+        app.router.add_get("/file/bot{token}/{file_path:.+}", self.handle_file)
+        return app
+
+
+async def start_fake_api(host="127.0.0.1", port=0):
+    """Запуск в текущем event loop; возвращает (api, runner, base_url)"""
+    api = FakeBotApi()
+    runner = web.AppRunner(api.make_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = runner.addresses[0][1]
+    return api, runner, f"http://{host}:{bound_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+    web.run_app(FakeBotApi().make_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
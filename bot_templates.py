@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+from html import escape
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+# ============================================================================
+# 🧩 ГОТОВЫЕ КЛАВИАТУРЫ И ШАБЛОНЫ СООБЩЕНИЙ БОТА
+# ============================================================================
+#
+# Статичные клавиатуры и тексты собираются один раз при старте бота.
+# InlineKeyboardMarkup в PTB 20 неизменяемый, поэтому один объект можно
+# отдавать во все ответы. В обработчике подставляются только динамические
+# части (ключ, дата, имя) - склейкой заранее подготовленных кусков.
+
+DATE_FORMAT = '%d.%m.%Y %H:%M'
+
+
+def _markup(*rows):
+    """Клавиатура из строк вида [(текст, callback_data), ...]"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(text, callback_data=data) for text, data in row]
+        for row in rows
+    ])
+
+
+class BotTemplates:
+    """Предсобранные ответы бота для заданных тарифов и реквизитов"""
+
+    def __init__(self, payment_cards, monthly_price):
+        self.payment_cards = payment_cards
+        self.monthly_price = monthly_price
+
+        # ---------------- Клавиатуры ----------------
+        self.main_menu_markup = _markup(
+            [("🆓 Получить триал (3 дня бесплатно)", "trial")],
+            [("💳 Купить лицензию ($100/месяц)", "buy_license")],
+            [("📋 Мои лицензии", "my_licenses")],
+            [("💰 Подтвердить оплату", "verify_payment")]
+        )
+        self.main_menu_back_markup = _markup([("🔙 Главное меню", "back_to_main")])
+        self.back_markup = _markup([("🔙 Назад", "back_to_main")])
+        self.payment_details_markup = _markup(
+            [("💰 Подтвердить оплату", "verify_payment")],
+            [("🔙 Выбрать другую карту", "buy_license")],
+            [("🔙 Главное меню", "back_to_main")]
+        )
+        self.no_licenses_markup = _markup(
+            [("🆓 Получить триал", "trial")],
+            [("💳 Купить лицензию", "buy_license")],
+            [("🔙 Назад", "back_to_main")]
+        )
+        self.licenses_markup = _markup(
+            [("💳 Купить еще", "buy_license")],
+            [("🔙 Назад", "back_to_main")]
+        )
+        self.expiry_markup = _markup(
+            [("💳 Купить лицензию", "buy_license")],
+            [("🔙 Главное меню", "back_to_main")]
+        )
+        # Кнопки карт без ключа (ключ в callback_data добавляется на запрос)
+        self._card_buttons = [(card_info["name"], f"pay_card_{card_id}_") for card_id, card_info in payment_cards.items()]
+        self._main_menu_row = [InlineKeyboardButton("🔙 Главное меню", callback_data="back_to_main")]
+
+        # ---------------- Тексты ----------------
+        self._welcome_head = "🤖 <b>Добро пожаловать в RFX Trading License Bot!</b>\n\n👋 Привет, "
+        self._welcome_tail = (
+            "!\n\n"
+            "🔐 <b>Система лицензирования торгового советника MT5</b>\n\n"
+            "📋 <b>Доступные опции:</b>\n"
+            "• 🆓 <b>Триал период:</b> 3 дня бесплатно\n"
+            "• 💳 <b>Месячная лицензия:</b> $100 USD\n"
+            "• 📋 Просмотр активных лицензий\n"
+            "• 💰 Подтверждение оплаты\n\n"
+            "<i>Выберите действие:</i>"
+        )
+        self.main_menu_text = (
+            "🤖 <b>RFX Trading License Bot</b>\n\n"
+            "🔐 <b>Система лицензирования торгового советника</b>\n\n"
+            "• 🆓 <b>Триал:</b> 3 дня бесплатно\n"
+            "• 💳 <b>Лицензия:</b> $100 USD/месяц\n\n"
+            "<i>Выберите действие:</i>"
+        )
+        self.trial_used_text = (
+            "❌ <b>Триал уже использован</b>\n\n"
+            "Вы уже получали триал период.\n"
+            "Для продолжения купите месячную лицензию за $100."
+        )
+        cards_info = "".join(
+            f"• {card_info['name']}: {card_info['number']} ({card_info['owner']})\n"
+            for card_info in payment_cards.values()
+        )
+        self.payment_verification_text = (
+            "📸 <b>Подтверждение оплаты</b>\n\n"
+            f"Отправьте скриншот или фото чека об оплате ${monthly_price} USD\n\n"
+            f"💳 <b>Доступные карты для оплаты:</b>\n{cards_info}\n"
+            "После проверки ваша лицензия будет активирована!"
+        )
+        self._trial_head = "🎉 <b>Триал период активирован!</b>\n\n🔐 <b>Ваш лицензионный ключ:</b>\n<code>"
+        self._trial_middle = "</code>\n\n⏰ <b>Срок действия:</b> 3 дня\n📅 <b>Истекает:</b> "
+        self._trial_tail = (
+            "\n\n"
+            "📋 <b>Как использовать:</b>\n"
+            "1. Скопируйте ключ (нажмите на него)\n"
+            "2. Вставьте в настройки советника MT5\n"
+            "3. Запустите советника\n\n"
+            "💡 <b>После окончания триала:</b>\n"
+            "Купите месячную лицензию за $100 для продолжения работы."
+        )
+        self._purchase_head = (
+            "💳 <b>Покупка месячной лицензии</b>\n\n"
+            f"💰 <b>Сумма:</b> ${monthly_price} USD\n"
+            "🔐 <b>Лицензионный ключ:</b>\n<code>"
+        )
+        self._purchase_tail = "</code>\n\n💳 <b>Выберите способ оплаты:</b>"
+        self._details_head = "💳 <b>Реквизиты для оплаты</b>\n\n🔐 <b>Лицензионный ключ:</b>\n<code>"
+        self._details_tails = {
+            card_id: (
+                "</code>\n\n"
+                f"💰 <b>Сумма:</b> ${monthly_price} USD\n\n"
+                "💳 <b>Реквизиты карты:</b>\n"
+                f"• <b>Карта:</b> <code>{card_info['number']}</code>\n"
+                f"• <b>Получатель:</b> {card_info['owner']}\n"
+                f"• <b>Банк:</b> {card_info['bank']}\n"
+                f"• <b>Тип:</b> {card_info['name']}\n\n"
+                "📝 <b>Инструкция:</b>\n"
+                f"1. Переведите точную сумму ${monthly_price} USD\n"
+                "2. Нажмите 'Подтвердить оплату'\n"
+                "3. Отправьте скриншот перевода\n\n"
+                "⚠️ <b>ВАЖНО:</b> Сохраните лицензионный ключ!"
+            )
+            for card_id, card_info in payment_cards.items()
+        }
+        self.proof_received_text = (
+            "📥 <b>Чек получен</b>\n\n"
+            "Сохраняем чек, это займет несколько секунд..."
+        )
+        self.proof_duplicate_text = (
+            "❌ <b>Этот чек уже был отправлен</b>\n\n"
+            "Отправьте скриншот именно вашего перевода."
+        )
+        self.proof_already_paid_text = "✅ Эта лицензия уже оплачена."
+        self.proof_failed_text = (
+            "❌ Не удалось обработать чек.\n"
+            "Отправьте скриншот перевода (фото или изображение до 10 МБ)."
+        )
+        self._reminder_head = "⏰ <b>Лицензия скоро истекает</b>\n\n🔐 <code>"
+        self._reminder_middle = "</code>\n📅 <b>Истекает:</b> "
+        self._reminder_tail = (
+            "\n\n💳 Продлите доступ - купите месячную лицензию за "
+            f"${monthly_price}, чтобы советник не остановился."
+        )
+        self._expired_head = "❌ <b>Срок лицензии истек</b>\n\n🔐 <code>"
+        self._expired_middle = "</code>\n📅 <b>Истекла:</b> "
+        self._expired_tail = (
+            "\n\nСоветник больше не проходит проверку лицензии.\n"
+            f"💳 Для продолжения работы купите месячную лицензию за ${monthly_price}."
+        )
+        self._pending_head = "🕓 <b>Чек отправлен на проверку</b>\n\n🔐 <b>Лицензия:</b>\n<code>"
+        self._pending_tail = "</code>\n\nЛицензия будет активирована после проверки оплаты администратором."
+
+    # ---------------- Динамические части ----------------
+
+    def welcome_text(self, first_name):
+        # Имя пользователя экранируем: сообщение уходит с parse_mode=HTML
+        return self._welcome_head + escape(first_name or "") + self._welcome_tail
+
+    def trial_activated_text(self, license_key, expires_at):
+        return self._trial_head + license_key + self._trial_middle + expires_at.strftime(DATE_FORMAT) + self._trial_tail
+
+    def purchase_text(self, license_key):
+        return self._purchase_head + license_key + self._purchase_tail
+
+    def purchase_markup(self, license_key):
+        """Выбор карты: callback_data несет ключ, остальное готово заранее"""
+        rows = [[InlineKeyboardButton(name, callback_data=prefix + license_key)] for name, prefix in self._card_buttons]
+        rows.append(self._main_menu_row)
+        return InlineKeyboardMarkup(rows)
+
+    def licenses_page_markup(self, newer_data=None, older_data=None):
+        """Листание "Мои лицензии" + статичные кнопки; без листания - готовая клавиатура"""
+        nav = []
+        if newer_data:
+            nav.append(InlineKeyboardButton("⬅️ Новее", callback_data=newer_data))
+        if older_data:
+            nav.append(InlineKeyboardButton("Старее ➡️", callback_data=older_data))
+        if not nav:
+            return self.licenses_markup
+        return InlineKeyboardMarkup([nav, *self.licenses_markup.inline_keyboard])
+
+    def payment_details_text(self, card_id, license_key):
+        return self._details_head + license_key + self._details_tails[card_id]
+
+    def proof_pending_text(self, license_key):
+        return self._pending_head + license_key + self._pending_tail
+
+    def expiry_reminder_text(self, license_key, expires_at, days_left):
+        return (self._reminder_head + license_key + self._reminder_middle + expires_at.strftime(DATE_FORMAT)
+                + f"\n⏳ <b>Осталось дней:</b> {days_left}" + self._reminder_tail)
+
+    def license_expired_text(self, license_key, expires_at):
+        return self._expired_head + license_key + self._expired_middle + expires_at.strftime(DATE_FORMAT) + self._expired_tail
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+import os
+import hmac
+import signal
+import ipaddress
+import asyncio
+import logging
+
+from aiohttp import web
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# 🌐 ПРИЕМ ОБНОВЛЕНИЙ TELEGRAM ЧЕРЕЗ WEBHOOK (ЛОКАЛЬНЫЙ HTTP-ПРИЕМНИК)
+# ============================================================================
+#
+# Telegram (или локальный фейковый Bot API, см. benchmarks/fake_bot_api.py)
+# шлет POST с JSON обновления; приемник кладет его в application.update_queue,
+# дальше работают те же обработчики, что и при polling.
+#
+# Приемник, доступный не только с этой машины (WEBHOOK_HOST не loopback),
+# без WEBHOOK_SECRET не запускается: иначе любой может прислать "обновление"
+# от имени любого пользователя.
+#
+# WEBHOOK_REUSE_PORT=1 (SO_REUSEPORT) позволяет нескольким процессам бота
+# слушать один порт. Порядок апдейтов одного пользователя (update_processor.py)
+# соблюдается только внутри процесса: ядро раздает соединения процессам без
+# учета пользователя, и два апдейта одного пользователя в разных процессах
+# могут обработаться в любом порядке. Поэтому по умолчанию выключено.
+
+WEBHOOK_HOST = os.environ.get('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.environ.get('WEBHOOK_PORT', 8443))
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', '/telegram/webhook')
+# Публичный адрес для setWebhook (пусто - webhook регистрируется вручную)
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL', '')
+# Telegram присылает его в X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET', '')
+WEBHOOK_REUSE_PORT = os.environ.get('WEBHOOK_REUSE_PORT', '0') == '1'
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def is_loopback(host):
+    """Адрес доступен только с этой машины"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def check_webhook_config(host=WEBHOOK_HOST, secret=WEBHOOK_SECRET):
+    """Отказ запуска: приемник слушает не только loopback, а секрет не задан"""
+    if not secret and not is_loopback(host):
+        raise RuntimeError(
+            f"WEBHOOK_SECRET is required when WEBHOOK_HOST ({host}) is not a loopback address"
+        )
+
+
+class WebhookReceiver:
+    """aiohttp-приемник: проверка секрета, разбор Update, постановка в очередь"""
+
+    def __init__(self, application, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET):
+        self.application = application
+        self.path = path
+        self.secret = secret
+        self.received = 0
+        self.rejected = 0
+
+    async def handle(self, request):
+        if self.secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), self.secret):
+            self.rejected += 1
+            return web.Response(status=403)
+
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.application.bot)
+        except Exception as e:
+            self.rejected += 1
+            logger.warning(f"⚠️ Некорректное обновление webhook: {e}")
+            return web.Response(status=400)
+
+        # Отвечаем сразу: обработка идет в Application, Telegram не ждет обработчиков
+        self.received += 1
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+
+async def serve_webhook(application, host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+                        secret=WEBHOOK_SECRET, webhook_url=WEBHOOK_URL, stop_event=None):
+    """Жизненный цикл Application как в run_polling, но обновления приходят в HTTP-приемник"""
+    check_webhook_config(host, secret)
+    stop_event = stop_event or asyncio.Event()
+    receiver = WebhookReceiver(application, path, secret)
+
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url,
+                secret_token=secret or None,
+                allowed_updates=Update.ALL_TYPES
+            )
+            logger.info(f"🌐 Webhook зарегистрирован: {webhook_url}")
+
+        await application.start()
+        runner = web.AppRunner(receiver.make_app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port, reuse_port=WEBHOOK_REUSE_PORT)
+        await site.start()
+        logger.info(f"🌐 Прием обновлений на http://{host}:{port}{path}")
+
+        try:
+            await stop_event.wait()
+        finally:
+            await runner.cleanup()
+            await application.stop()
+            logger.info(f"🌐 Webhook остановлен: принято {receiver.received}, отклонено {receiver.rejected}")
+
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+
+
+def run_webhook(application, **kwargs):
+    """Блокирующий запуск (аналог application.run_polling) с остановкой по SIGINT/SIGTERM"""
+    async def main():
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+        await serve_webhook(application, stop_event=stop_event, **kwargs)
+
+    asyncio.run(main())
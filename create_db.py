@@ -1,14 +1,15 @@
 #!/usr/bin/env python3
 import sqlite3
-import hashlib
-import time
 from datetime import datetime, timedelta
 
+from db import DATABASE_PATH, init_schema
+from license_keys import generate_key
+
 # ============================================================================
 # 🔧 ИСПРАВЛЕНО: ЕДИНАЯ СХЕМА БД ДЛЯ БОТА И API
 # ============================================================================
 
-DATABASE_PATH = 'license_system.db'
+# Путь к БД общий с API и ботом (см. db.DATABASE_PATH)
 
 def create_database():
     """Создание единой базы данных для бота и API"""
@@ -19,61 +20,9 @@ def create_database():
         cursor = conn.cursor()
         
         # ============================================================================
-        # 📋 ТАБЛИЦА ЛИЦЕНЗИЙ (ОСНОВНАЯ)
-        # ============================================================================
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS licenses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                license_key TEXT UNIQUE NOT NULL,
-                account_number TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                expires_at DATETIME NOT NULL,
-                is_active BOOLEAN DEFAULT 1,
-                plan_type TEXT NOT NULL,
-                telegram_user_id TEXT,
-                payment_verified BOOLEAN DEFAULT 0
-            )
-        ''')
-        
-        # ============================================================================
-        # 👥 ТАБЛИЦА ПОЛЬЗОВАТЕЛЕЙ
-        # ============================================================================
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_user_id TEXT UNIQUE NOT NULL,
-                username TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                total_licenses INTEGER DEFAULT 0
-            )
-        ''')
-        
-        # ============================================================================
-        # 💰 ТАБЛИЦА ПЛАТЕЖЕЙ
+        # 📋 ТАБЛИЦЫ И ИНДЕКСЫ (ОБЩАЯ СХЕМА С API И БОТОМ)
         # ============================================================================
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS payments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_user_id TEXT NOT NULL,
-                license_key TEXT NOT NULL,
-                amount REAL NOT NULL,
-                plan_type TEXT NOT NULL,
-                payment_method TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                verified BOOLEAN DEFAULT 0
-            )
-        ''')
-        
-        # ============================================================================
-        # 📊 СОЗДАНИЕ ИНДЕКСОВ ДЛЯ БЫСТРОГО ПОИСКА
-        # ============================================================================
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_license_key ON licenses(license_key)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_account_number ON licenses(account_number)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_telegram_user_id ON licenses(telegram_user_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_expires_at ON licenses(expires_at)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_payment_verified ON licenses(payment_verified)')
-        
-        conn.commit()
+        init_schema(conn)
         print("✅ База данных создана успешно!")
         
         # ============================================================================
@@ -96,21 +45,8 @@ def create_database():
     return True
 
 def generate_test_license():
-    """Генерация тестового лицензионного ключа"""
-    timestamp = str(int(time.time()))[-6:]
-    random_part = hashlib.md5(b"test_license_key").hexdigest()[:12].upper()
-    
-    # Формат: RFX-XXXX-XXXX-XXXX-XXX-XX
-    key_parts = [
-        "RFX",
-        random_part[:4],
-        random_part[4:8], 
-        random_part[8:12],
-        timestamp[:3],
-        timestamp[3:5]
-    ]
-    
-    return "-".join(key_parts)
+    """Генерация тестового лицензионного ключа (формат RFX-XXXX-XXXX-XXXX-XXX-XX)"""
+    return generate_key()
 
 def add_test_data():
     """Добавление тестовых данных"""
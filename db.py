@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+import os
+import sqlite3
+import logging
+import weakref
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# 🗄️ ОБЩИЙ ДОСТУП К БАЗЕ ДАННЫХ (API + БОТ)
+# ============================================================================
+
+DATABASE_PATH = os.environ.get('DATABASE_PATH', 'license_system.db')
+
+# Настройки соединений (PRAGMA выставляются один раз при открытии)
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 16384))
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 64 * 1024 * 1024))
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 256))
+# Сколько простаивающих соединений пул держит открытыми
+DB_POOL_MAX_IDLE = int(os.environ.get('DB_POOL_MAX_IDLE', 8))
+
+
+def connect(path=DATABASE_PATH, isolation_level='', check_same_thread=True):
+    """Новое соединение с однократной настройкой PRAGMA"""
+    conn = sqlite3.connect(
+        path,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        cached_statements=DB_STATEMENT_CACHE_SIZE,
+        isolation_level=isolation_level,
+        check_same_thread=check_same_thread
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+
+class _Lease:
+    """Соединение, выданное потоку; когда поток завершается, оно возвращается в пул"""
+    __slots__ = ('conn', 'pid', 'finalizer', '__weakref__')
+
+    def __init__(self, conn, pid):
+        self.conn = conn
+        self.pid = pid
+        self.finalizer = None
+
+
+class ConnectionPool:
+    """
+    Пул соединений SQLite. Поток берет теплое соединение при первом обращении
+    и держит его до своего завершения; затем соединение (после rollback
+    незавершенной транзакции) возвращается в очередь простаивающих, не больше
+    max_idle, лишние закрываются. Потоки werkzeug на запрос не копят соединения:
+    следующий поток получит то же соединение из очереди.
+    """
+
+    def __init__(self, path, max_idle=DB_POOL_MAX_IDLE):
+        self.path = path
+        self.max_idle = max_idle
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Последнее возвращенное выдается первым - оно теплее
+        self._idle = []
+        # Слабые ссылки: выдача не продлевает жизнь соединению завершившегося потока
+        self._leases = weakref.WeakSet()
+        self._pid = os.getpid()
+        # close_all: соединения, выданные до него, при возврате закрываются
+        self._epoch = 0
+        self.created = 0
+        self.reused = 0
+        self.closed = 0
+
+    def get_connection(self):
+        """Соединение текущего потока (выдается при первом обращении)"""
+        lease = getattr(self._local, 'lease', None)
+        # После fork (gunicorn) соединение родителя использовать нельзя
+        if lease is None or lease.pid != os.getpid():
+            lease = self._checkout()
+            self._local.lease = lease
+        return lease.conn
+
+    def _checkout(self):
+        """Соединение из очереди простаивающих или новое"""
+        pid = os.getpid()
+        with self._lock:
+            if self._pid != pid:
+                # Соединения родителя после fork не выдаем и не закрываем
+                self._pid = pid
+                self._idle = []
+                self._leases = weakref.WeakSet()
+            conn = self._idle.pop() if self._idle else None
+            if conn is not None:
+                self.reused += 1
+            epoch = self._epoch
+
+        if conn is None:
+            # Соединение переходит между потоками, но в каждый момент у него один владелец
+            conn = connect(self.path, check_same_thread=False)
+            with self._lock:
+                self.created += 1
+            logger.debug(f"🔌 Новое соединение с БД: {self.path} (pid {pid})")
+
+        lease = _Lease(conn, pid)
+        lease.finalizer = weakref.finalize(lease, self._release, conn, pid, epoch)
+        lease.finalizer.atexit = False
+        with self._lock:
+            self._leases.add(lease)
+        return lease
+
+    def _release(self, conn, pid, epoch):
+        """Поток завершился: соединение - в очередь простаивающих или закрыть"""
+        if pid != os.getpid():
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Соединение с БД не вернулось в пул: {e}")
+            self._close(conn)
+            return
+
+        with self._lock:
+            keep = epoch == self._epoch and pid == self._pid and len(self._idle) < self.max_idle
+            if keep:
+                self._idle.append(conn)
+        if not keep:
+            self._close(conn)
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self.closed += 1
+
+    def close_current(self):
+        """Закрыть соединение текущего потока"""
+        lease = getattr(self._local, 'lease', None)
+        if lease is None:
+            return
+        self._local.lease = None
+        lease.finalizer.detach()
+        if lease.pid == os.getpid():
+            self._close(lease.conn)
+
+    def close_all(self):
+        """Закрыть простаивающие соединения и соединение текущего потока (при остановке процесса)"""
+        self.close_current()
+        with self._lock:
+            # Соединения живых потоков закроются, когда потоки завершатся
+            self._epoch += 1
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self):
+        """Статистика пула для мониторинга"""
+        with self._lock:
+            in_use = len(self._leases)
+            return {
+                "path": self.path,
+                "open_connections": in_use + len(self._idle),
+                "in_use_connections": in_use,
+                "idle_connections": len(self._idle),
+                "max_idle": self.max_idle,
+                "created_connections": self.created,
+                "reused_connections": self.reused,
+                "closed_connections": self.closed
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path=DATABASE_PATH):
+    """Пул соединений для файла базы данных"""
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(path, ConnectionPool(path))
+    return pool
+
+
+def get_connection(path=DATABASE_PATH):
+    """Теплое соединение текущего потока (закрывать не нужно)"""
+    return get_pool(path).get_connection()
+
+
+# ============================================================================
+# 📋 ЕДИНАЯ СХЕМА БД
+# ============================================================================
+
+def init_schema(conn):
+    """Создание таблиц и индексов (идемпотентно)"""
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS licenses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            license_key TEXT UNIQUE NOT NULL,
+            account_number TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            expires_at DATETIME NOT NULL,
+            is_active BOOLEAN DEFAULT 1,
+            plan_type TEXT NOT NULL,
+            telegram_user_id TEXT,
+            payment_verified BOOLEAN DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_user_id TEXT UNIQUE NOT NULL,
+            username TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            total_licenses INTEGER DEFAULT 0
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_user_id TEXT NOT NULL,
+            license_key TEXT NOT NULL,
+            amount REAL NOT NULL,
+            plan_type TEXT NOT NULL,
+            payment_method TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            verified BOOLEAN DEFAULT 0
+        )
+    ''')
+
+    # Чеки об оплате: один и тот же файл (content_hash) принимается один раз.
+    # status: pending (ждет админа) / approved / rejected
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS payment_proofs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            content_hash TEXT UNIQUE NOT NULL,
+            telegram_user_id TEXT NOT NULL,
+            license_key TEXT NOT NULL,
+            file_id TEXT,
+            file_size INTEGER,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            status TEXT NOT NULL DEFAULT 'pending',
+            reviewed_at DATETIME
+        )
+    ''')
+    # Старая БД: чеки подтверждали оплату сразу - чеки оплаченных лицензий уже проверены
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(payment_proofs)')}
+    if 'status' not in columns:
+        cursor.execute("ALTER TABLE payment_proofs ADD COLUMN status TEXT NOT NULL DEFAULT 'pending'")
+        cursor.execute('''
+            UPDATE payment_proofs SET status = 'approved'
+            WHERE license_key IN (SELECT license_key FROM licenses WHERE payment_verified = 1)
+        ''')
+    if 'reviewed_at' not in columns:
+        cursor.execute('ALTER TABLE payment_proofs ADD COLUMN reviewed_at DATETIME')
+
+    # Уведомления об истечении для рассылки ботом (expiry_scheduler)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS expiry_notices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            license_key TEXT NOT NULL,
+            telegram_user_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            expires_at DATETIME NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            sent_at DATETIME,
+            UNIQUE (license_key, kind, expires_at)
+        )
+    ''')
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_license_key ON licenses(license_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_account_number ON licenses(account_number)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_telegram_user_id ON licenses(telegram_user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_expires_at ON licenses(expires_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_payment_verified ON licenses(payment_verified)')
+    # Поиск триала / неоплаченной лицензии пользователя (бот)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_plan_payment ON licenses(telegram_user_id, plan_type, payment_verified)')
+    # Постраничный список лицензий пользователя (keyset по created_at, id)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_created ON licenses(telegram_user_id, created_at, id)')
+    # Список лицензий админа (license_listing): фильтр + ключ сортировки
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_created ON licenses(created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_plan_created ON licenses(plan_type, created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_verified_created ON licenses(payment_verified, created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_plan_expires ON licenses(plan_type, expires_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_payment_proofs_license ON payment_proofs(license_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_payments_license ON payments(license_key)')
+    # Ближайшие сроки активных лицензий (expiry_scheduler): истекшие и деактивированные не мешают
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_active_expires ON licenses(expires_at) WHERE is_active = 1')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_expiry_notices_unsent ON expiry_notices(id) WHERE sent_at IS NULL')
+    # Очередь проверки оплат админом (payment_review): только ожидающие чеки
+    cursor.execute('DROP INDEX IF EXISTS idx_pending_review')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_pending_proofs ON payment_proofs(created_at, id)
+        WHERE status = 'pending'
+    ''')
+
+    # Один триал на пользователя - гарантия на уровне БД
+    try:
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_one_trial_per_user
+            ON licenses(telegram_user_id) WHERE plan_type = 'trial'
+        ''')
+    except sqlite3.IntegrityError:
+        # В старой БД уже есть повторные триалы: работаем без уникального индекса,
+        # выдачу сериализует проверка внутри транзакции писателя
+        logger.warning("⚠️ Повторные триалы в БД - уникальный индекс idx_one_trial_per_user не создан")
+
+    init_stats_schema(cursor)
+    init_changes_schema(cursor)
+
+    conn.commit()
+
+
+# ============================================================================
+# 📊 МАТЕРИАЛИЗОВАННЫЕ СЧЕТЧИКИ ДЛЯ /stats
+# ============================================================================
+# Счетчики поддерживаются триггерами, поэтому корректны при записи из любого
+# процесса (API, бот, create_db). Кроме expired_licenses: он зависит от
+# времени - его увеличивает планировщик истечения (expiry_scheduler) на число
+# деактивированных лицензий, остальное поправляет сверка
+# (stats_counters.reconcile_stats).
+
+STATS_COUNTERS = ('total_licenses', 'active_licenses', 'pending_payments', 'expired_licenses', 'total_users')
+
+# Подсчет всех счетчиков по licenses: (name, value); параметр - текущее время для expired_licenses
+STATS_COUNT_SQL = '''
+    SELECT 'total_licenses', COUNT(*) FROM licenses
+    UNION ALL
+    SELECT 'active_licenses', COUNT(*) FROM licenses WHERE is_active = 1 AND payment_verified = 1
+    UNION ALL
+    SELECT 'pending_payments', COUNT(*) FROM licenses WHERE payment_verified = 0
+    UNION ALL
+    SELECT 'expired_licenses', COUNT(*) FROM licenses WHERE expires_at < ?
+    UNION ALL
+    SELECT 'total_users', COUNT(DISTINCT telegram_user_id) FROM licenses
+'''
+
+# Заполнение счетчиков полным пересчетом (первый запуск на существующей БД)
+STATS_RECONCILE_SQL = 'INSERT OR REPLACE INTO license_stats (name, value)' + STATS_COUNT_SQL
+
+
+def init_stats_schema(cursor):
+    """Таблица счетчиков и триггеры на licenses"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS license_stats (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_license_stats_insert
+        AFTER INSERT ON licenses
+        BEGIN
+            UPDATE license_stats SET value = value + CASE name
+                WHEN 'total_licenses' THEN 1
+                WHEN 'active_licenses' THEN IFNULL(NEW.is_active = 1 AND NEW.payment_verified = 1, 0)
+                WHEN 'pending_payments' THEN IFNULL(NEW.payment_verified = 0, 0)
+                WHEN 'total_users' THEN (
+                    NEW.telegram_user_id IS NOT NULL AND NOT EXISTS (
+                        SELECT 1 FROM licenses WHERE telegram_user_id = NEW.telegram_user_id AND id != NEW.id
+                    )
+                )
+                ELSE 0 END
+            WHERE name IN ('total_licenses', 'active_licenses', 'pending_payments', 'total_users');
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_license_stats_delete
+        AFTER DELETE ON licenses
+        BEGIN
+            UPDATE license_stats SET value = value - CASE name
+                WHEN 'total_licenses' THEN 1
+                WHEN 'active_licenses' THEN IFNULL(OLD.is_active = 1 AND OLD.payment_verified = 1, 0)
+                WHEN 'pending_payments' THEN IFNULL(OLD.payment_verified = 0, 0)
+                WHEN 'total_users' THEN (
+                    OLD.telegram_user_id IS NOT NULL AND NOT EXISTS (
+                        SELECT 1 FROM licenses WHERE telegram_user_id = OLD.telegram_user_id
+                    )
+                )
+                ELSE 0 END
+            WHERE name IN ('total_licenses', 'active_licenses', 'pending_payments', 'total_users');
+        END
+    ''')
+
+    # Только колонки, от которых зависят счетчики: привязка счета и т.п. не трогают license_stats
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_license_stats_update
+        AFTER UPDATE OF is_active, payment_verified, telegram_user_id ON licenses
+        BEGIN
+            UPDATE license_stats SET value = value + CASE name
+                WHEN 'active_licenses' THEN
+                    IFNULL(NEW.is_active = 1 AND NEW.payment_verified = 1, 0)
+                    - IFNULL(OLD.is_active = 1 AND OLD.payment_verified = 1, 0)
+                WHEN 'pending_payments' THEN
+                    IFNULL(NEW.payment_verified = 0, 0) - IFNULL(OLD.payment_verified = 0, 0)
+                WHEN 'total_users' THEN CASE WHEN OLD.telegram_user_id IS NEW.telegram_user_id THEN 0 ELSE
+                    (NEW.telegram_user_id IS NOT NULL AND NOT EXISTS (
+                        SELECT 1 FROM licenses WHERE telegram_user_id = NEW.telegram_user_id AND id != NEW.id
+                    ))
+                    - (OLD.telegram_user_id IS NOT NULL AND NOT EXISTS (
+                        SELECT 1 FROM licenses WHERE telegram_user_id = OLD.telegram_user_id
+                    ))
+                END
+                ELSE 0 END
+            WHERE name IN ('active_licenses', 'pending_payments', 'total_users');
+        END
+    ''')
+
+    # Первый запуск на существующей БД: заполняем счетчики полным пересчетом
+    cursor.execute('SELECT COUNT(*) FROM license_stats')
+    if cursor.fetchone()[0] < len(STATS_COUNTERS):
+        cursor.execute(STATS_RECONCILE_SQL, (datetime.now(),))
+
+
+# ============================================================================
+# 📜 ВЕРСИИ СТРОК И ЖУРНАЛ ИЗМЕНЕНИЙ LICENSES
+# ============================================================================
+# Каждая вставка, изменение и удаление строки licenses (из любого процесса)
+# дописывает в license_changes снимок строки. id записи журнала - общая
+# монотонная версия: licenses.version = id последнего изменения строки,
+# updated_at - его время. Читатели журнала - license_changes.py.
+
+# Колонки, изменение которых попадает в журнал (version/updated_at пишет сам триггер)
+CHANGE_TRACKED_COLUMNS = (
+    'license_key', 'account_number', 'expires_at', 'is_active',
+    'payment_verified', 'plan_type', 'telegram_user_id'
+)
+
+
+def _change_trigger_sql(name, event, op, row, condition=''):
+    """Триггер: снимок строки row (NEW/OLD) в журнал + версия строки"""
+    columns = ', '.join(CHANGE_TRACKED_COLUMNS)
+    values = ', '.join(f'{row}.{column}' for column in CHANGE_TRACKED_COLUMNS)
+    stamp = '' if op == 'delete' else '''
+            UPDATE licenses SET version = last_insert_rowid(), updated_at = CURRENT_TIMESTAMP
+            WHERE id = NEW.id;'''
+    return f'''
+        CREATE TRIGGER IF NOT EXISTS {name}
+        {event} ON licenses
+        {condition}
+        BEGIN
+            INSERT INTO license_changes (license_id, op, {columns})
+            VALUES ({row}.id, '{op}', {values});{stamp}
+        END
+    '''
+
+
+def init_changes_schema(cursor):
+    """Колонки version/updated_at, журнал license_changes и триггеры на licenses"""
+    # Старая БД: колонок версии еще нет (строки до журнала получают version = 0)
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(licenses)')}
+    if 'version' not in columns:
+        cursor.execute('ALTER TABLE licenses ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+    if 'updated_at' not in columns:
+        cursor.execute('ALTER TABLE licenses ADD COLUMN updated_at DATETIME')
+
+    # Только дописывается; старые записи удаляет license_changes.prune_changes
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS license_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            license_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            license_key TEXT NOT NULL,
+            account_number TEXT,
+            expires_at DATETIME,
+            is_active BOOLEAN,
+            payment_verified BOOLEAN,
+            plan_type TEXT,
+            telegram_user_id TEXT,
+            changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute(_change_trigger_sql('trg_license_changes_insert', 'AFTER INSERT', 'insert', 'NEW'))
+    # UPDATE OF без version/updated_at: обновление версии внутри триггера его не вызывает.
+    # Запись без фактических изменений (повторное подтверждение оплаты) в журнал не идет
+    cursor.execute(_change_trigger_sql(
+        'trg_license_changes_update',
+        f"AFTER UPDATE OF {', '.join(CHANGE_TRACKED_COLUMNS)}",
+        'update', 'NEW',
+        'WHEN ' + ' OR '.join(f'OLD.{column} IS NOT NEW.{column}' for column in CHANGE_TRACKED_COLUMNS)
+    ))
+    cursor.execute(_change_trigger_sql('trg_license_changes_delete', 'AFTER DELETE', 'delete', 'OLD'))
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+import os
+import queue
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+import db
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# ✍️ ЕДИНСТВЕННЫЙ ПИСАТЕЛЬ: ОЧЕРЕДЬ ЗАПИСЕЙ + ГРУППОВЫЕ ТРАНЗАКЦИИ
+# ============================================================================
+
+# Сколько намерений записи максимум коммитится одной транзакцией
+DB_WRITER_MAX_BATCH = int(os.environ.get('DB_WRITER_MAX_BATCH', 64))
+
+_STOP = object()
+
+
+class WriteQueue:
+    """Один поток-писатель на процесс: читатели работают по WAL-снимкам и не ждут"""
+
+    def __init__(self, path=db.DATABASE_PATH, max_batch=DB_WRITER_MAX_BATCH):
+        self.path = path
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._pid = None
+
+        # Метрики
+        self.commits = 0
+        self.intents = 0
+        self.failed_intents = 0
+        self.failed_commits = 0
+        self.max_batch_seen = 0
+        self.last_commit_ms = 0.0
+        self.max_commit_ms = 0.0
+        self._total_commit_ms = 0.0
+
+    def submit(self, fn, *args, **kwargs):
+        """Поставить намерение записи в очередь; fn(conn, *args) не должна делать commit"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def execute(self, fn, *args, timeout=None, **kwargs):
+        """Записать и дождаться коммита; возвращает результат fn"""
+        return self.submit(fn, *args, **kwargs).result(timeout=timeout)
+
+    def stop(self, timeout=5):
+        """Дописать очередь и остановить поток"""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def stats(self):
+        """Глубина очереди и задержка коммитов"""
+        return {
+            "queue_depth": self._queue.qsize(),
+            "commits": self.commits,
+            "intents": self.intents,
+            "failed_intents": self.failed_intents,
+            "failed_commits": self.failed_commits,
+            "max_batch": self.max_batch_seen,
+            "last_commit_ms": round(self.last_commit_ms, 3),
+            "avg_commit_ms": round(self._total_commit_ms / self.commits, 3) if self.commits else 0.0,
+            "max_commit_ms": round(self.max_commit_ms, 3)
+        }
+
+    def _ensure_started(self):
+        """Ленивый старт потока (и перезапуск после fork воркера gunicorn)"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Цикл писателя: берем все, что накопилось, и коммитим одной транзакцией"""
+        # Собственное соединение в autocommit-режиме: транзакциями управляем сами
+        conn = db.connect(self.path, isolation_level=None)
+        try:
+            while True:
+                batch = [self._queue.get()]
+                while len(batch) < self.max_batch:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                stop = any(item is _STOP for item in batch)
+                batch = [item for item in batch if item is not _STOP]
+                if batch:
+                    self._commit_batch(conn, batch)
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def _commit_batch(self, conn, batch):
+        """Групповая транзакция; ошибка одного намерения откатывает только его"""
+        started = time.perf_counter()
+        results = []
+
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for fn, args, kwargs, future in batch:
+                conn.execute('SAVEPOINT write_intent')
+                try:
+                    results.append((future, fn(conn, *args, **kwargs), None))
+                    conn.execute('RELEASE write_intent')
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write_intent')
+                    conn.execute('RELEASE write_intent')
+                    results.append((future, None, e))
+                    self.failed_intents += 1
+            conn.execute('COMMIT')
+        except Exception as e:
+            logger.error(f"❌ Ошибка групповой транзакции ({len(batch)} записей): {e}")
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            self.failed_commits += 1
+            for _, _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.commits += 1
+        self.intents += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        self.last_commit_ms = elapsed_ms
+        self.max_commit_ms = max(self.max_commit_ms, elapsed_ms)
+        self._total_commit_ms += elapsed_ms
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(path=db.DATABASE_PATH):
+    """Писатель процесса для файла базы данных"""
+    writer = _writers.get(path)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.setdefault(path, WriteQueue(path))
+    return writer
+
+
+def write(fn, *args, **kwargs):
+    """Синхронная запись через очередь писателя (ждет коммита)"""
+    return get_writer().execute(fn, *args, **kwargs)
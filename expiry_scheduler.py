@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+import os
+import time
+import heapq
+import logging
+import threading
+from datetime import datetime, timezone
+
+import db
+from db_writer import get_writer
+from license_cache import expires_timestamp, license_cache
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# ⏰ ФОНОВОЕ ИСТЕЧЕНИЕ ЛИЦЕНЗИЙ: КУЧА БЛИЖАЙШИХ СРОКОВ + ПАКЕТНАЯ ДЕАКТИВАЦИЯ
+# ============================================================================
+#
+# Поток держит min-кучу событий "истечение" и "напоминание за N дней" для
+# активных лицензий, срок которых наступает в ближайшем окне. Окно читается
+# по частичному индексу idx_active_expires и перечитывается раз в
+# EXPIRY_REFRESH_INTERVAL (лицензии создают и другие процессы).
+#
+# Поток спит до ближайшего события. Истечение - одна транзакция писателя:
+# все наступившие сроки получают is_active = 0, в expiry_notices пишется
+# уведомление, счетчик expired_licenses в license_stats растет на их число. Бот рассылает неотправленные уведомления (telegram_bot.py).
+# Пока поток работает в процессе, проверка лицензии доверяет is_active и не
+# разбирает дату (license_service.evaluate_license).
+
+EXPIRY_REFRESH_INTERVAL = float(os.environ.get('EXPIRY_REFRESH_INTERVAL', 60))
+EXPIRY_SWEEP_BATCH = int(os.environ.get('EXPIRY_SWEEP_BATCH', 500))
+# За сколько дней до истечения напоминать (через запятую)
+EXPIRY_REMINDER_DAYS = tuple(sorted(
+    {int(days) for days in os.environ.get('EXPIRY_REMINDER_DAYS', '3,1').split(',') if days.strip()},
+    reverse=True
+))
+# Напоминание не ставится, если до истечения от выдачи меньше N дней + допуск (сек):
+# триал на 3 дня не получит "осталось 3 дня" сразу после выдачи
+EXPIRY_REMINDER_TOLERANCE = float(os.environ.get('EXPIRY_REMINDER_TOLERANCE', 3600))
+
+EXPIRED = 'expired'
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def reminder_kind(days):
+    return f"remind_{days}"
+
+
+def created_timestamp(created_at):
+    """created_at пишет CURRENT_TIMESTAMP SQLite (UTC без зоны) -> unix-время"""
+    if not created_at:
+        return None
+    try:
+        created = created_at if isinstance(created_at, datetime) else datetime.fromisoformat(str(created_at))
+    except ValueError:
+        return None
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    return created.timestamp()
+
+
+def _expire_due(conn, now, limit):
+    """Намерение записи: деактивация наступивших сроков + уведомления; возвращает ключи"""
+    rows = conn.execute('''
+        SELECT id, license_key, telegram_user_id, expires_at
+        FROM licenses
+        WHERE is_active = 1 AND expires_at <= ?
+        ORDER BY expires_at
+        LIMIT ?
+    ''', (now, limit)).fetchall()
+
+    conn.executemany('''
+        UPDATE licenses SET is_active = 0 WHERE id = ?
+    ''', [(row['id'],) for row in rows])
+    if rows:
+        # Счетчик истекших зависит от времени, а не от записи - триггеры его не ведут
+        conn.execute('''
+            UPDATE license_stats SET value = value + ? WHERE name = 'expired_licenses'
+        ''', (len(rows),))
+    conn.executemany('''
+        INSERT OR IGNORE INTO expiry_notices (license_key, telegram_user_id, kind, expires_at)
+        VALUES (?, ?, ?, ?)
+    ''', [(row['license_key'], row['telegram_user_id'], EXPIRED, row['expires_at'])
+          for row in rows if row['telegram_user_id']])
+    return [row['license_key'] for row in rows]
+
+
+def _record_reminders(conn, reminders):
+    """Намерение записи: напоминания для лицензий, которые все еще активны с тем же сроком"""
+    recorded = 0
+    for license_key, kind, expires_at in reminders:
+        recorded += conn.execute('''
+            INSERT OR IGNORE INTO expiry_notices (license_key, telegram_user_id, kind, expires_at)
+            SELECT license_key, telegram_user_id, ?, expires_at FROM licenses
+            WHERE license_key = ? AND is_active = 1 AND expires_at = ? AND telegram_user_id IS NOT NULL
+        ''', (kind, license_key, expires_at)).rowcount
+    return recorded
+
+
+class ExpiryScheduler:
+    """Куча событий истечения для одной БД; один поток на процесс"""
+
+    def __init__(self, path=db.DATABASE_PATH, reminder_days=EXPIRY_REMINDER_DAYS,
+                 refresh_interval=EXPIRY_REFRESH_INTERVAL, batch=EXPIRY_SWEEP_BATCH,
+                 tolerance=EXPIRY_REMINDER_TOLERANCE):
+        self.path = path
+        self.reminder_days = tuple(sorted(reminder_days, reverse=True))
+        self.refresh_interval = refresh_interval
+        self.batch = batch
+        self.tolerance = tolerance
+        self._heap = []
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+
+        # Метрики
+        self.loaded_at = None
+        self.deactivated = 0
+        self.reminders = 0
+        self.sweeps = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+
+    def load(self, now=None):
+        """Перечитать окно ближайших сроков и пересобрать кучу"""
+        now = time.time() if now is None else now
+        horizon = now + self.refresh_interval * 2 + max(self.reminder_days, default=0) * 86400
+        rows = db.get_connection(self.path).execute('''
+            SELECT l.license_key, l.expires_at, l.created_at,
+                   (SELECT group_concat(n.kind) FROM expiry_notices n
+                    WHERE n.license_key = l.license_key AND n.expires_at = l.expires_at) AS sent
+            FROM licenses l
+            WHERE l.is_active = 1 AND l.expires_at < ?
+            ORDER BY l.expires_at
+        ''', (datetime.fromtimestamp(horizon),)).fetchall()
+
+        heap = []
+        for row in rows:
+            expires_ts = expires_timestamp(row['expires_at'])
+            if expires_ts is None:
+                continue
+            heap.append((expires_ts, EXPIRED, row['license_key'], row['expires_at']))
+            sent = set(row['sent'].split(',')) if row['sent'] else set()
+            created_ts = created_timestamp(row['created_at'])
+            plan_length = expires_ts - created_ts if created_ts is not None else None
+            # Из уже наступивших напоминаний нужно только самое близкое к сроку;
+            # напоминание не короче срока выдачи не нужно (триал на 3 дня не получит "осталось 3 дня")
+            for days in self.reminder_days:
+                due = expires_ts - days * 86400
+                kind = reminder_kind(days)
+                if kind in sent or due >= expires_ts or expires_ts <= now:
+                    continue
+                if plan_length is not None and days * 86400 >= plan_length - self.tolerance:
+                    continue
+                if due <= now and any(expires_ts - other * 86400 <= now for other in self.reminder_days if other < days):
+                    continue
+                heap.append((due, kind, row['license_key'], row['expires_at']))
+        heapq.heapify(heap)
+        self._heap = heap
+        self.loaded_at = now
+        return len(heap)
+
+    def next_due(self):
+        return self._heap[0][0] if self._heap else None
+
+    def run_due(self, now=None):
+        """Обработать наступившие события; возвращает (деактивировано, напоминаний)"""
+        now = time.time() if now is None else now
+        expire = False
+        reminders = []
+        while self._heap and self._heap[0][0] <= now:
+            _, kind, license_key, expires_at = heapq.heappop(self._heap)
+            if kind == EXPIRED:
+                expire = True
+            else:
+                reminders.append((license_key, kind, expires_at))
+
+        writer = get_writer(self.path)
+        recorded = writer.execute(_record_reminders, reminders) if reminders else 0
+
+        deactivated = []
+        if expire:
+            # Сроки берем из БД, а не из кучи: заодно догоняем лицензии, созданные после загрузки
+            cutoff = datetime.fromtimestamp(now)
+            while True:
+                keys = writer.execute(_expire_due, cutoff, self.batch)
+                deactivated.extend(keys)
+                if len(keys) < self.batch:
+                    break
+            for license_key in deactivated:
+                license_cache.invalidate(license_key)
+            self.sweeps += 1
+
+        self.deactivated += len(deactivated)
+        self.reminders += recorded
+        if deactivated or recorded:
+            logger.info(f"⏰ Истекло лицензий: {len(deactivated)}, напоминаний: {recorded}")
+        return len(deactivated), recorded
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                now = time.time()
+                if self.loaded_at is None or now - self.loaded_at >= self.refresh_interval:
+                    self.load(now)
+                self.run_due(now)
+            except Exception as e:
+                logger.error(f"❌ Ошибка планировщика истечения: {e}")
+            next_due = self.next_due()
+            wait = self.loaded_at + self.refresh_interval - time.time() if self.loaded_at else self.refresh_interval
+            if next_due is not None:
+                wait = min(wait, next_due - time.time())
+            self._stop.wait(max(0.0, wait))
+
+    def start(self):
+        """Фоновый поток (повторный вызов в том же процессе ничего не делает)"""
+        if self.running:
+            return
+        self._stop.clear()
+        self.loaded_at = None
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='expiry-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "scheduled_events": len(self._heap),
+            "next_due": datetime.fromtimestamp(self.next_due()).isoformat() if self._heap else None,
+            "loaded_at": datetime.fromtimestamp(self.loaded_at).isoformat() if self.loaded_at else None,
+            "sweeps": self.sweeps,
+            "deactivated": self.deactivated,
+            "reminders": self.reminders
+        }
+
+
+def get_scheduler(path=db.DATABASE_PATH):
+    """Планировщик процесса для файла базы данных"""
+    scheduler = _schedulers.get(path)
+    if scheduler is None:
+        with _schedulers_lock:
+            scheduler = _schedulers.setdefault(path, ExpiryScheduler(path))
+    return scheduler
+
+
+def start_sweeper(path=db.DATABASE_PATH):
+    """Запустить фоновое истечение лицензий для БД"""
+    with _schedulers_lock:
+        scheduler = _schedulers.setdefault(path, ExpiryScheduler(path))
+        scheduler.start()
+    return scheduler
+
+
+def sweeper_running(path=db.DATABASE_PATH):
+    """Работает ли в этом процессе поток истечения (тогда is_active актуален)"""
+    scheduler = _schedulers.get(path)
+    return scheduler is not None and scheduler.running
+
+
+# ============================================================================
+# 📨 ОЧЕРЕДЬ УВЕДОМЛЕНИЙ ДЛЯ БОТА
+# ============================================================================
+
+def fetch_unsent_notices(limit=100, path=db.DATABASE_PATH):
+    """Неотправленные уведомления (старые первыми)"""
+    return db.get_connection(path).execute('''
+        SELECT n.id, n.license_key, n.telegram_user_id, n.kind, n.expires_at, l.plan_type
+        FROM expiry_notices n
+        LEFT JOIN licenses l ON l.license_key = n.license_key
+        WHERE n.sent_at IS NULL
+        ORDER BY n.id
+        LIMIT ?
+    ''', (limit,)).fetchall()
+
+
+def _mark_notices_sent(conn, notice_ids, sent_at):
+    conn.executemany('''
+        UPDATE expiry_notices SET sent_at = ? WHERE id = ?
+    ''', [(sent_at, notice_id) for notice_id in notice_ids])
+
+
+def mark_notices_sent(notice_ids, path=db.DATABASE_PATH):
+    """Отметить уведомления отправленными (одной транзакцией)"""
+    if notice_ids:
+        get_writer(path).execute(_mark_notices_sent, list(notice_ids), datetime.now())
+
+
+def reminder_days_left(kind):
+    """remind_3 -> 3"""
+    return int(kind.rsplit('_', 1)[1])
+
+
+def stats(path=db.DATABASE_PATH):
+    """Состояние планировщика для /metrics"""
+    scheduler = _schedulers.get(path)
+    return scheduler.stats() if scheduler is not None else {"running": False}
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+
+import db
+from db_writer import get_writer
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# 🩺 ПРОБЫ LIVENESS / READINESS
+# ============================================================================
+#
+# /livez не трогает БД: отвечает, пока жив процесс.
+# /readyz делает легкие проверки (SELECT 1, размер WAL, очередь писателя)
+# не чаще раза в READYZ_CACHE_TTL секунд на процесс; остальные пробы
+# получают закэшированный результат.
+
+READYZ_CACHE_TTL = float(os.environ.get('READYZ_CACHE_TTL', 2))
+# WAL больше этого - чекпоинт отстает (предупреждение, не отказ)
+READYZ_WAL_WARN_BYTES = int(os.environ.get('READYZ_WAL_WARN_BYTES', 64 * 1024 * 1024))
+# Очередь писателя глубже этого - процесс не успевает писать (отказ)
+READYZ_MAX_WRITE_QUEUE = int(os.environ.get('READYZ_MAX_WRITE_QUEUE', 1000))
+
+STARTED_AT = time.time()
+
+_cache = {}
+_cache_lock = threading.Lock()
+probes = 0
+
+
+def liveness():
+    """Процесс жив и обслуживает запросы (без обращения к БД)"""
+    return {
+        "status": "alive",
+        "pid": os.getpid(),
+        "uptime_s": round(time.time() - STARTED_AT, 1),
+        "timestamp": datetime.now().isoformat()
+    }, 200
+
+
+def _timed(check):
+    """Выполнить проверку и добавить ее задержку; исключение = fail"""
+    started = time.perf_counter()
+    try:
+        result = check()
+    except Exception as e:
+        result = {"status": "fail", "error": str(e)}
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+
+def _check_database(path):
+    db.get_connection(path).execute('SELECT 1').fetchone()
+    return {"status": "ok"}
+
+
+def _check_wal(path):
+    """Отставание чекпоинта по размеру файла -wal (без запросов к БД)"""
+    try:
+        wal_bytes = os.path.getsize(path + '-wal')
+    except OSError:
+        wal_bytes = 0
+    return {
+        "status": "warn" if wal_bytes > READYZ_WAL_WARN_BYTES else "ok",
+        "wal_bytes": wal_bytes
+    }
+
+
+def _check_writer(path):
+    writer = get_writer(path).stats()
+    return {
+        "status": "fail" if writer["queue_depth"] > READYZ_MAX_WRITE_QUEUE else "ok",
+        "queue_depth": writer["queue_depth"],
+        "last_commit_ms": writer["last_commit_ms"]
+    }
+
+
+def _check_pool(path):
+    return dict(db.get_pool(path).stats(), status="ok")
+
+
+def _probe(path, extra_checks):
+    checks = {
+        "database": _timed(lambda: _check_database(path)),
+        "wal": _timed(lambda: _check_wal(path)),
+        "db_writer": _timed(lambda: _check_writer(path)),
+        "db_pool": _timed(lambda: _check_pool(path))
+    }
+    for name, check in (extra_checks or {}).items():
+        checks[name] = _timed(check)
+
+    ready = all(check["status"] != "fail" for check in checks.values())
+    return {
+        "status": "ready" if ready else "not_ready",
+        "checks": checks,
+        "checked_at": datetime.now().isoformat()
+    }, 200 if ready else 503
+
+
+def readiness(path=db.DATABASE_PATH, extra_checks=None, cache_only=False):
+    """
+    Проба готовности (body, status); результат кэшируется на READYZ_CACHE_TTL.
+    cache_only=True - вернуть None вместо похода в БД (для event loop ASGI).
+    """
+    global probes
+    entry = _cache.get(path)
+    if entry is not None and time.monotonic() - entry[2] < READYZ_CACHE_TTL:
+        return dict(entry[0], cached=True), entry[1]
+    if cache_only:
+        return None
+
+    # Одна проба на процесс: параллельные запросы ждут ее результата
+    with _cache_lock:
+        entry = _cache.get(path)
+        if entry is not None and time.monotonic() - entry[2] < READYZ_CACHE_TTL:
+            return dict(entry[0], cached=True), entry[1]
+
+        body, status = _probe(path, extra_checks)
+        probes += 1
+        if status != 200:
+            logger.warning(f"🩺 Сервис не готов: {body['checks']}")
+        _cache[path] = (body, status, time.monotonic())
+        return dict(body, cached=False), status
+
+
+def stats():
+    """Счетчики проб для /metrics"""
+    return {
+        "readyz_cache_ttl": READYZ_CACHE_TTL,
+        "probes": probes,
+        "uptime_s": round(time.time() - STARTED_AT, 1)
+    }
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+import os
+import math
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+
+import db
+import license_keys
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# 🚧 ПРЕДВАРИТЕЛЬНЫЙ ОТСЕВ КЛЮЧЕЙ: ФОРМАТ + КОНТРОЛЬНАЯ СУММА + ФИЛЬТР БЛУМА
+# ============================================================================
+#
+# Перед походом в SQLite ключ проходит три проверки, все в памяти:
+#   1. формат RFX-XXXX-XXXX-XXXX-XXX-XX и контрольная сумма (license_keys);
+#      старые ключи без суммы узнаются по своему формату, а ключи из БД,
+#      не подходящие ни под один формат, хранятся отдельным множеством;
+#   2. фильтр Блума по всем выданным ключам: "точно нет" или "возможно есть".
+# Промах фильтра перед отказом догружает новые строки licenses по rowid
+# (id > последнего загруженного) - не чаще KEY_FILTER_REFRESH_INTERVAL:
+# так видны ключи, выданные ботом в другом процессе. Ключи, вставленные в
+# этом процессе, добавляются сразу (note_inserted).
+
+KEY_FILTER_ENABLED = os.environ.get('KEY_FILTER_ENABLED', '1') == '1'
+KEY_FILTER_FP_RATE = float(os.environ.get('KEY_FILTER_FP_RATE', 0.001))
+KEY_FILTER_MIN_CAPACITY = int(os.environ.get('KEY_FILTER_MIN_CAPACITY', 100000))
+KEY_FILTER_REFRESH_INTERVAL = float(os.environ.get('KEY_FILTER_REFRESH_INTERVAL', 1.0))
+
+_filters = {}
+_filters_lock = threading.Lock()
+
+
+def key_format_valid(license_key):
+    """Ключ нового формата с верной суммой или ключ старого формата"""
+    return license_keys.key_is_well_formed(license_key) or license_keys.legacy_key_format(license_key)
+
+
+class BloomFilter:
+    """Битовый массив + k позиций двойным хэшированием одного blake2b"""
+    __slots__ = ('capacity', 'size', 'hashes', 'bits', 'count')
+
+    def __init__(self, capacity, fp_rate=KEY_FILTER_FP_RATE):
+        self.capacity = capacity
+        self.size = max(1024, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, key):
+        bits = self.bits
+        for position in self._positions(key):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        for position in self._positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class KeyFilter:
+    """Фильтр выданных ключей для одной БД (источник - таблица с колонкой license_key)"""
+
+    def __init__(self, path=db.DATABASE_PATH, table='licenses'):
+        self.path = path
+        self.table = table
+        self.available = True
+        self._bloom = None
+        self._nonconforming = set()
+        self._last_id = 0
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+        # Метрики
+        self.passed = 0
+        self.rejected_malformed = 0
+        self.rejected_unknown = 0
+        self.refreshes = 0
+        self.rebuilds = 0
+
+    def _add_rows(self, bloom, nonconforming, rows, last_id=0):
+        """Добавить строки (rowid, license_key); возвращает последний rowid"""
+        for row_id, license_key in rows:
+            if license_key:
+                bloom.add(license_key)
+                if not key_format_valid(license_key):
+                    nonconforming.add(license_key)
+            last_id = max(last_id, row_id)
+        return last_id
+
+    def load(self, rebuild=False):
+        """Полная загрузка (при старте и когда ключей стало больше емкости фильтра)"""
+        with self._lock:
+            if self._bloom is not None and not rebuild:
+                return
+            try:
+                conn = db.get_connection(self.path)
+                total = conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+                # Новый фильтр строится сбоку: проверки идут по старому, пока не готов
+                bloom = BloomFilter(max(KEY_FILTER_MIN_CAPACITY, total * 2))
+                nonconforming = set()
+                last_id = self._add_rows(bloom, nonconforming, conn.execute(
+                    f'SELECT rowid, license_key FROM {self.table} ORDER BY rowid'
+                ))
+            except sqlite3.OperationalError as e:
+                # Нет таблицы/колонки: фильтр не отсеивает ничего, решает БД
+                logger.warning(f"⚠️ Фильтр ключей для {self.path} недоступен: {e}")
+                self.available = False
+                return
+            self._bloom, self._nonconforming, self._last_id = bloom, nonconforming, last_id
+            self._refreshed_at = time.monotonic()
+            self.rebuilds += 1
+            logger.info(f"🚧 Фильтр ключей загружен: {bloom.count} ключей, {len(bloom.bits) // 1024} КБ")
+
+    def refresh(self):
+        """Догрузить строки, добавленные после последней загрузки (по rowid)"""
+        with self._lock:
+            # Пока ждали блокировку, догрузку мог сделать другой поток
+            if time.monotonic() - self._refreshed_at < KEY_FILTER_REFRESH_INTERVAL:
+                return
+            self._last_id = self._add_rows(self._bloom, self._nonconforming, db.get_connection(self.path).execute(
+                f'SELECT rowid, license_key FROM {self.table} WHERE rowid > ? ORDER BY rowid', (self._last_id,)
+            ), self._last_id)
+            self._refreshed_at = time.monotonic()
+            self.refreshes += 1
+            grow = self._bloom.count > self._bloom.capacity
+        if grow:
+            self.load(rebuild=True)
+
+    def add(self, license_key):
+        """Ключ вставлен в этом процессе - виден сразу, без догрузки"""
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(license_key)
+                if not key_format_valid(license_key):
+                    self._nonconforming.add(license_key)
+
+    def check(self, license_key, allow_refresh=True):
+        """
+        True - ключ может быть в БД, False - точно нет.
+        allow_refresh=False (из event loop): None, если для ответа нужно обратиться к БД
+        """
+        if not KEY_FILTER_ENABLED or not self.available:
+            return True
+        if self._bloom is None:
+            if not allow_refresh:
+                return None
+            self.load()
+            if not self.available:
+                return True
+
+        if not key_format_valid(license_key) and license_key not in self._nonconforming:
+            self.rejected_malformed += 1
+            return False
+        if license_key in self._bloom:
+            self.passed += 1
+            return True
+
+        if time.monotonic() - self._refreshed_at >= KEY_FILTER_REFRESH_INTERVAL:
+            if not allow_refresh:
+                return None
+            try:
+                self.refresh()
+            except sqlite3.OperationalError:
+                # БД занята - пусть решает обычная проверка
+                return True
+            if license_key in self._bloom:
+                self.passed += 1
+                return True
+        self.rejected_unknown += 1
+        return False
+
+    def stats(self):
+        bloom = self._bloom
+        return {
+            "enabled": KEY_FILTER_ENABLED and self.available,
+            "keys": bloom.count if bloom else 0,
+            "capacity": bloom.capacity if bloom else 0,
+            "size_bytes": len(bloom.bits) if bloom else 0,
+            "hashes": bloom.hashes if bloom else 0,
+            "nonconforming_keys": len(self._nonconforming),
+            "passed": self.passed,
+            "rejected_malformed": self.rejected_malformed,
+            "rejected_unknown": self.rejected_unknown,
+            "refreshes": self.refreshes,
+            "rebuilds": self.rebuilds
+        }
+
+
+def get_filter(path=db.DATABASE_PATH, table='licenses'):
+    """Фильтр процесса для файла базы данных"""
+    key_filter = _filters.get((path, table))
+    if key_filter is None:
+        with _filters_lock:
+            key_filter = _filters.setdefault((path, table), KeyFilter(path, table))
+    return key_filter
+
+
+def note_inserted(license_keys, path=db.DATABASE_PATH):
+    """Сообщить фильтрам процесса о новых ключах (после коммита вставки)"""
+    key_filter = _filters.get((path, 'licenses'))
+    if key_filter is not None:
+        for license_key in license_keys:
+            key_filter.add(license_key)
+
+
+def stats(path=db.DATABASE_PATH):
+    """Состояние фильтра для /metrics"""
+    key_filter = _filters.get((path, 'licenses'))
+    return key_filter.stats() if key_filter is not None else {"enabled": KEY_FILTER_ENABLED, "keys": 0}
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+# ============================================================================
+# 🧠 КЭШ ВЕРДИКТОВ ПРОВЕРКИ ЛИЦЕНЗИЙ
+# ============================================================================
+#
+# Поколения ключей: invalidate поднимает счетчик ключа. Загрузка вердикта из
+# БД берет поколение до чтения (generation) и передает его в set - если за
+# время чтения ключ инвалидировали, запись устаревшего вердикта отбрасывается.
+
+LICENSE_CACHE_SIZE = int(os.environ.get('LICENSE_CACHE_SIZE', 10000))
+LICENSE_CACHE_TTL = float(os.environ.get('LICENSE_CACHE_TTL', 300))
+# Отрицательные вердикты живут недолго: бот работает в отдельном процессе
+# и может создать/подтвердить лицензию без инвалидации нашего кэша
+LICENSE_CACHE_NEGATIVE_TTL = float(os.environ.get('LICENSE_CACHE_NEGATIVE_TTL', 5))
+
+
+def expires_timestamp(expires_at):
+    """Перевод expires_at из БД в unix-время (None если не удалось разобрать)"""
+    if not expires_at:
+        return None
+    try:
+        if isinstance(expires_at, datetime):
+            return expires_at.timestamp()
+        return datetime.fromisoformat(str(expires_at).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+class LicenseCache:
+    """Ограниченный LRU/TTL кэш вердиктов по ключу (license_key, account_number)"""
+
+    def __init__(self, max_size=LICENSE_CACHE_SIZE, ttl=LICENSE_CACHE_TTL,
+                 negative_ttl=LICENSE_CACHE_NEGATIVE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._accounts_by_key = {}
+        # Поколения инвалидированных ключей; при переполнении сбрасываются сменой эпохи
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_sets = 0
+
+    def get(self, license_key, account_number, count_miss=True):
+        """
+        Вернуть (payload, status, etag) из кэша или None.
+        count_miss=False - предварительная проба (ASGI из event loop): промах
+        посчитает повторный запрос из пула потоков, иначе он учитывается дважды
+        """
+        cache_key = (license_key, account_number)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                self.misses += count_miss
+                return None
+
+            payload, status, deadline, etag = entry
+            if deadline <= time.time():
+                self._remove(cache_key)
+                self.misses += count_miss
+                return None
+
+            self._entries.move_to_end(cache_key)
+            self.hits += 1
+            return payload, status, etag
+
+    def generation(self, license_key):
+        """Поколение ключа - взять до чтения из БД и передать в set"""
+        with self._lock:
+            return self._epoch, self._generations.get(license_key, 0)
+
+    def set(self, license_key, account_number, payload, status, expires_at=None, etag=None, generation=None):
+        """
+        Сохранить вердикт (и его ETag, если посчитан); запись живет не дольше expires_at лицензии.
+        generation - поколение ключа до чтения: если с тех пор был invalidate, вердикт устарел и не пишется
+        """
+        if self.max_size <= 0:
+            return
+
+        now = time.time()
+        ttl = self.ttl if payload.get('valid') else self.negative_ttl
+        deadline = now + ttl
+
+        expires_ts = expires_timestamp(expires_at)
+        if expires_ts is not None and payload.get('valid'):
+            deadline = min(deadline, expires_ts)
+        if deadline <= now:
+            return
+
+        cache_key = (license_key, account_number)
+        with self._lock:
+            if generation is not None and generation != (self._epoch, self._generations.get(license_key, 0)):
+                self.stale_sets += 1
+                return
+            if cache_key in self._entries:
+                self._entries.move_to_end(cache_key)
+            self._entries[cache_key] = (payload, status, deadline, etag)
+            self._accounts_by_key.setdefault(license_key, set()).add(account_number)
+
+            while len(self._entries) > self.max_size:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def invalidate(self, license_key):
+        """Сбросить все закэшированные вердикты для ключа (после записи в БД)"""
+        with self._lock:
+            # Поколение растет и для незакэшированного ключа: его может сейчас читать загрузка
+            self._bump(license_key)
+            accounts = self._accounts_by_key.pop(license_key, None)
+            if not accounts:
+                return
+            for account_number in accounts:
+                self._entries.pop((license_key, account_number), None)
+            self.invalidations += 1
+
+    def clear(self):
+        """Полная очистка кэша"""
+        with self._lock:
+            self._entries.clear()
+            self._accounts_by_key.clear()
+            self._new_epoch()
+
+    def stats(self):
+        """Счетчики попаданий/промахов для мониторинга"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale_sets": self.stale_sets
+            }
+
+    def _bump(self, license_key):
+        """Новое поколение ключа (вызывается под блокировкой)"""
+        if len(self._generations) >= max(self.max_size, 1) and license_key not in self._generations:
+            self._new_epoch()
+        self._generations[license_key] = self._generations.get(license_key, 0) + 1
+
+    def _new_epoch(self):
+        """Устаревают поколения всех ключей сразу (вызывается под блокировкой)"""
+        self._epoch += 1
+        self._generations.clear()
+
+    def _remove(self, cache_key):
+        """Удаление записи (вызывается под блокировкой)"""
+        self._entries.pop(cache_key, None)
+        license_key, account_number = cache_key
+        accounts = self._accounts_by_key.get(license_key)
+        if accounts is not None:
+            accounts.discard(account_number)
+            if not accounts:
+                del self._accounts_by_key[license_key]
+
+
+# Общий кэш процесса (API и бот импортируют один и тот же объект)
+license_cache = LicenseCache()
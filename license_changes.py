@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+import db
+from db_writer import get_writer
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# 📜 ЛЕНТА ИЗМЕНЕНИЙ ЛИЦЕНЗИЙ (CHANGE DATA CAPTURE)
+# ============================================================================
+#
+# Журнал license_changes ведут триггеры (db.init_changes_schema): на каждую
+# вставку, изменение и удаление строки licenses - снимок строки. Курсор -
+# id последней прочитанной записи (он же licenses.version): "дай изменения
+# после N" - проход по первичному ключу журнала.
+#
+# Потребители:
+#   - кэши процессов (API, бот): ChangeFollower раз в LICENSE_CHANGES_POLL_INTERVAL
+#     читает новые записи и сбрасывает затронутые ключи вместо слепых TTL;
+#   - реплики: GET /admin/license_changes?since=N (страница или NDJSON-поток)
+#     с X-Admin-Token = REPLICA_API_TOKEN (или токен админа); снимок
+#     применяется как upsert по license_key, 'delete' - удаление.
+# Записи старше LICENSE_CHANGES_RETENTION_DAYS удаляются; потребитель с курсором
+# раньше самой старой записи получает отказ и должен перечитать licenses целиком.
+
+LICENSE_CHANGES_POLL_INTERVAL = float(os.environ.get('LICENSE_CHANGES_POLL_INTERVAL', 1.0))
+LICENSE_CHANGES_PAGE_SIZE = int(os.environ.get('LICENSE_CHANGES_PAGE_SIZE', 500))
+LICENSE_CHANGES_PAGE_MAX = int(os.environ.get('LICENSE_CHANGES_PAGE_MAX', 5000))
+# Сколько дней хранить журнал (0 - не удалять)
+LICENSE_CHANGES_RETENTION_DAYS = float(os.environ.get('LICENSE_CHANGES_RETENTION_DAYS', 30))
+# Как часто ChangeFollower удаляет старые записи
+LICENSE_CHANGES_PRUNE_INTERVAL = float(os.environ.get('LICENSE_CHANGES_PRUNE_INTERVAL', 3600))
+
+CHANGE_COLUMNS = ', '.join(('id', 'license_id', 'op') + db.CHANGE_TRACKED_COLUMNS + ('changed_at',))
+
+_followers = {}
+_followers_lock = threading.Lock()
+
+
+def parse_cursor(cursor):
+    """Курсор из запроса -> id записи журнала (ValueError если испорчен)"""
+    if cursor in (None, ''):
+        return 0
+    since = int(cursor)
+    if since < 0:
+        raise ValueError("Invalid cursor")
+    return since
+
+
+def latest_version(conn):
+    """id последней записи журнала (0 - журнал пуст)"""
+    return conn.execute('SELECT IFNULL(MAX(id), 0) FROM license_changes').fetchone()[0]
+
+
+def cursor_expired(conn, since):
+    """Записи после since уже частично удалены - нужна полная пересинхронизация"""
+    oldest = conn.execute('SELECT MIN(id) FROM license_changes').fetchone()[0]
+    return oldest is not None and since < oldest - 1 and since < latest_version(conn)
+
+
+def fetch_changes(conn, since=0, limit=LICENSE_CHANGES_PAGE_SIZE):
+    """Страница журнала после since: (записи, курсор следующей страницы, есть ли еще)"""
+    rows = conn.execute(f'''
+        SELECT {CHANGE_COLUMNS} FROM license_changes
+        WHERE id > ?
+        ORDER BY id
+        LIMIT ?
+    ''', (since, limit + 1)).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, rows[-1]['id'] if rows else since, has_more
+
+
+def change_to_dict(row):
+    return {
+        "version": row['id'],
+        "op": row['op'],
+        "license_key": row['license_key'],
+        "account_number": row['account_number'],
+        "expires_at": row['expires_at'],
+        "is_active": bool(row['is_active']),
+        "payment_verified": bool(row['payment_verified']),
+        "plan_type": row['plan_type'],
+        "telegram_user_id": row['telegram_user_id'],
+        "changed_at": row['changed_at']
+    }
+
+
+def iter_changes(since=0, path=db.DATABASE_PATH, chunk=LICENSE_CHANGES_PAGE_SIZE):
+    """Все изменения после since (строки журнала) до текущего конца; чтение кусками"""
+    while True:
+        rows, since, has_more = fetch_changes(db.get_connection(path), since, chunk)
+        yield from rows
+        if not has_more:
+            return
+
+
+def iter_ndjson(since=0, path=db.DATABASE_PATH, chunk=LICENSE_CHANGES_PAGE_SIZE):
+    """Поток NDJSON для реплик: кусок на каждое чтение журнала"""
+    while True:
+        # Соединение берем на каждый кусок: ASGI-версия читает их из разных потоков пула
+        rows, since, has_more = fetch_changes(db.get_connection(path), since, chunk)
+        if rows:
+            yield ''.join(
+                json.dumps(change_to_dict(row), ensure_ascii=True, sort_keys=True, separators=(',', ':')) + '\n'
+                for row in rows
+            ).encode('ascii')
+        if not has_more:
+            return
+
+
+def _prune(conn, before):
+    """Намерение записи: удалить записи старше before (последняя запись остается всегда)"""
+    return conn.execute('''
+        DELETE FROM license_changes
+        WHERE changed_at < ? AND id < (SELECT MAX(id) FROM license_changes)
+    ''', (before,)).rowcount
+
+
+def prune_changes(retention_days=LICENSE_CHANGES_RETENTION_DAYS, path=db.DATABASE_PATH):
+    """Удалить старую часть журнала; возвращает число удаленных записей"""
+    if retention_days <= 0:
+        return 0
+    # changed_at пишет CURRENT_TIMESTAMP (UTC)
+    before = (datetime.now(timezone.utc) - timedelta(days=retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+    pruned = get_writer(path).execute(_prune, before)
+    if pruned:
+        logger.info(f"📜 Из журнала изменений удалено записей: {pruned}")
+    return pruned
+
+
+class ChangeFollower:
+    """Фоновое чтение журнала для кэшей процесса; один поток на процесс"""
+
+    def __init__(self, path=db.DATABASE_PATH, interval=LICENSE_CHANGES_POLL_INTERVAL,
+                 batch=LICENSE_CHANGES_PAGE_SIZE):
+        self.path = path
+        self.interval = interval
+        self.batch = batch
+        self.cursor = None
+        self._handlers = []
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._pruned_at = 0.0
+
+        # Метрики
+        self.applied = 0
+        self.polls = 0
+        self.resyncs = 0
+        self.polled_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+
+    def subscribe(self, handler):
+        """handler(rows) получает каждую пачку новых записей журнала (None - сбросить все)"""
+        if handler not in self._handlers:
+            self._handlers.append(handler)
+
+    def poll(self):
+        """Прочитать и раздать новые записи; возвращает их число"""
+        conn = db.get_connection(self.path)
+        if self.cursor is None:
+            # Кэши процесса стартуют пустыми - прошлое им не нужно
+            self.cursor = latest_version(conn)
+        elif cursor_expired(conn, self.cursor):
+            # Отстали дальше хранимого журнала: обработчики получают rows=None - полный сброс
+            logger.warning(f"⚠️ Курсор {self.cursor} старше журнала изменений - полный сброс кэшей")
+            self.cursor = latest_version(conn)
+            self.resyncs += 1
+            for handler in self._handlers:
+                handler(None)
+
+        count = 0
+        while True:
+            rows, cursor, has_more = fetch_changes(conn, self.cursor, self.batch)
+            if rows:
+                for handler in self._handlers:
+                    handler(rows)
+            self.cursor = cursor
+            count += len(rows)
+            if not has_more:
+                break
+
+        self.applied += count
+        self.polls += 1
+        self.polled_at = time.time()
+        return count
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+                if time.monotonic() - self._pruned_at >= LICENSE_CHANGES_PRUNE_INTERVAL:
+                    self._pruned_at = time.monotonic()
+                    prune_changes(path=self.path)
+            except Exception as e:
+                logger.error(f"❌ Ошибка чтения журнала изменений: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Фоновый поток (повторный вызов в том же процессе ничего не делает)"""
+        if self.running:
+            return
+        self._stop.clear()
+        # Курсор - текущий конец журнала: изменения после старта не потеряются,
+        # даже если кэши заполнятся раньше первого опроса
+        self.cursor = latest_version(db.get_connection(self.path))
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='license-changes', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "cursor": self.cursor,
+            "applied": self.applied,
+            "polls": self.polls,
+            "resyncs": self.resyncs,
+            "polled_at": datetime.fromtimestamp(self.polled_at).isoformat() if self.polled_at else None
+        }
+
+
+def get_follower(path=db.DATABASE_PATH):
+    """Читатель журнала процесса для файла базы данных"""
+    follower = _followers.get(path)
+    if follower is None:
+        with _followers_lock:
+            follower = _followers.setdefault(path, ChangeFollower(path))
+    return follower
+
+
+def start_follower(path=db.DATABASE_PATH, *handlers):
+    """Подписать обработчики и запустить фоновое чтение журнала для БД"""
+    with _followers_lock:
+        follower = _followers.setdefault(path, ChangeFollower(path))
+        for handler in handlers:
+            follower.subscribe(handler)
+        follower.start()
+    return follower
+
+
+def stats(path=db.DATABASE_PATH):
+    """Состояние читателя журнала для /metrics"""
+    follower = _followers.get(path)
+    return follower.stats() if follower is not None else {"running": False}
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import zlib
+import base64
+import logging
+import secrets
+import argparse
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+import db
+from db_writer import get_writer
+import key_filter
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# 🔑 ГЕНЕРАЦИЯ ЛИЦЕНЗИОННЫХ КЛЮЧЕЙ: CSPRNG + КОНТРОЛЬНАЯ СУММА + ПУЛ
+# ============================================================================
+#
+# Формат прежний: RFX-XXXX-XXXX-XXXX-XXX-XX (советники и админы его знают).
+# 15 символов тела - 75 случайных бит из secrets в алфавите Crockford base32
+# (без I, L, O, U), последняя группа - 10 бит CRC32 тела. Ключ с неверной
+# контрольной суммой отбрасывается без обращения к БД (key_is_well_formed).
+#
+# Старые ключи (hex + цифры времени) контрольной суммы не имеют - их
+# распознает legacy_key_format, проверять их можно только по БД.
+#
+# Пул держит заранее сгенерированные ключи, которых точно нет в licenses:
+# выдача ключа в боте не ходит в БД, массовая выдача (реселлерам) вставляет
+# все ключи одной транзакцией писателя.
+#
+# Массовая выдача:  python license_keys.py --count 100000 --plan monthly --days 30 > keys.txt
+
+KEY_PREFIX = 'RFX'
+KEY_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+KEY_BODY_LENGTH = 15
+KEY_PATTERN = re.compile(r'^RFX-([0-9A-Z]{4})-([0-9A-Z]{4})-([0-9A-Z]{4})-([0-9A-Z]{3})-([0-9A-Z]{2})$')
+LEGACY_KEY_PATTERN = re.compile(r'^RFX-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9]{3}-[0-9]{2}$')
+
+LICENSE_KEY_POOL_SIZE = int(os.environ.get('LICENSE_KEY_POOL_SIZE', 256))
+# Ключей в одном IN (...) при проверке уникальности
+KEY_QUERY_CHUNK = 500
+
+# Стандартный base32 (RFC 4648) -> Crockford: b32encode работает в C
+_B32_TO_KEY = bytes.maketrans(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567', KEY_ALPHABET.encode('ascii'))
+
+
+def _checksum(body):
+    """Два символа контрольной суммы тела (10 бит CRC32)"""
+    crc = zlib.crc32(body.encode('ascii')) & 0x3FF
+    return KEY_ALPHABET[crc >> 5] + KEY_ALPHABET[crc & 0x1F]
+
+
+def _format_key(body):
+    return f"{KEY_PREFIX}-{body[0:4]}-{body[4:8]}-{body[8:12]}-{body[12:15]}-{_checksum(body)}"
+
+
+def generate_key():
+    """Новый ключ: 75 бит из CSPRNG + контрольная сумма"""
+    body = base64.b32encode(secrets.token_bytes(10)).translate(_B32_TO_KEY)[:KEY_BODY_LENGTH]
+    return _format_key(body.decode('ascii'))
+
+
+def key_is_well_formed(license_key):
+    """Ключ нового формата с верной контрольной суммой"""
+    match = KEY_PATTERN.match(license_key)
+    if match is None:
+        return False
+    body = ''.join(match.groups()[:4])
+    if any(char not in KEY_ALPHABET for char in body):
+        return False
+    return match.group(5) == _checksum(body)
+
+
+def legacy_key_format(license_key):
+    """Ключ старого формата (md5 + время), выданный до контрольных сумм"""
+    return LEGACY_KEY_PATTERN.match(license_key) is not None
+
+
+def existing_keys(conn, license_keys):
+    """Какие из ключей уже есть в licenses"""
+    found = set()
+    for start in range(0, len(license_keys), KEY_QUERY_CHUNK):
+        chunk = license_keys[start:start + KEY_QUERY_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        found.update(row[0] for row in conn.execute(
+            f'SELECT license_key FROM licenses WHERE license_key IN ({placeholders})', chunk
+        ))
+    return found
+
+
+def generate_unique_keys(conn, count):
+    """count новых ключей без повторов между собой и с licenses"""
+    keys = set()
+    while len(keys) < count:
+        batch = {generate_key() for _ in range(count - len(keys))} - keys
+        batch -= existing_keys(conn, list(batch))
+        keys |= batch
+    return list(keys)
+
+
+class KeyPool:
+    """Запас проверенных на уникальность ключей для одной БД"""
+
+    def __init__(self, path=db.DATABASE_PATH, size=LICENSE_KEY_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._keys = deque()
+        self._lock = threading.Lock()
+        self.refills = 0
+        self.issued = 0
+
+    def refill(self):
+        """Догенерировать пул до size (одна проверка по индексу license_key на пачку)"""
+        keys = generate_unique_keys(db.get_connection(self.path), self.size)
+        with self._lock:
+            self._keys.extend(keys)
+            self.refills += 1
+
+    def take(self):
+        """Ключ из пула (пустой пул пополняется в вызывающем потоке - вызывать через run_db)"""
+        while True:
+            with self._lock:
+                if self._keys:
+                    self.issued += 1
+                    return self._keys.popleft()
+            self.refill()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "available": len(self._keys),
+                "size": self.size,
+                "refills": self.refills,
+                "issued": self.issued
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path=db.DATABASE_PATH):
+    """Пул ключей процесса для файла базы данных"""
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(path, KeyPool(path))
+    return pool
+
+
+# ============================================================================
+# 📦 МАССОВАЯ ВЫДАЧА
+# ============================================================================
+
+def _insert_issued(conn, count, plan_type, expires_at, telegram_user_id, payment_verified):
+    """Намерение записи: count лицензий одной транзакцией; уникальность проверяется внутри нее"""
+    keys = generate_unique_keys(conn, count)
+    conn.executemany('''
+        INSERT INTO licenses (license_key, plan_type, telegram_user_id, expires_at, is_active, payment_verified)
+        VALUES (?, ?, ?, ?, 1, ?)
+    ''', [(license_key, plan_type, telegram_user_id, expires_at, payment_verified) for license_key in keys])
+    return keys
+
+
+def issue_keys(count, plan_type='monthly', days=30, telegram_user_id=None, payment_verified=1,
+               path=db.DATABASE_PATH):
+    """Выпустить count оплаченных лицензий одной вставкой; возвращает ключи"""
+    expires_at = datetime.now() + timedelta(days=days)
+    keys = get_writer(path).execute(
+        _insert_issued, count, plan_type, expires_at,
+        None if telegram_user_id is None else str(telegram_user_id), payment_verified
+    )
+    key_filter.note_inserted(keys, path)
+    logger.info(f"🔑 Выпущено ключей: {len(keys)} ({plan_type}, {days} дн.)")
+    return keys
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Массовая выдача лицензионных ключей (одной транзакцией)')
+    parser.add_argument('--count', type=int, required=True)
+    parser.add_argument('--plan', default='monthly')
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--telegram-user-id', default=None, help='владелец (реселлер), необязательно')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    db.init_schema(db.get_connection())
+    keys = issue_keys(args.count, args.plan, args.days, args.telegram_user_id)
+    get_writer().stop()
+    sys.stdout.write(''.join(f"{license_key}\n" for license_key in keys))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+import os
+import json
+from datetime import datetime
+
+import db
+
+# ============================================================================
+# 📋 СПИСОК ЛИЦЕНЗИЙ ДЛЯ АДМИНА: ФИЛЬТРЫ, KEYSET-СТРАНИЦЫ, ВЫГРУЗКА NDJSON
+# ============================================================================
+#
+# Порядок по умолчанию - новые первыми (created_at, id); если задан диапазон
+# expires_after/expires_before - по сроку действия (expires_at, id) по возрастанию.
+# Каждому фильтру соответствует составной индекс "фильтр + ключ сортировки"
+# (см. db.init_schema), поэтому страница - это короткий проход по индексу.
+# Выгрузка идет теми же страницами: короткие чтения, память не растет.
+
+ADMIN_LICENSES_PAGE_SIZE = int(os.environ.get('ADMIN_LICENSES_PAGE_SIZE', 100))
+ADMIN_LICENSES_PAGE_MAX = int(os.environ.get('ADMIN_LICENSES_PAGE_MAX', 1000))
+# Строк в одном чтении при выгрузке NDJSON
+ADMIN_EXPORT_CHUNK = int(os.environ.get('ADMIN_EXPORT_CHUNK', 1000))
+
+LISTING_COLUMNS = '''id, license_key, account_number, created_at, expires_at,
+                     is_active, payment_verified, plan_type, telegram_user_id'''
+
+
+def _parse_flag(value):
+    if value in ('1', 'true', 'True'):
+        return 1
+    if value in ('0', 'false', 'False'):
+        return 0
+    raise ValueError("payment_verified must be 0/1 or true/false")
+
+
+def _parse_datetime(value):
+    """Граница срока в формате, в котором expires_at хранится в БД (str(datetime))"""
+    return str(datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None))
+
+
+class LicenseQuery:
+    """Разобранные фильтры и порядок списка лицензий"""
+    __slots__ = ('plan_type', 'payment_verified', 'telegram_user_id', 'expires_after', 'expires_before')
+
+    def __init__(self, plan_type=None, payment_verified=None, telegram_user_id=None,
+                 expires_after=None, expires_before=None):
+        self.plan_type = plan_type
+        self.payment_verified = payment_verified
+        self.telegram_user_id = telegram_user_id
+        self.expires_after = expires_after
+        self.expires_before = expires_before
+
+    @classmethod
+    def from_args(cls, args):
+        """Фильтры из параметров запроса (ValueError при неверном значении)"""
+        payment_verified = args.get('payment_verified')
+        expires_after = args.get('expires_after')
+        expires_before = args.get('expires_before')
+        return cls(
+            plan_type=args.get('plan_type') or None,
+            payment_verified=_parse_flag(payment_verified) if payment_verified else None,
+            telegram_user_id=args.get('telegram_user_id') or None,
+            expires_after=_parse_datetime(expires_after) if expires_after else None,
+            expires_before=_parse_datetime(expires_before) if expires_before else None
+        )
+
+    @property
+    def by_expiry(self):
+        return self.expires_after is not None or self.expires_before is not None
+
+    def page_sql(self, after=None):
+        """SQL страницы и параметры (без LIMIT-значения в конце)"""
+        conditions = []
+        params = []
+        if self.plan_type is not None:
+            conditions.append('plan_type = ?')
+            params.append(self.plan_type)
+        if self.payment_verified is not None:
+            conditions.append('payment_verified = ?')
+            params.append(self.payment_verified)
+        if self.telegram_user_id is not None:
+            conditions.append('telegram_user_id = ?')
+            params.append(self.telegram_user_id)
+        if self.expires_after is not None:
+            conditions.append('expires_at >= ?')
+            params.append(self.expires_after)
+        if self.expires_before is not None:
+            conditions.append('expires_at < ?')
+            params.append(self.expires_before)
+
+        if self.by_expiry:
+            if after is not None:
+                conditions.append('(expires_at, id) > (?, ?)')
+                params.extend(after)
+            order = 'expires_at, id'
+        else:
+            if after is not None:
+                conditions.append('(created_at, id) < (?, ?)')
+                params.extend(after)
+            order = 'created_at DESC, id DESC'
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        return f'SELECT {LISTING_COLUMNS} FROM licenses {where} ORDER BY {order} LIMIT ?', params
+
+    def cursor_for(self, row):
+        """Курсор "значение сортировки|id" от последней строки страницы"""
+        return f"{row['expires_at'] if self.by_expiry else row['created_at']}|{row['id']}"
+
+
+def decode_cursor(cursor):
+    """Курсор -> (значение сортировки, id); ValueError если курсор испорчен"""
+    value, _, license_id = cursor.rpartition('|')
+    if not value:
+        raise ValueError("Invalid cursor")
+    return value, int(license_id)
+
+
+def fetch_page(conn, query, limit=ADMIN_LICENSES_PAGE_SIZE, after=None):
+    """Страница списка: (строки, курсор следующей страницы или None)"""
+    sql, params = query.page_sql(after)
+    rows = conn.execute(sql, params + [limit + 1]).fetchall()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, query.cursor_for(rows[-1])
+    return rows, None
+
+
+def row_to_dict(row):
+    return {
+        "license_key": row['license_key'],
+        "account_number": row['account_number'],
+        "created_at": row['created_at'],
+        "expires_at": row['expires_at'],
+        "is_active": bool(row['is_active']),
+        "payment_verified": bool(row['payment_verified']),
+        "plan_type": row['plan_type'],
+        "telegram_user_id": row['telegram_user_id']
+    }
+
+
+def iter_ndjson(query, after=None, path=db.DATABASE_PATH, chunk=ADMIN_EXPORT_CHUNK):
+    """Выгрузка NDJSON кусками по chunk строк (каждое чтение - отдельная короткая транзакция)"""
+    while True:
+        # Соединение берем на каждый кусок: ASGI-версия читает их из разных потоков пула
+        rows, next_cursor = fetch_page(db.get_connection(path), query, chunk, after)
+        if rows:
+            yield ''.join(
+                json.dumps(row_to_dict(row), ensure_ascii=True, sort_keys=True, separators=(',', ':')) + '\n'
+                for row in rows
+            ).encode('ascii')
+        if next_cursor is None:
+            return
+        after = decode_cursor(next_cursor)
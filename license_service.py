@@ -0,0 +1,1001 @@
+#!/usr/bin/env python3
+import os
+import hmac
+import time
+import hashlib
+import sqlite3
+import logging
+from datetime import datetime
+
+import db
+import health_checks
+from db_writer import get_writer, write
+from license_cache import expires_timestamp, license_cache
+from license_tokens import LICENSE_TOKEN_TTL, issue_token, tokens_enabled
+import request_logging
+from request_logging import log_verdict
+import stats_counters
+import payment_proofs
+import payment_review
+import license_listing
+import expiry_scheduler
+import key_filter
+import license_changes
+from rate_limit import rate_limiter, retry_after_header
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# 🔐 ЛОГИКА API ЛИЦЕНЗИЙ (ОБЩАЯ ДЛЯ FLASK main.py И ASGI asgi_app.py)
+# ============================================================================
+#
+# Каждая функция-обработчик возвращает (body, http_status, headers):
+# оба приложения только сериализуют результат, поэтому схема ответов
+# у них гарантированно одинаковая. Функции синхронные - ASGI-версия
+# вызывает их через пул потоков async_db.
+
+DATABASE_PATH = db.DATABASE_PATH
+
+# Поля licenses, из которых строится вердикт проверки (version - для ETag)
+LICENSE_VERDICT_COLUMNS = 'license_key, account_number, expires_at, is_active, payment_verified, plan_type, version'
+
+# Максимум элементов в одном пакетном запросе
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 500))
+# Ключей в одном IN (...) - с запасом ниже SQLITE_MAX_VARIABLE_NUMBER
+BATCH_QUERY_CHUNK = 500
+
+# Сколько секунд прокси и HTTP-кэш советника могут отдавать вердикт без
+# повторной проверки (для действующей лицензии - не дольше ее срока)
+VERDICT_MAX_AGE = int(os.environ.get('VERDICT_MAX_AGE', 60))
+# Отказы живут недолго: оплату могут подтвердить, ключ - выдать в боте
+VERDICT_NEGATIVE_MAX_AGE = int(os.environ.get('VERDICT_NEGATIVE_MAX_AGE', 5))
+
+# Доступ к /admin/* (пусто - админ API отключен)
+ADMIN_API_TOKEN = os.environ.get('ADMIN_API_TOKEN', '')
+# Токен реплик: только чтение журнала изменений /admin/license_changes
+REPLICA_API_TOKEN = os.environ.get('REPLICA_API_TOKEN', '')
+ADMIN_TOKEN_HEADER = 'X-Admin-Token'
+
+NO_HEADERS = {}
+
+# Ответов 304 Not Modified (для /metrics)
+not_modified = 0
+
+
+def get_db_connection():
+    """Теплое соединение из пула (одно на поток, закрывать не нужно)"""
+    return db.get_connection(DATABASE_PATH)
+
+
+def service_info():
+    """Главная страница API"""
+    return {
+        "service": "RFX Trading License API",
+        "version": "2.0",
+        "status": "active",
+        "description": "License verification system for MT5 Expert Advisor",
+        "endpoints": {
+            "check_license": "/check_license/<license_key>/<account_number>",
+            "check_licenses": "POST /check_licenses",
+            "license_token": "/license_token/<license_key>/<account_number>",
+            "revoked_licenses": "/revoked_licenses",
+            "health": "/health",
+            "livez": "/livez",
+            "readyz": "/readyz",
+            "stats": "/stats",
+            "metrics": "/metrics"
+        }
+    }, 200, NO_HEADERS
+
+
+# ============================================================================
+# 📊 СОСТОЯНИЕ И СТАТИСТИКА
+# ============================================================================
+
+def livez():
+    """Liveness: процесс жив (БД не трогаем)"""
+    body, status = health_checks.liveness()
+    return body, status, NO_HEADERS
+
+
+def readyz(extra_checks=None, cache_only=False):
+    """Readiness: легкие проверки БД, закэшированные на READYZ_CACHE_TTL"""
+    result = health_checks.readiness(DATABASE_PATH, extra_checks=extra_checks, cache_only=cache_only)
+    if result is None:
+        return None
+    body, status = result
+    return body, status, NO_HEADERS
+
+
+def health():
+    """Проверка состояния сервиса (совместимый формат поверх /readyz)"""
+    body, status = health_checks.readiness(DATABASE_PATH)
+    if status != 200:
+        return {
+            "status": "unhealthy",
+            "error": body["checks"]["database"].get("error", body["status"]),
+            "checks": body["checks"],
+            "timestamp": datetime.now().isoformat()
+        }, 500, NO_HEADERS
+
+    try:
+        # Счетчик из license_stats вместо COUNT(*) по всей таблице
+        total_licenses = stats_counters.read_stats(get_db_connection())['total_licenses']
+    except Exception as e:
+        logger.error(f"Health check failed: {e}")
+        return {
+            "status": "unhealthy",
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }, 500, NO_HEADERS
+
+    return {
+        "status": "healthy",
+        "database": "connected",
+        "total_licenses": total_licenses,
+        "timestamp": datetime.now().isoformat()
+    }, 200, NO_HEADERS
+
+
+def stats():
+    """Статистика системы (материализованные счетчики, одно чтение)"""
+    try:
+        counters = stats_counters.read_stats(get_db_connection())
+
+        return {
+            "total_licenses": counters['total_licenses'],
+            "active_licenses": counters['active_licenses'],
+            "pending_payments": counters['pending_payments'],
+            "expired_licenses": counters['expired_licenses'],
+            "total_users": counters['total_users'],
+            "timestamp": datetime.now().isoformat()
+        }, 200, NO_HEADERS
+
+    except Exception as e:
+        logger.error(f"Stats error: {e}")
+        return {"error": "Failed to get stats"}, 500, NO_HEADERS
+
+
+def metrics(extra=None):
+    """Технические метрики процесса (кэш вердиктов, пул соединений, писатель)"""
+    body = {
+        "license_cache": license_cache.stats(),
+        "db_pool": db.get_pool(DATABASE_PATH).stats(),
+        "db_writer": get_writer(DATABASE_PATH).stats(),
+        "request_log": request_logging.stats(),
+        "stats_counters": stats_counters.stats(),
+        "health_checks": health_checks.stats(),
+        "expiry_scheduler": expiry_scheduler.stats(DATABASE_PATH),
+        "key_filter": key_filter.stats(DATABASE_PATH),
+        "rate_limit": rate_limiter.stats(),
+        "not_modified_responses": not_modified,
+        "license_changes": license_changes.stats(DATABASE_PATH),
+        "timestamp": datetime.now().isoformat()
+    }
+    if extra:
+        body.update(extra)
+    return body, 200, NO_HEADERS
+
+
+# ============================================================================
+# 🔍 ПРОВЕРКА ЛИЦЕНЗИЙ
+# ============================================================================
+
+def bind_account(conn, license_key, account_number):
+    """Намерение записи: привязка к счету, только если счет еще не привязан"""
+    return conn.execute('''
+        UPDATE licenses
+        SET account_number = ?
+        WHERE license_key = ? AND (account_number IS NULL OR account_number = '')
+    ''', (account_number, license_key)).rowcount
+
+
+def bind_accounts(conn, bindings):
+    """Намерение записи: пакетная привязка; возвращает ключи, которые удалось привязать"""
+    bound = set()
+    for license_key, account_number in bindings:
+        if bind_account(conn, license_key, account_number):
+            bound.add(license_key)
+    return bound
+
+
+def license_expired(expires_at):
+    """Наступил ли срок действия (дата из БД)"""
+    try:
+        return datetime.fromisoformat(expires_at.replace('Z', '+00:00')) < datetime.now()
+    except Exception as e:
+        logger.error("❌ Ошибка парсинга даты %r: %s", expires_at, e)
+        return False
+
+
+def expired_verdict(license_key, expires_at):
+    return {
+        "valid": False,
+        "reason": "expired",
+        "message": "License has expired",
+        "license_key": license_key,
+        "expired_at": expires_at
+    }, 410, expires_at, False  # Gone
+
+
+def evaluate_license(license_data, license_key, account_number):
+    """
+    Вердикт по строке licenses без записи в БД.
+    Возвращает (payload, http_status, expires_at, needs_binding)
+    """
+    if not license_data:
+        return {
+            "valid": False,
+            "reason": "key_not_found",
+            "message": "License key not found in database",
+            "license_key": license_key
+        }, 404, None, False
+
+    # Извлекаем данные лицензии (итог пишется одной записью в log_verdict)
+    db_account_number = license_data['account_number']
+    expires_at = license_data['expires_at']
+    is_active = license_data['is_active']
+    payment_verified = license_data['payment_verified']
+    plan_type = license_data['plan_type']
+
+    # Проверяем подтверждение оплаты
+    if not payment_verified:
+        return {
+            "valid": False,
+            "reason": "payment_not_verified",
+            "message": "Payment not verified",
+            "license_key": license_key
+        }, 402, expires_at, False  # Payment Required
+
+    # Проверяем активность (истекшие лицензии деактивирует expiry_scheduler)
+    if not is_active:
+        if license_expired(expires_at):
+            return expired_verdict(license_key, expires_at)
+        return {
+            "valid": False,
+            "reason": "license_inactive",
+            "message": "License is inactive",
+            "license_key": license_key
+        }, 403, expires_at, False
+
+    # Срок проверяем по дате, только если в процессе не работает планировщик истечения:
+    # с ним is_active = 1 уже означает, что срок не наступил
+    if not expiry_scheduler.sweeper_running(DATABASE_PATH) and license_expired(expires_at):
+        return expired_verdict(license_key, expires_at)
+
+    # Проверяем привязку к торговому счету
+    if db_account_number and db_account_number != account_number:
+        return {
+            "valid": False,
+            "reason": "wrong_account",
+            "message": "License is bound to different account",
+            "license_key": license_key,
+            "bound_account": db_account_number,
+            "requested_account": account_number
+        }, 403, expires_at, False
+
+    # ✅ ВСЕ ПРОВЕРКИ ПРОЙДЕНЫ
+    return {
+        "valid": True,
+        "message": "License is valid",
+        "license_key": license_key,
+        "account_number": account_number,
+        "plan_type": plan_type,
+        "expires_at": expires_at
+    }, 200, expires_at, not db_account_number
+
+
+def resolve_license(license_key, account_number, _retry_on_race=True):
+    """Проверка лицензии по БД: возвращает (payload, http_status, expires_at, etag)"""
+    conn = get_db_connection()
+
+    # Ищем лицензию в базе данных
+    license_data = conn.execute(f'''
+        SELECT {LICENSE_VERDICT_COLUMNS}
+        FROM licenses
+        WHERE license_key = ?
+    ''', (license_key,)).fetchone()
+
+    payload, status, expires_at, needs_binding = evaluate_license(license_data, license_key, account_number)
+    etag = row_etag(license_data, status)
+
+    # Если счет не привязан, привязываем его
+    if needs_binding:
+        logger.info("🔗 Привязываем лицензию %s к счету %s", license_key, account_number)
+        bound = write(bind_account, license_key, account_number)
+        # Вердикты для других счетов больше не актуальны
+        license_cache.invalidate(license_key)
+        if not bound and _retry_on_race:
+            # Параллельный запрос успел привязать другой счет - перечитываем
+            return resolve_license(license_key, account_number, _retry_on_race=False)
+        if bound:
+            # Привязка подняла версию строки - тег по новой версии
+            etag = verdict_etag(license_version(conn, license_key), status, account_number)
+
+    return payload, status, expires_at, etag
+
+
+def rejected_verdict(license_key, account_number):
+    """key_not_found для ключа, отсеянного фильтром: (payload, http_status)"""
+    payload, status, _, _ = evaluate_license(None, license_key, account_number)
+    return payload, status
+
+
+def verdict_etag(version, status, bound_account):
+    """
+    Слабый ETag вердикта: версия строки licenses (ее поднимает любое изменение
+    строки, db.init_changes_schema), статус и привязанный счет. Тег считается
+    без сборки и хэширования тела и совпадает во всех воркерах; у ключа без
+    строки в БД версия 0
+    """
+    account = hashlib.blake2b((bound_account or '').encode('utf-8'), digest_size=6).hexdigest()
+    return f'W/"{version}-{status}-{account}"'
+
+
+def row_etag(license_data, status):
+    """ETag вердикта по строке licenses (None - строки нет)"""
+    if license_data is None:
+        return verdict_etag(0, status, None)
+    return verdict_etag(license_data['version'], status, license_data['account_number'])
+
+
+def license_version(conn, license_key):
+    """Текущая версия строки licenses (0 - строки нет)"""
+    row = conn.execute('SELECT version FROM licenses WHERE license_key = ?', (license_key,)).fetchone()
+    return row[0] if row else 0
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match совпадает с ETag (слабое сравнение, RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def verdict_headers(payload, etag):
+    """ETag, Cache-Control и Vary: max-age не дольше, чем лицензии осталось действовать"""
+    if payload.get('valid'):
+        max_age = VERDICT_MAX_AGE
+        expires_ts = expires_timestamp(payload.get('expires_at'))
+        if expires_ts is not None:
+            max_age = min(max_age, int(expires_ts - time.time()))
+    else:
+        max_age = VERDICT_NEGATIVE_MAX_AGE
+    # Вердикт определяется URL (ключ + счет): общие прокси могут отдавать его всем
+    # советникам фермы; s-maxage - тот же срок для прокси, что и для клиента
+    max_age = max(0, max_age)
+    return {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={max_age}, s-maxage={max_age}",
+        "Vary": "Accept-Encoding"
+    }
+
+
+def lookup_verdict(license_key, account_number, allow_refresh=True):
+    """
+    Все, что известно без SQLite: (вердикт из кэша или None, известен ли ключ фильтру).
+    Мусорные и неизвестные ключи отсеиваются в памяти; allow_refresh=False (проба
+    из event loop) - вместо обновления фильтра "известен" = None, промах кэша не
+    считается (его посчитает повторный вызов из пула потоков)
+    """
+    cached = license_cache.get(license_key, account_number, count_miss=allow_refresh)
+    if cached is not None:
+        return cached, True
+    return None, key_filter.get_filter(DATABASE_PATH).check(license_key, allow_refresh=allow_refresh)
+
+
+def load_verdict(license_key, account_number):
+    """Вердикт из БД с записью в кэш: (payload, http_status, etag)"""
+    # Поколение до чтения: инвалидация во время чтения не даст закэшировать старый вердикт
+    generation = license_cache.generation(license_key)
+    payload, status, expires_at, etag = resolve_license(license_key, account_number)
+    license_cache.set(license_key, account_number, payload, status, expires_at, etag, generation)
+    return payload, status, etag
+
+
+def verdict_body(payload):
+    """Тело ответа по вердикту (verified_at - время ответа; из HTTP-кэша придет прежний)"""
+    if payload.get('valid'):
+        payload = dict(payload, verified_at=datetime.now().isoformat())
+    return payload
+
+
+def verdict_error(e):
+    """Ответ при ошибке проверки лицензии"""
+    if isinstance(e, sqlite3.OperationalError):
+        # БД занята другим писателем дольше busy_timeout - клиенту стоит повторить
+        logger.error("❌ БД недоступна при проверке лицензии: %s", e)
+        return {
+            "valid": False,
+            "reason": "server_busy",
+            "message": "Database is busy, retry later",
+            "error": str(e)
+        }, 503, {"Retry-After": "1"}
+
+    logger.exception("❌ Критическая ошибка проверки лицензии: %s", e)
+    return {
+        "valid": False,
+        "reason": "server_error",
+        "message": "Internal server error",
+        "error": str(e)
+    }, 500, NO_HEADERS
+
+
+def rate_limited(wait):
+    """Ответ 429: ключ или IP исчерпал лимит проверок"""
+    return {
+        "valid": False,
+        "reason": "rate_limited",
+        "message": "Too many license checks, retry later",
+        "retry_after": round(wait, 3)
+    }, 429, {"Retry-After": retry_after_header(wait)}
+
+
+def check_license(license_key, account_number, client_ip=None, cache_only=False, if_none_match=None):
+    """
+    🔐 ОСНОВНАЯ ФУНКЦИЯ: Проверка лицензионного ключа
+    cache_only=True - ответ только из кэша (None при промахе), без обращения к БД
+    if_none_match - заголовок запроса: при совпадении ETag ответ 304 без тела
+    """
+    global not_modified
+    started = time.perf_counter()
+
+    # Общие для воркеров лимиты живут в SQLite - их проверяем только в пуле потоков
+    if cache_only and rate_limiter.blocking:
+        return None
+
+    try:
+        cached, known = lookup_verdict(license_key, account_number, allow_refresh=not cache_only)
+    except Exception as e:
+        return verdict_error(e)
+    if cache_only and cached is None and known is not False:
+        # Промах: лимит проверит повторный вызов из пула потоков (токен не списан)
+        return None
+
+    # Фильтр - до лимита: мусорный или неизвестный ключ списывает только ведро IP
+    # и не заводит ведро ключа. Лимит проверяется и для ответов из кэша: частые
+    # попадания тоже занимают воркер
+    wait = rate_limiter.check(license_key if known else None, client_ip)
+    if wait:
+        # Отказы по лимиту не пишутся в лог проверок - только счетчики /metrics
+        return rate_limited(wait)
+
+    if cached is not None:
+        payload, status, etag = cached
+        from_cache = True
+    elif not known:
+        payload, status = rejected_verdict(license_key, account_number)
+        etag = None
+        from_cache = False
+    else:
+        try:
+            payload, status, etag = load_verdict(license_key, account_number)
+        except Exception as e:
+            return verdict_error(e)
+        from_cache = False
+
+    log_verdict(
+        license_key, account_number, payload, status,
+        (time.perf_counter() - started) * 1000,
+        cached=from_cache,
+        client_ip=client_ip
+    )
+
+    # Тег хранится в кэше вместе с вердиктом; нет его только у отсеянного фильтром ключа
+    headers = verdict_headers(payload, etag or verdict_etag(0, status, None))
+    # Условия запроса учитываются только для успешного ответа (RFC 9110, 13.2.1)
+    if status == 200 and etag_matches(if_none_match, headers["ETag"]):
+        not_modified += 1
+        return None, 304, headers
+    return verdict_body(payload), status, headers
+
+
+def parse_batch_items(data):
+    """Разбор тела пакетного запроса в список (license_key, account_number)"""
+    items = data.get('licenses') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        raise ValueError("Expected a list of licenses")
+
+    pairs = []
+    for item in items:
+        if isinstance(item, dict):
+            license_key = item.get('license_key')
+            account_number = item.get('account_number', "")
+        elif isinstance(item, (list, tuple)) and len(item) == 2:
+            license_key, account_number = item
+        else:
+            raise ValueError("Each item must be {license_key, account_number} or a pair")
+
+        if not isinstance(license_key, str) or not license_key:
+            raise ValueError("license_key is required")
+        pairs.append((license_key, "" if account_number is None else str(account_number)))
+    return pairs
+
+
+def fetch_licenses(license_keys):
+    """Строки licenses для набора ключей одним запросом WHERE license_key IN (...)"""
+    conn = get_db_connection()
+    rows = {}
+    license_keys = list(license_keys)
+    for start in range(0, len(license_keys), BATCH_QUERY_CHUNK):
+        chunk = license_keys[start:start + BATCH_QUERY_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        for row in conn.execute(f'''
+            SELECT {LICENSE_VERDICT_COLUMNS}
+            FROM licenses
+            WHERE license_key IN ({placeholders})
+        ''', chunk):
+            rows[row['license_key']] = row
+    return rows
+
+
+def check_licenses_batch(data, client_ip=None):
+    """
+    🔐 Пакетная проверка лицензий для терминальных ферм.
+    Тело: {"licenses": [{"license_key": "...", "account_number": "..."}, ...]}
+    """
+    try:
+        pairs = parse_batch_items(data)
+    except ValueError as e:
+        return {"error": str(e)}, 400, NO_HEADERS
+
+    if len(pairs) > BATCH_MAX_ITEMS:
+        return {"error": f"Too many licenses in one request (max {BATCH_MAX_ITEMS})"}, 413, NO_HEADERS
+
+    # Фильтр - до лимита: ведра заводятся только для ключей, которые могут быть в БД
+    prefilter = key_filter.get_filter(DATABASE_PATH)
+    try:
+        known = {license_key for license_key in {license_key for license_key, _ in pairs} if prefilter.check(license_key)}
+    except sqlite3.OperationalError as e:
+        logger.error(f"❌ БД недоступна при пакетной проверке: {e}")
+        return {"error": "Database is busy, retry later"}, 503, {"Retry-After": "1"}
+
+    # Пакет - один запрос для лимита IP; ключи сверх своего лимита получают 429 в results
+    wait, throttled = rate_limiter.check_batch([license_key for license_key, _ in pairs if license_key in known], client_ip)
+    if wait:
+        return {"error": "Too many requests, retry later", "retry_after": round(wait, 3)}, 429, \
+            {"Retry-After": retry_after_header(wait)}
+
+    started = time.perf_counter()
+
+    try:
+        results = [None] * len(pairs)
+        pending = []
+        for index, (license_key, account_number) in enumerate(pairs):
+            if license_key in throttled:
+                results[index] = rate_limited(throttled[license_key])[:2]
+                continue
+            if license_key not in known:
+                results[index] = rejected_verdict(license_key, account_number)
+                continue
+            cached = license_cache.get(license_key, account_number)
+            if cached is not None:
+                results[index] = cached[:2]
+            else:
+                pending.append(index)
+
+        # В БД идут только ключи, прошедшие фильтр (остальные уже получили key_not_found)
+        lookup = {pairs[index][0] for index in pending}
+        generations = {license_key: license_cache.generation(license_key) for license_key in lookup}
+        rows = fetch_licenses(lookup) if lookup else {}
+
+        # Счета, привязанные в рамках этого пакета (первый элемент выигрывает)
+        claimed = {}
+        bindings = []
+        verdicts = {}
+        for index in pending:
+            license_key, account_number = pairs[index]
+            license_data = rows.get(license_key)
+            if license_data is not None and license_key in claimed:
+                license_data = dict(license_data, account_number=claimed[license_key])
+
+            payload, status, expires_at, needs_binding = evaluate_license(license_data, license_key, account_number)
+            if needs_binding:
+                claimed[license_key] = account_number
+                bindings.append((license_key, account_number))
+            verdicts[index] = (payload, status, expires_at, row_etag(license_data, status))
+
+        # Все привязки пакета - одной транзакцией
+        bound = write(bind_accounts, bindings) if bindings else set()
+        for license_key, _ in bindings:
+            license_cache.invalidate(license_key)
+        # Привязка подняла версии строк - теги по новым версиям
+        versions = {license_key: row['version'] for license_key, row in fetch_licenses(bound).items()} if bound else {}
+
+        for index in pending:
+            license_key, account_number = pairs[index]
+            payload, status, expires_at, etag = verdicts[index]
+            if license_key in claimed and license_key not in bound:
+                # Ключ успел привязать параллельный запрос - перечитываем
+                payload, status, expires_at, etag = resolve_license(license_key, account_number)
+            elif license_key in versions:
+                etag = verdict_etag(versions[license_key], status, claimed[license_key])
+            # Привязанные в этом пакете ключи инвалидированы выше - их вердикты закэширует следующая проверка
+            license_cache.set(license_key, account_number, payload, status, expires_at, etag, generations[license_key])
+            results[index] = (payload, status)
+
+    except sqlite3.OperationalError as e:
+        logger.error(f"❌ БД недоступна при пакетной проверке: {e}")
+        return {"error": "Database is busy, retry later"}, 503, {"Retry-After": "1"}
+    except Exception as e:
+        logger.error(f"❌ Критическая ошибка пакетной проверки: {e}")
+        return {"error": "Internal server error"}, 500, NO_HEADERS
+
+    # Отказы - полностью, успешные - по сэмплу (одна запись на элемент)
+    duration_ms = (time.perf_counter() - started) * 1000
+    for (license_key, account_number), (payload, status) in zip(pairs, results):
+        if license_key in throttled:
+            continue
+        log_verdict(license_key, account_number, payload, status, duration_ms, client_ip=client_ip)
+
+    verified_at = datetime.now().isoformat()
+    items = []
+    for payload, status in results:
+        item = dict(payload, status=status)
+        if payload.get('valid'):
+            item['verified_at'] = verified_at
+        items.append(item)
+
+    return {
+        "total": len(items),
+        "valid": sum(1 for item in items if item['valid']),
+        "results": items
+    }, 200, NO_HEADERS
+
+
+# ============================================================================
+# 🎫 ОФЛАЙН-ТОКЕНЫ ДЛЯ СОВЕТНИКОВ
+# ============================================================================
+
+def license_token(license_key, account_number, client_ip=None):
+    """
+    Выдача подписанного токена: советник проверяет его локально
+    и обращается к API только для обновления (до token_expires_at)
+    """
+    if not tokens_enabled():
+        return {"error": "License tokens are not configured"}, 503, NO_HEADERS
+
+    try:
+        cached, known = lookup_verdict(license_key, account_number)
+    except Exception as e:
+        return verdict_error(e)
+
+    wait = rate_limiter.check(license_key if known else None, client_ip)
+    if wait:
+        return rate_limited(wait)
+
+    try:
+        if cached is not None:
+            payload, status, _ = cached
+        elif not known:
+            payload, status = rejected_verdict(license_key, account_number)
+        else:
+            payload, status, _ = load_verdict(license_key, account_number)
+    except Exception as e:
+        return verdict_error(e)
+
+    if not payload.get('valid'):
+        return verdict_body(payload), status, NO_HEADERS
+
+    token, token_exp = issue_token(
+        license_key,
+        account_number,
+        payload['plan_type'],
+        payload['expires_at'],
+        license_expires_ts=expires_timestamp(payload['expires_at'])
+    )
+
+    logger.debug("🎫 Выдан токен для %s (exp %s)", license_key, token_exp)
+
+    return dict(
+        payload,
+        token=token,
+        token_expires_at=datetime.fromtimestamp(token_exp).isoformat(),
+        token_ttl=max(0, token_exp - int(datetime.now().timestamp()))
+    ), 200, NO_HEADERS
+
+
+def revoked_licenses():
+    """
+    Список отозванных (деактивированных до истечения) ключей.
+    Советники с живым токеном сверяются с ним при обновлении.
+    """
+    try:
+        conn = get_db_connection()
+        rows = conn.execute('''
+            SELECT license_key, expires_at
+            FROM licenses
+            WHERE is_active = 0 AND expires_at > ?
+        ''', (datetime.now(),)).fetchall()
+
+        return {
+            "total": len(rows),
+            "revoked": [row['license_key'] for row in rows],
+            "max_token_ttl": LICENSE_TOKEN_TTL,
+            "timestamp": datetime.now().isoformat()
+        }, 200, NO_HEADERS
+
+    except Exception as e:
+        logger.error(f"Revocation list error: {e}")
+        return {"error": "Failed to get revocation list"}, 500, NO_HEADERS
+
+
+# ============================================================================
+# 🔧 АДМИНИСТРИРОВАНИЕ
+# ============================================================================
+#
+# Все /admin/* требуют заголовок X-Admin-Token со значением ADMIN_API_TOKEN.
+# Журнал изменений (/admin/license_changes) принимает и REPLICA_API_TOKEN:
+# репликам не нужен доступ к подтверждению оплат. Без настроенного токена
+# соответствующий доступ отключен (503), а не открыт всем.
+
+REPLICA_PATHS = ('/admin/license_changes',)
+
+
+def _token_matches(token, expected):
+    return bool(expected) and hmac.compare_digest(token.encode('utf-8'), expected.encode('utf-8'))
+
+
+def admin_denied(token, path=None):
+    """Проверка токена админа (или реплики для REPLICA_PATHS): None - доступ разрешен, иначе ответ с отказом"""
+    replica = path in REPLICA_PATHS
+    if not ADMIN_API_TOKEN and not (replica and REPLICA_API_TOKEN):
+        return {"error": "Admin API is not configured"}, 503, NO_HEADERS
+    if not token or not (_token_matches(token, ADMIN_API_TOKEN) or (replica and _token_matches(token, REPLICA_API_TOKEN))):
+        return {"error": "Unauthorized"}, 401, NO_HEADERS
+    return None
+
+
+def admin_licenses(args=None):
+    """Админ: Лицензии постранично (?limit=&cursor=&plan_type=&payment_verified=&telegram_user_id=&expires_after=&expires_before=)"""
+    args = args or {}
+    try:
+        query = license_listing.LicenseQuery.from_args(args)
+        limit = args.get('limit')
+        limit = license_listing.ADMIN_LICENSES_PAGE_SIZE if not limit else int(limit)
+        cursor = args.get('cursor')
+        after = license_listing.decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return {"error": f"Invalid query: {e}"}, 400, NO_HEADERS
+    limit = max(1, min(limit, license_listing.ADMIN_LICENSES_PAGE_MAX))
+
+    try:
+        rows, next_cursor = license_listing.fetch_page(get_db_connection(), query, limit, after)
+        licenses = [license_listing.row_to_dict(row) for row in rows]
+
+        return {
+            "total": len(licenses),
+            "next_cursor": next_cursor,
+            "licenses": licenses
+        }, 200, NO_HEADERS
+
+    except Exception as e:
+        logger.error(f"Admin licenses error: {e}")
+        return {"error": "Failed to get licenses"}, 500, NO_HEADERS
+
+
+def admin_licenses_export(args=None):
+    """Админ: Выгрузка лицензий NDJSON (те же фильтры); body - итератор кусков bytes"""
+    args = args or {}
+    try:
+        query = license_listing.LicenseQuery.from_args(args)
+        cursor = args.get('cursor')
+        after = license_listing.decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return {"error": f"Invalid query: {e}"}, 400, NO_HEADERS
+
+    return license_listing.iter_ndjson(query, after, DATABASE_PATH), 200, {"Content-Type": "application/x-ndjson"}
+
+
+# ============================================================================
+# 📜 ЖУРНАЛ ИЗМЕНЕНИЙ ЛИЦЕНЗИЙ
+# ============================================================================
+
+def apply_license_changes(rows):
+    """Обработчик ChangeFollower: сбросить вердикты измененных ключей (rows=None - весь кэш)"""
+    if rows is None:
+        license_cache.clear()
+        return
+    for row in rows:
+        license_cache.invalidate(row['license_key'])
+    # Ключи, выданные другим процессом, фильтр пропускает сразу
+    key_filter.note_inserted([row['license_key'] for row in rows if row['op'] == 'insert'], DATABASE_PATH)
+
+
+def _changes_cursor(args):
+    """since из запроса; ValueError если испорчен"""
+    return license_changes.parse_cursor((args or {}).get('since'))
+
+
+def cursor_expired_response(conn):
+    """410: курсор старше хранимого журнала - реплике нужна полная выгрузка /admin/licenses"""
+    return {
+        "error": "cursor_expired",
+        "message": "Changes after this cursor were pruned, resync from /admin/licenses",
+        "latest": license_changes.latest_version(conn)
+    }, 410, NO_HEADERS
+
+
+def admin_license_changes(args=None):
+    """Админ/реплики: журнал изменений после курсора (?since=&limit=)"""
+    args = args or {}
+    try:
+        since = _changes_cursor(args)
+        limit = args.get('limit')
+        limit = license_changes.LICENSE_CHANGES_PAGE_SIZE if not limit else int(limit)
+    except ValueError as e:
+        return {"error": f"Invalid query: {e}"}, 400, NO_HEADERS
+    limit = max(1, min(limit, license_changes.LICENSE_CHANGES_PAGE_MAX))
+
+    try:
+        conn = get_db_connection()
+        if license_changes.cursor_expired(conn, since):
+            return cursor_expired_response(conn)
+        rows, next_cursor, has_more = license_changes.fetch_changes(conn, since, limit)
+
+        return {
+            "total": len(rows),
+            "next_cursor": next_cursor,
+            "has_more": has_more,
+            "changes": [license_changes.change_to_dict(row) for row in rows]
+        }, 200, NO_HEADERS
+
+    except Exception as e:
+        logger.error(f"Admin license changes error: {e}")
+        return {"error": "Failed to get license changes"}, 500, NO_HEADERS
+
+
+def admin_license_changes_export(args=None):
+    """Админ/реплики: все изменения после курсора потоком NDJSON; body - итератор кусков bytes"""
+    try:
+        since = _changes_cursor(args)
+    except ValueError as e:
+        return {"error": f"Invalid query: {e}"}, 400, NO_HEADERS
+
+    try:
+        conn = get_db_connection()
+        if license_changes.cursor_expired(conn, since):
+            return cursor_expired_response(conn)
+    except Exception as e:
+        logger.error(f"Admin license changes error: {e}")
+        return {"error": "Failed to get license changes"}, 500, NO_HEADERS
+
+    return license_changes.iter_ndjson(since, DATABASE_PATH), 200, {"Content-Type": "application/x-ndjson"}
+
+
+def admin_verify_payment(license_key):
+    """Админ: Подтвердить оплату лицензии"""
+    try:
+        # Общий путь подтверждения: лицензия, платеж, чеки и сброс кэша
+        if not payment_proofs.confirm_payment(license_key, DATABASE_PATH):
+            return {"error": "License not found"}, 404, NO_HEADERS
+
+        logger.info(f"✅ Админ подтвердил оплату: {license_key}")
+
+        return {
+            "success": True,
+            "message": "Payment verified successfully",
+            "license_key": license_key
+        }, 200, NO_HEADERS
+
+    except Exception as e:
+        logger.error(f"Admin verify payment error: {e}")
+        return {"error": "Failed to verify payment"}, 500, NO_HEADERS
+
+
+def revoke_license(conn, license_key):
+    """Намерение записи: деактивировать лицензию до срока (0 - лицензии нет)"""
+    return conn.execute('''
+        UPDATE licenses SET is_active = 0 WHERE license_key = ?
+    ''', (license_key,)).rowcount
+
+
+def admin_revoke_license(license_key):
+    """Админ: Отозвать лицензию (попадает в /revoked_licenses, токены не выдаются)"""
+    try:
+        if not write(revoke_license, license_key):
+            return {"error": "License not found"}, 404, NO_HEADERS
+        # Поколение ключа растет: загрузка, начатая до отзыва, не вернет старый вердикт в кэш
+        license_cache.invalidate(license_key)
+
+        logger.info(f"⛔ Админ отозвал лицензию: {license_key}")
+
+        return {
+            "success": True,
+            "message": "License revoked successfully",
+            "license_key": license_key
+        }, 200, NO_HEADERS
+
+    except Exception as e:
+        logger.error(f"Admin revoke license error: {e}")
+        return {"error": "Failed to revoke license"}, 500, NO_HEADERS
+
+
+def admin_pending_payments(limit=None, cursor=None):
+    """Админ: очередь чеков на проверку (постранично, старые первыми)"""
+    try:
+        limit = payment_review.REVIEW_PAGE_SIZE if limit in (None, "") else int(limit)
+        after = payment_review.decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return {"error": "Invalid limit or cursor"}, 400, NO_HEADERS
+    limit = max(1, min(limit, payment_review.REVIEW_PAGE_MAX))
+
+    try:
+        rows, next_cursor = payment_review.pending_page(get_db_connection(), limit, after)
+
+        return {
+            "total": len(rows),
+            "next_cursor": next_cursor,
+            "proofs": [{
+                "proof_id": row['id'],
+                "license_key": row['license_key'],
+                "telegram_user_id": row['telegram_user_id'],
+                "file_id": row['file_id'],
+                "file_size": row['file_size'],
+                "submitted_at": row['created_at'],
+                "plan_type": row['plan_type'],
+                "expires_at": row['expires_at'],
+                "is_active": bool(row['is_active']),
+                "amount": row['amount'],
+                "payment_method": row['payment_method']
+            } for row in rows]
+        }, 200, NO_HEADERS
+
+    except Exception as e:
+        logger.error(f"Admin pending payments error: {e}")
+        return {"error": "Failed to get pending payments"}, 500, NO_HEADERS
+
+
+def parse_review_ids(data, name):
+    """Список id чеков из тела пакета решений"""
+    proof_ids = data.get(name, [])
+    if not isinstance(proof_ids, list) or not all(
+        isinstance(proof_id, int) and not isinstance(proof_id, bool) for proof_id in proof_ids
+    ):
+        raise ValueError(f"'{name}' must be a list of proof ids")
+    return proof_ids
+
+
+def admin_review_payments(data):
+    """
+    Админ: пакет решений по чекам одной транзакцией.
+    Тело: {"approve": [proof_id, ...], "reject": [proof_id, ...]}
+    """
+    try:
+        if not isinstance(data, dict):
+            raise ValueError("Expected {approve: [...], reject: [...]}")
+        approve = parse_review_ids(data, 'approve')
+        reject = parse_review_ids(data, 'reject')
+    except ValueError as e:
+        return {"error": str(e)}, 400, NO_HEADERS
+
+    if len(approve) + len(reject) > payment_review.REVIEW_BULK_MAX:
+        return {"error": f"Too many proofs in one request (max {payment_review.REVIEW_BULK_MAX})"}, 413, NO_HEADERS
+
+    try:
+        approved, rejected, skipped, paid = payment_review.apply_review(approve, reject, DATABASE_PATH)
+    except ValueError as e:
+        return {"error": str(e)}, 400, NO_HEADERS
+    except sqlite3.OperationalError as e:
+        logger.error(f"❌ БД недоступна при проверке оплат: {e}")
+        return {"error": "Database is busy, retry later"}, 503, {"Retry-After": "1"}
+    except Exception as e:
+        logger.error(f"Admin review payments error: {e}")
+        return {"error": "Failed to review payments"}, 500, NO_HEADERS
+
+    return {
+        "success": True,
+        "approved": approved,
+        "rejected": rejected,
+        "skipped": skipped,
+        "verified_licenses": paid
+    }, 200, NO_HEADERS
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import base64
+import logging
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# 🎫 ПОДПИСАННЫЕ ОФЛАЙН-ТОКЕНЫ ЛИЦЕНЗИЙ (ED25519)
+# ============================================================================
+#
+# API подписывает токен закрытым ключом, советник проверяет его открытым:
+# в советник зашит только открытый ключ, поэтому извлечь из него ключ для
+# выпуска токенов нельзя. Закрытый ключ одинаков у всех воркеров API.
+#
+# Пара ключей:  python license_tokens.py --generate-key
+# Без ключа выдача токенов отключена (/license_token отвечает 503).
+
+# Закрытый ключ: base64url 32 байт seed Ed25519
+LICENSE_TOKEN_PRIVATE_KEY = os.environ.get('LICENSE_TOKEN_PRIVATE_KEY', '')
+# Короткое время жизни токена - основной механизм отзыва
+LICENSE_TOKEN_TTL = int(os.environ.get('LICENSE_TOKEN_TTL', 3600))
+
+TOKEN_VERSION = 2
+
+
+class InvalidToken(ValueError):
+    """Токен поврежден, подделан или истек"""
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def load_private_key(value):
+    """Закрытый ключ из base64url seed (ValueError при неверном значении)"""
+    seed = _b64decode(value.strip())
+    if len(seed) != 32:
+        raise ValueError("LICENSE_TOKEN_PRIVATE_KEY must be a base64url-encoded 32-byte Ed25519 seed")
+    return Ed25519PrivateKey.from_private_bytes(seed)
+
+
+def load_public_key(value):
+    """Открытый ключ из base64url (32 байта, как зашит в советник)"""
+    return Ed25519PublicKey.from_public_bytes(_b64decode(value.strip()))
+
+
+def public_key_b64(private_key):
+    """Открытый ключ для советника: base64url 32 байт"""
+    return _b64encode(private_key.public_key().public_bytes(
+        serialization.Encoding.Raw, serialization.PublicFormat.Raw
+    ))
+
+
+# Неверный ключ - ошибка при старте, а не тихий откат на другой ключ
+_private_key = load_private_key(LICENSE_TOKEN_PRIVATE_KEY) if LICENSE_TOKEN_PRIVATE_KEY else None
+
+if _private_key is None:
+    logger.warning("⚠️ LICENSE_TOKEN_PRIVATE_KEY не задан - выдача офлайн-токенов отключена")
+
+
+def tokens_enabled():
+    """Настроен ли ключ подписи токенов"""
+    return _private_key is not None
+
+
+def issue_token(license_key, account_number, plan_type, expires_at, license_expires_ts=None,
+                ttl=LICENSE_TOKEN_TTL, private_key=None):
+    """
+    Выпуск токена: base64url(JSON).base64url(подпись Ed25519).
+    Токен живет ttl секунд, но не дольше самой лицензии.
+    Возвращает (token, token_exp_unix)
+    """
+    private_key = private_key or _private_key
+    if private_key is None:
+        raise RuntimeError("License token signing key is not configured")
+
+    now = int(time.time())
+    token_exp = now + ttl
+    if license_expires_ts is not None:
+        token_exp = min(token_exp, int(license_expires_ts))
+
+    claims = {
+        "v": TOKEN_VERSION,
+        "k": license_key,
+        "a": account_number,
+        "p": plan_type,
+        "e": str(expires_at),
+        "iat": now,
+        "exp": token_exp
+    }
+    body = _b64encode(json.dumps(claims, separators=(',', ':'), sort_keys=True).encode('utf-8'))
+    signature = _b64encode(private_key.sign(body.encode('ascii')))
+    return f"{body}.{signature}", token_exp
+
+
+def verify_token(token, account_number=None, public_key=None, now=None):
+    """Проверка подписи и срока действия (как в советнике); возвращает claims или бросает InvalidToken"""
+    if public_key is None:
+        if _private_key is None:
+            raise InvalidToken("no verification key")
+        public_key = _private_key.public_key()
+    try:
+        body, signature = token.split('.')
+        public_key.verify(_b64decode(signature), body.encode('ascii'))
+        claims = json.loads(_b64decode(body))
+    except InvalidSignature:
+        raise InvalidToken("bad signature")
+    except (ValueError, TypeError, AttributeError) as e:
+        raise InvalidToken(f"malformed token: {e}")
+
+    if claims.get('v') != TOKEN_VERSION:
+        raise InvalidToken("unsupported token version")
+    if claims.get('exp', 0) <= (now if now is not None else time.time()):
+        raise InvalidToken("token expired")
+    if account_number is not None and claims.get('a') != account_number:
+        raise InvalidToken("token is bound to different account")
+    return claims
+
+
+def main():
+    if sys.argv[1:] != ['--generate-key']:
+        sys.stderr.write("usage: python license_tokens.py --generate-key\n")
+        return 2
+    private_key = Ed25519PrivateKey.generate()
+    seed = private_key.private_bytes(
+        serialization.Encoding.Raw, serialization.PrivateFormat.Raw, serialization.NoEncryption()
+    )
+    sys.stdout.write(f"LICENSE_TOKEN_PRIVATE_KEY={_b64encode(seed)}\n")
+    sys.stdout.write(f"# Открытый ключ для советника: {public_key_b64(private_key)}\n")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
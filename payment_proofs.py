@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+import os
+import sys
+import asyncio
+import hashlib
+import logging
+import argparse
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+from db_writer import get_writer
+from license_cache import license_cache
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# 🧾 ПРИЕМ ЧЕКОВ ОБ ОПЛАТЕ: ЗАГРУЗКА В ПАМЯТЬ, ХЭШ, ДЕДУПЛИКАЦИЯ
+# ============================================================================
+#
+# Чек скачивается в BytesIO, хэшируется (sha256 содержимого) в отдельном
+# пуле потоков и записывается в payment_proofs (уникальный content_hash)
+# со статусом pending. Оплату чек не подтверждает: лицензия остается
+# неоплаченной, пока админ не одобрит чек (payment_review). Повторно
+# присланный тот же файл на проверку не попадает.
+#
+# Подтверждение оплаты - только через verify_payment / confirm_payment
+# (админ API, очередь проверки, бот): лицензия, платеж и чеки меняются в одной
+# транзакции, закэшированные вердикты сбрасывает forget_verdicts.
+#
+# Офлайн (без Telegram):  python payment_proofs.py <telegram_user_id> <license_key> <файл>
+
+PAYMENT_PROOF_WORKERS = int(os.environ.get('PAYMENT_PROOF_WORKERS', 2))
+PAYMENT_PROOF_MAX_BYTES = int(os.environ.get('PAYMENT_PROOF_MAX_BYTES', 10 * 1024 * 1024))
+
+# Статусы чека в payment_proofs
+PROOF_PENDING = 'pending'
+PROOF_APPROVED = 'approved'
+PROOF_REJECTED = 'rejected'
+
+# Исходы приема чека (accepted - чек записан и ждет проверки)
+ACCEPTED = 'accepted'
+DUPLICATE = 'duplicate'
+ALREADY_PAID = 'already_paid'
+UNKNOWN_LICENSE = 'unknown_license'
+TOO_LARGE = 'too_large'
+EMPTY = 'empty'
+
+_executor = None
+_executor_lock = threading.Lock()
+_counters = {}
+_counters_lock = threading.Lock()
+
+
+class ProofResult:
+    """Итог приема чека; duplicate_of - (telegram_user_id, license_key) первого отправителя"""
+    __slots__ = ('status', 'content_hash', 'license_key', 'duplicate_of')
+
+    def __init__(self, status, content_hash=None, license_key=None, duplicate_of=None):
+        self.status = status
+        self.content_hash = content_hash
+        self.license_key = license_key
+        self.duplicate_of = duplicate_of
+
+    @property
+    def accepted(self):
+        return self.status == ACCEPTED
+
+
+def get_executor():
+    """Пул потоков для хэширования и записи чеков (отдельно от пула БД бота)"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=PAYMENT_PROOF_WORKERS,
+                    thread_name_prefix='payment-proof'
+                )
+    return _executor
+
+
+def shutdown(wait=True):
+    """Остановить пул (при завершении бота)"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def content_hash(data):
+    """sha256 содержимого (hashlib отпускает GIL на больших буферах)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def verify_payment(conn, license_key):
+    """Намерение записи: оплата лицензии подтверждена (0 - лицензии нет)"""
+    updated = conn.execute('''
+        UPDATE licenses SET payment_verified = 1 WHERE license_key = ?
+    ''', (license_key,)).rowcount
+    if updated:
+        conn.execute('''
+            UPDATE payments SET verified = 1 WHERE license_key = ?
+        ''', (license_key,))
+        # Лицензия оплачена - ожидающие чеки по ней проверять больше не нужно
+        conn.execute('''
+            UPDATE payment_proofs SET status = ?, reviewed_at = CURRENT_TIMESTAMP
+            WHERE license_key = ? AND status = ?
+        ''', (PROOF_APPROVED, license_key, PROOF_PENDING))
+    return updated
+
+
+def forget_verdicts(license_keys):
+    """Сбросить закэшированные вердикты после решений по оплате"""
+    for license_key in license_keys:
+        license_cache.invalidate(license_key)
+
+
+def confirm_payment(license_key, path=db.DATABASE_PATH):
+    """Подтвердить оплату и сбросить кэш; False - лицензии нет"""
+    if not get_writer(path).execute(verify_payment, license_key):
+        return False
+    forget_verdicts([license_key])
+    logger.info(f"✅ Оплата подтверждена: {license_key}")
+    return True
+
+
+def _store_proof(conn, proof_hash, telegram_user_id, license_key, file_id, size):
+    """Намерение записи: дубликат? -> чек в очередь проверки"""
+    previous = conn.execute('''
+        SELECT telegram_user_id, license_key FROM payment_proofs WHERE content_hash = ?
+    ''', (proof_hash,)).fetchone()
+    if previous is not None:
+        return DUPLICATE, (previous['telegram_user_id'], previous['license_key'])
+
+    license_row = conn.execute('''
+        SELECT payment_verified FROM licenses WHERE license_key = ?
+    ''', (license_key,)).fetchone()
+    if license_row is None:
+        return UNKNOWN_LICENSE, None
+    if license_row['payment_verified']:
+        return ALREADY_PAID, None
+
+    conn.execute('''
+        INSERT INTO payment_proofs (content_hash, telegram_user_id, license_key, file_id, file_size)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (proof_hash, str(telegram_user_id), license_key, file_id, size))
+    return ACCEPTED, None
+
+
+def _count(status):
+    with _counters_lock:
+        _counters[status] = _counters.get(status, 0) + 1
+
+
+def ingest_bytes(data, telegram_user_id, license_key, file_id=None, path=db.DATABASE_PATH):
+    """Синхронный прием чека из байтов (bytes / memoryview / BytesIO)"""
+    if isinstance(data, BytesIO):
+        data = data.getbuffer()
+    size = len(data)
+    if size == 0:
+        _count(EMPTY)
+        return ProofResult(EMPTY, license_key=license_key)
+    if size > PAYMENT_PROOF_MAX_BYTES:
+        _count(TOO_LARGE)
+        return ProofResult(TOO_LARGE, license_key=license_key)
+
+    proof_hash = content_hash(data)
+    status, duplicate_of = get_writer(path).execute(
+        _store_proof, proof_hash, telegram_user_id, license_key, file_id, size
+    )
+    _count(status)
+    logger.info(f"🧾 Чек {proof_hash[:12]} от {telegram_user_id} для {license_key}: {status}")
+    return ProofResult(status, proof_hash, license_key, duplicate_of)
+
+
+async def download_to_memory(telegram_file):
+    """Скачать файл Telegram в BytesIO (без временных файлов на диске)"""
+    buffer = BytesIO()
+    await telegram_file.download_to_memory(buffer)
+    return buffer
+
+
+async def ingest_telegram_file(telegram_file, telegram_user_id, license_key, path=db.DATABASE_PATH):
+    """Скачать чек и отдать хэширование/запись в пул потоков"""
+    if telegram_file.file_size and telegram_file.file_size > PAYMENT_PROOF_MAX_BYTES:
+        _count(TOO_LARGE)
+        return ProofResult(TOO_LARGE, license_key=license_key)
+
+    buffer = await download_to_memory(telegram_file)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), ingest_bytes, buffer, telegram_user_id, license_key, telegram_file.file_id, path
+    )
+
+
+def stats():
+    """Счетчики исходов приема чеков"""
+    with _counters_lock:
+        return dict(_counters, workers=PAYMENT_PROOF_WORKERS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Офлайн-прием чеков об оплате из локальных файлов')
+    parser.add_argument('telegram_user_id')
+    parser.add_argument('license_key')
+    parser.add_argument('files', nargs='+')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db.init_schema(db.get_connection())
+    for file_path in args.files:
+        with open(file_path, 'rb') as f:
+            result = ingest_bytes(f.read(), args.telegram_user_id, args.license_key, file_id=os.path.basename(file_path))
+        print(f"{file_path}: {result.status} {result.content_hash or ''}")
+    get_writer().stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
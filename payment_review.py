@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+import os
+import logging
+
+import db
+from db_writer import get_writer
+from payment_proofs import PROOF_APPROVED, PROOF_PENDING, PROOF_REJECTED, forget_verdicts, verify_payment
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# 🗂️ ОЧЕРЕДЬ ПРОВЕРКИ ОПЛАТ ДЛЯ АДМИНА
+# ============================================================================
+#
+# Очередь - чеки со статусом pending из payment_proofs в порядке поступления,
+# по частичному индексу idx_pending_proofs (created_at, id): страница читается
+# без сортировки. Страницы - keyset по (created_at, id) чека: курсор
+# "created_at|id" последней строки.
+#
+# Решения принимаются по id чеков, пакет - одно намерение писателя, т.е. одна
+# транзакция на весь пакет:
+#   approve - чек одобрен, оплата лицензии подтверждена (payment_proofs.verify_payment,
+#             остальные ожидающие чеки той же лицензии одобряются вместе с ней);
+#   reject  - чек отклонен, лицензия остается неоплаченной: пользователь может
+#             прислать правильный чек.
+
+REVIEW_PAGE_SIZE = int(os.environ.get('REVIEW_PAGE_SIZE', 50))
+REVIEW_PAGE_MAX = int(os.environ.get('REVIEW_PAGE_MAX', 500))
+# Максимум чеков в одном пакете решений
+REVIEW_BULK_MAX = int(os.environ.get('REVIEW_BULK_MAX', 1000))
+# Чеков в одном IN (...) - с запасом ниже SQLITE_MAX_VARIABLE_NUMBER
+REVIEW_QUERY_CHUNK = 500
+
+
+def encode_cursor(row):
+    """Курсор страницы от последней строки"""
+    return f"{row['created_at']}|{row['id']}"
+
+
+def decode_cursor(cursor):
+    """Курсор -> (created_at, id); ValueError если курсор испорчен"""
+    created_at, _, proof_id = cursor.rpartition('|')
+    if not created_at:
+        raise ValueError("Invalid cursor")
+    return created_at, int(proof_id)
+
+
+def pending_page(conn, limit=REVIEW_PAGE_SIZE, after=None):
+    """Страница очереди: (строки, курсор следующей страницы или None)"""
+    # Берем на одну строку больше - так без COUNT(*) понятно, есть ли продолжение
+    params = [PROOF_PENDING]
+    where = 'p.status = ?'
+    if after is not None:
+        where += ' AND (p.created_at, p.id) > (?, ?)'
+        params.extend(after)
+    params.append(limit + 1)
+
+    rows = conn.execute(f'''
+        SELECT p.id, p.license_key, p.telegram_user_id, p.file_id, p.file_size, p.created_at,
+               l.plan_type, l.expires_at, l.is_active,
+               (SELECT pay.amount FROM payments pay WHERE pay.license_key = p.license_key ORDER BY pay.id LIMIT 1) AS amount,
+               (SELECT pay.payment_method FROM payments pay WHERE pay.license_key = p.license_key ORDER BY pay.id LIMIT 1) AS payment_method
+        FROM payment_proofs p
+        LEFT JOIN licenses l ON l.license_key = p.license_key
+        WHERE {where}
+        ORDER BY p.created_at, p.id
+        LIMIT ?
+    ''', params).fetchall()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def _pending_proofs(conn, proof_ids):
+    """Какие из чеков сейчас ждут проверки: {id чека: ключ лицензии}"""
+    pending = {}
+    for start in range(0, len(proof_ids), REVIEW_QUERY_CHUNK):
+        chunk = proof_ids[start:start + REVIEW_QUERY_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        pending.update((row[0], row[1]) for row in conn.execute(f'''
+            SELECT id, license_key FROM payment_proofs
+            WHERE id IN ({placeholders}) AND status = ?
+        ''', chunk + [PROOF_PENDING]))
+    return pending
+
+
+def _set_status(conn, proof_ids, status):
+    conn.executemany('''
+        UPDATE payment_proofs SET status = ?, reviewed_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND status = ?
+    ''', [(status, proof_id, PROOF_PENDING) for proof_id in proof_ids])
+
+
+def _apply_review(conn, approve, reject):
+    """Намерение записи: пакет решений; чеки вне очереди пропускаются"""
+    pending = _pending_proofs(conn, approve + reject)
+    approved = [proof_id for proof_id in approve if proof_id in pending]
+    rejected = [proof_id for proof_id in reject if proof_id in pending]
+
+    # Сначала отказы: одобрение лицензии ниже одобряет ее оставшиеся ожидающие чеки
+    _set_status(conn, rejected, PROOF_REJECTED)
+    paid = list(dict.fromkeys(pending[proof_id] for proof_id in approved))
+    for license_key in paid:
+        verify_payment(conn, license_key)
+    # Чек удаленной лицензии verify_payment не тронет - отмечаем явно
+    _set_status(conn, approved, PROOF_APPROVED)
+    return approved, rejected, paid
+
+
+def apply_review(approve, reject, path=db.DATABASE_PATH):
+    """Применить решения одной транзакцией и сбросить закэшированные вердикты"""
+    approve = list(dict.fromkeys(approve))
+    reject = list(dict.fromkeys(reject))
+    conflicting = set(approve) & set(reject)
+    if conflicting:
+        raise ValueError(f"Proofs both approved and rejected: {', '.join(map(str, sorted(conflicting)))}")
+
+    approved, rejected, paid = get_writer(path).execute(_apply_review, approve, reject)
+
+    forget_verdicts(paid)
+    logger.info(f"🗂️ Проверка оплат: одобрено чеков {len(approved)}, отклонено {len(rejected)}")
+
+    done = set(approved) | set(rejected)
+    skipped = [proof_id for proof_id in approve + reject if proof_id not in done]
+    return approved, rejected, skipped, paid
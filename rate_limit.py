@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+import os
+import math
+import time
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import db
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# 🚦 ОГРАНИЧЕНИЕ ЧАСТОТЫ ПРОВЕРОК: TOKEN BUCKET ПО КЛЮЧУ И ПО IP
+# ============================================================================
+#
+# У каждого ключа и каждого IP свое ведро: емкость BURST, пополнение RATE
+# токенов в секунду, одна проверка - один токен. Пустое ведро - ответ 429 с
+# Retry-After (через сколько секунд появится токен). Проверка одного ключа
+# списывает токены из ведра IP и ведра ключа вместе или не списывает ничего.
+# Ключ, отсеянный фильтром (key_filter), списывает только ведро IP: перебор
+# мусорных ключей не заводит ведро на каждый из них.
+#
+# По умолчанию включен только лимит по IP с запасом для фермы терминалов
+# (RATE_LIMIT_ENABLED=0 - выключить все лимиты). Лимит по ключу рассчитан на
+# частоту опроса советника и должен быть согласован с ней, поэтому
+# включается отдельно: RATE_LIMIT_KEY_ENABLED=1.
+#
+# Хранилище ведер (RATE_LIMIT_BACKEND):
+#   sqlite - (по умолчанию) отдельный файл RATE_LIMIT_DB_PATH, одна короткая
+#            транзакция на проверку: лимиты общие для всех воркеров gunicorn;
+#   memory - словарь в процессе (LRU на RATE_LIMIT_MAX_BUCKETS ведер): у
+#            каждого воркера свои ведра, т.е. фактический лимит в N раз выше.
+# Ошибка хранилища (БД занята) запрос не блокирует - считается в errors.
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+RATE_LIMIT_KEY_ENABLED = os.environ.get('RATE_LIMIT_KEY_ENABLED', '0') == '1'
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'sqlite')
+RATE_LIMIT_DB_PATH = os.environ.get('RATE_LIMIT_DB_PATH', 'rate_limits.db')
+# Проверок в секунду и запас на всплеск для одного ключа (советник в OnTick)
+RATE_LIMIT_KEY_RATE = float(os.environ.get('RATE_LIMIT_KEY_RATE', 1))
+RATE_LIMIT_KEY_BURST = float(os.environ.get('RATE_LIMIT_KEY_BURST', 30))
+# То же для одного IP (ферма терминалов за одним адресом)
+RATE_LIMIT_IP_RATE = float(os.environ.get('RATE_LIMIT_IP_RATE', 20))
+RATE_LIMIT_IP_BURST = float(os.environ.get('RATE_LIMIT_IP_BURST', 200))
+RATE_LIMIT_MAX_BUCKETS = int(os.environ.get('RATE_LIMIT_MAX_BUCKETS', 100000))
+# Сколько прокси перед приложением дописывают X-Forwarded-For (0 - не доверять заголовку)
+RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', 0))
+# Как часто sqlite-хранилище удаляет давно полные ведра
+RATE_LIMIT_CLEANUP_INTERVAL = float(os.environ.get('RATE_LIMIT_CLEANUP_INTERVAL', 60))
+
+# Ведер в одном IN (...) - с запасом ниже SQLITE_MAX_VARIABLE_NUMBER
+RATE_LIMIT_QUERY_CHUNK = 500
+
+
+def client_address(remote_addr, forwarded_for=None, trusted_proxies=RATE_LIMIT_TRUSTED_PROXIES):
+    """IP клиента: за доверенными прокси - адрес, который дописал ближайший из них"""
+    if trusted_proxies and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+        if len(hops) >= trusted_proxies:
+            return hops[-trusted_proxies]
+    return remote_addr
+
+
+def _drain(state, rate, burst, now):
+    """
+    Списать токен из ведра (tokens, updated): (новое состояние, ожидание).
+    Ожидание 0 - токен списан; иначе через сколько секунд он появится
+    """
+    if state is None:
+        tokens = burst
+    else:
+        tokens, updated = state
+        tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) / rate
+
+
+def _take(states, requests, now, all_or_nothing):
+    """
+    Общая логика хранилищ: requests - [(ведро, rate, burst)], states - {ведро: состояние}.
+    Возвращает (ожидания по requests, {ведро: новое состояние} для записи)
+    """
+    waits = []
+    updates = {}
+    for bucket, rate, burst in requests:
+        state, wait = _drain(updates.get(bucket, states.get(bucket)), rate, burst, now)
+        waits.append(wait)
+        if not wait:
+            updates[bucket] = state
+    if all_or_nothing and any(waits):
+        updates = {}
+    return waits, updates
+
+
+class MemoryBuckets:
+    """Ведра в памяти процесса (у каждого воркера свои)"""
+    blocking = False
+
+    def __init__(self, max_size=RATE_LIMIT_MAX_BUCKETS):
+        self.max_size = max_size
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, requests, now, all_or_nothing=True):
+        with self._lock:
+            buckets = self._buckets
+            waits, updates = _take(buckets, requests, now, all_or_nothing)
+            for bucket, state in updates.items():
+                buckets[bucket] = state
+                buckets.move_to_end(bucket)
+            # Вытесненное ведро начнется заново полным - лимит только мягче
+            while len(buckets) > self.max_size:
+                buckets.popitem(last=False)
+        return waits
+
+    def stats(self):
+        return {"backend": "memory", "buckets": len(self._buckets)}
+
+
+class SqliteBuckets:
+    """Ведра в отдельном файле SQLite, общем для всех процессов"""
+    blocking = True
+
+    def __init__(self, path=RATE_LIMIT_DB_PATH, idle_ttl=None):
+        self.path = path
+        # Ведро, не трогавшееся дольше idle_ttl, уже полное - строку можно удалить
+        self.idle_ttl = idle_ttl
+        self._schema_ready = False
+        self._cleaned_at = 0.0
+
+    def _connection(self):
+        conn = db.get_connection(self.path)
+        if not self._schema_ready:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                    bucket TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            conn.commit()
+            self._schema_ready = True
+        return conn
+
+    def take(self, requests, now, all_or_nothing=True):
+        conn = self._connection()
+        buckets = list({bucket for bucket, _, _ in requests})
+        # IMMEDIATE: чтение и запись ведер - без гонки с другими воркерами
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            states = {}
+            for start in range(0, len(buckets), RATE_LIMIT_QUERY_CHUNK):
+                chunk = buckets[start:start + RATE_LIMIT_QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                states.update((row[0], (row[1], row[2])) for row in conn.execute(
+                    f'SELECT bucket, tokens, updated FROM rate_buckets WHERE bucket IN ({placeholders})', chunk
+                ))
+
+            waits, updates = _take(states, requests, now, all_or_nothing)
+            conn.executemany('''
+                INSERT INTO rate_buckets (bucket, tokens, updated) VALUES (?, ?, ?)
+                ON CONFLICT(bucket) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated
+            ''', [(bucket, tokens, updated) for bucket, (tokens, updated) in updates.items()])
+
+            if self.idle_ttl and now - self._cleaned_at >= RATE_LIMIT_CLEANUP_INTERVAL:
+                conn.execute('DELETE FROM rate_buckets WHERE updated < ?', (now - self.idle_ttl,))
+                self._cleaned_at = now
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return waits
+
+    def stats(self):
+        return {"backend": "sqlite", "path": self.path}
+
+
+class RateLimiter:
+    """Лимиты проверок по ключу и по IP поверх одного хранилища ведер"""
+
+    def __init__(self, backend, key_rate=RATE_LIMIT_KEY_RATE, key_burst=RATE_LIMIT_KEY_BURST,
+                 ip_rate=RATE_LIMIT_IP_RATE, ip_burst=RATE_LIMIT_IP_BURST, enabled=RATE_LIMIT_ENABLED,
+                 key_enabled=RATE_LIMIT_KEY_ENABLED):
+        self.backend = backend
+        self.key_rate = key_rate
+        self.key_burst = key_burst
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.enabled = enabled
+        self.key_enabled = key_enabled
+        self._lock = threading.Lock()
+
+        # Метрики
+        self.allowed = 0
+        self.throttled_key = 0
+        self.throttled_ip = 0
+        self.errors = 0
+
+    @property
+    def blocking(self):
+        """Проверка ходит в БД - из event loop ее вызывать нельзя"""
+        return self.enabled and self.backend.blocking
+
+    def _key_request(self, license_key):
+        return f"key:{license_key}", self.key_rate, self.key_burst
+
+    def _ip_request(self, client_ip):
+        return f"ip:{client_ip}", self.ip_rate, self.ip_burst
+
+    def _take(self, requests, all_or_nothing=True):
+        try:
+            return self.backend.take(requests, time.time(), all_or_nothing)
+        except sqlite3.OperationalError as e:
+            # Хранилище лимитов не должно ронять проверку лицензий
+            with self._lock:
+                self.errors += 1
+            logger.warning(f"⚠️ Хранилище лимитов недоступно: {e}")
+            return [0.0] * len(requests)
+
+    def check(self, license_key, client_ip=None):
+        """
+        Проверка одного ключа: 0 - можно, иначе секунды до следующей попытки.
+        license_key=None - ключ отсеян фильтром: списывается только ведро IP
+        """
+        if not self.enabled:
+            return 0.0
+        requests = []
+        key_limited = license_key is not None and self.key_enabled
+        if key_limited:
+            requests.append(self._key_request(license_key))
+        if client_ip:
+            requests.append(self._ip_request(client_ip))
+        if not requests:
+            return 0.0
+        waits = self._take(requests)
+
+        with self._lock:
+            if not any(waits):
+                self.allowed += 1
+            else:
+                self.throttled_key += key_limited and waits[0] > 0
+                self.throttled_ip += bool(client_ip) and waits[-1] > 0
+        return max(waits)
+
+    def check_batch(self, license_keys, client_ip=None):
+        """
+        Пакетная проверка: (ожидание для всего запроса по IP, {ключ: ожидание} для
+        ключей сверх лимита). Пакет - один запрос для IP и по токену на каждый ключ
+        """
+        if not self.enabled:
+            return 0.0, {}
+        if client_ip:
+            wait = self._take([self._ip_request(client_ip)])[0]
+            if wait:
+                with self._lock:
+                    self.throttled_ip += 1
+                return wait, {}
+
+        license_keys = list(dict.fromkeys(license_keys))
+        if not self.key_enabled:
+            with self._lock:
+                self.allowed += len(license_keys)
+            return 0.0, {}
+        waits = self._take([self._key_request(license_key) for license_key in license_keys], all_or_nothing=False)
+        throttled = {license_key: wait for license_key, wait in zip(license_keys, waits) if wait}
+        with self._lock:
+            self.allowed += len(license_keys) - len(throttled)
+            self.throttled_key += len(throttled)
+        return 0.0, throttled
+
+    def stats(self):
+        body = {
+            "enabled": self.enabled,
+            "key_limit": {"enabled": self.key_enabled, "rate": self.key_rate, "burst": self.key_burst},
+            "ip_limit": {"rate": self.ip_rate, "burst": self.ip_burst},
+            "allowed": self.allowed,
+            "throttled_key": self.throttled_key,
+            "throttled_ip": self.throttled_ip,
+            "errors": self.errors
+        }
+        body.update(self.backend.stats())
+        return body
+
+
+def retry_after_header(wait):
+    """Retry-After в целых секундах (не меньше 1)"""
+    return str(max(1, math.ceil(wait)))
+
+
+def _create_backend(name=RATE_LIMIT_BACKEND):
+    if name == 'sqlite':
+        idle_ttl = max(RATE_LIMIT_KEY_BURST / RATE_LIMIT_KEY_RATE, RATE_LIMIT_IP_BURST / RATE_LIMIT_IP_RATE)
+        return SqliteBuckets(RATE_LIMIT_DB_PATH, idle_ttl)
+    if name != 'memory':
+        logger.warning(f"⚠️ Неизвестный RATE_LIMIT_BACKEND={name}, используется memory")
+    return MemoryBuckets()
+
+
+# Глобальный ограничитель процесса
+rate_limiter = RateLimiter(_create_backend())
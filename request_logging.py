@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+# ============================================================================
+# 📝 СТРУКТУРИРОВАННЫЙ ЛОГ ПРОВЕРОК ЛИЦЕНЗИЙ (JSON, СЭМПЛИРОВАНИЕ, ОЧЕРЕДЬ)
+# ============================================================================
+
+# Доля успешных проверок, попадающих в лог (ошибки логируются всегда)
+REQUEST_LOG_SAMPLE_RATE = float(os.environ.get('REQUEST_LOG_SAMPLE_RATE', 0.01))
+
+request_logger = logging.getLogger('license_requests')
+
+_listener = None
+_listener_pid = None
+_setup_lock = threading.Lock()
+
+logged = 0
+sampled_out = 0
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна строка JSON на запись; сериализация идет в потоке QueueListener"""
+
+    def format(self, record):
+        data = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage()
+        }
+        payload = getattr(record, 'payload', None)
+        if payload:
+            data.update(payload)
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class RawQueueHandler(QueueHandler):
+    """
+    В очередь уходит сама запись: стандартный prepare() форматирует ее в потоке
+    запроса (getMessage, traceback), а JSON собирает JsonFormatter в слушателе
+    """
+
+    def prepare(self, record):
+        # Фиксируем только текст: args могут измениться, пока запись в очереди
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def setup_request_logging(stream=None):
+    """Подключить QueueHandler -> QueueListener: поток запроса не ждет ввода-вывода"""
+    global _listener, _listener_pid
+    with _setup_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            return
+        # После fork поток слушателя родителя недоступен - создаем свой
+        for handler in list(request_logger.handlers):
+            request_logger.removeHandler(handler)
+
+        log_queue = queue.SimpleQueue()
+        stream_handler = logging.StreamHandler(stream or sys.stdout)
+        stream_handler.setFormatter(JsonFormatter())
+
+        _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        _listener_pid = os.getpid()
+        atexit.register(_listener.stop)
+
+        request_logger.addHandler(RawQueueHandler(log_queue))
+        request_logger.setLevel(logging.INFO)
+        request_logger.propagate = False
+
+
+def log_verdict(license_key, account_number, payload, status, duration_ms, cached=False, client_ip=None):
+    """Одна запись на проверку: успешные - по сэмплу, отказы - всегда"""
+    global logged, sampled_out
+    valid = payload.get('valid', False)
+    if valid and REQUEST_LOG_SAMPLE_RATE < 1 and random.random() >= REQUEST_LOG_SAMPLE_RATE:
+        sampled_out += 1
+        return
+
+    logged += 1
+    # Формирование строки откладывается до потока слушателя
+    request_logger.log(
+        logging.INFO if valid else logging.WARNING,
+        "license_check",
+        extra={"payload": {
+            "license_key": license_key,
+            "account_number": account_number,
+            "valid": valid,
+            "reason": payload.get('reason'),
+            "status": status,
+            "cached": cached,
+            "duration_ms": round(duration_ms, 3),
+            "client_ip": client_ip,
+            "sample_rate": REQUEST_LOG_SAMPLE_RATE if valid else 1.0
+        }}
+    )
+
+
+def stats():
+    """Счетчики записей лога"""
+    return {
+        "sample_rate": REQUEST_LOG_SAMPLE_RATE,
+        "logged": logged,
+        "sampled_out": sampled_out
+    }
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+
+import db
+from db_writer import get_writer
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# 📊 СЧЕТЧИКИ СТАТИСТИКИ: ЧТЕНИЕ И ПЕРИОДИЧЕСКАЯ СВЕРКА
+# ============================================================================
+#
+# Таблицу license_stats ведут триггеры (db.init_stats_schema) и планировщик
+# истечения (expired_licenses), /stats читает ее одним запросом. Сверка
+# подтягивает счетчики к полному пересчету: expired_licenses (лицензии,
+# которые планировщик не деактивировал) и расхождения, если строки licenses
+# правили в обход триггеров.
+#
+# Подсчет - полное сканирование в транзакции чтения, без очереди писателя:
+# хранимые и посчитанные значения берутся из одного снимка. Писатель получает
+# только поправки value = value + (посчитано - хранилось), поэтому записи,
+# прошедшие между снимком и поправкой, не теряются. Поток сверки запускают
+# приложения при старте (main.py, asgi_app.py).
+
+STATS_RECONCILE_INTERVAL = float(os.environ.get('STATS_RECONCILE_INTERVAL', 600))
+
+_reconciler = None
+_reconciler_pid = None
+_reconciler_lock = threading.Lock()
+
+reconciled_at = None
+reconciliations = 0
+drift_corrections = 0
+
+
+def read_stats(conn):
+    """Текущие значения счетчиков: {name: value}"""
+    rows = conn.execute('SELECT name, value FROM license_stats').fetchall()
+    counters = dict.fromkeys(db.STATS_COUNTERS, 0)
+    counters.update((row[0], row[1]) for row in rows)
+    return counters
+
+
+def count_stats(conn, now):
+    """Хранимые и посчитанные по licenses значения из одного снимка: ({name: value}, {name: value})"""
+    conn.execute('BEGIN')
+    try:
+        stored = read_stats(conn)
+        counted = dict(conn.execute(db.STATS_COUNT_SQL, (now,)).fetchall())
+    finally:
+        conn.rollback()
+    return stored, counted
+
+
+def _apply_corrections(conn, corrections):
+    """Намерение записи: сдвиг счетчиков на поправки {name: delta}"""
+    conn.executemany('''
+        INSERT OR IGNORE INTO license_stats (name, value) VALUES (?, 0)
+    ''', [(name,) for name in corrections])
+    conn.executemany('''
+        UPDATE license_stats SET value = value + ? WHERE name = ?
+    ''', [(delta, name) for name, delta in corrections.items()])
+
+
+def reconcile_stats(path=db.DATABASE_PATH):
+    """Сверка счетчиков: подсчет в транзакции чтения, в писатель - только поправки"""
+    global reconciled_at, reconciliations, drift_corrections
+    stored, counted = count_stats(db.get_connection(path), datetime.now())
+    drift = {name: (stored[name], counted[name]) for name in counted if stored[name] != counted[name]}
+    if drift:
+        get_writer(path).execute(_apply_corrections, {
+            name: after - before for name, (before, after) in drift.items()
+        })
+    reconciled_at = datetime.now()
+    reconciliations += 1
+
+    # expired_licenses меняется со временем - это не расхождение
+    corrected = {name: values for name, values in drift.items() if name != 'expired_licenses'}
+    if corrected:
+        drift_corrections += len(corrected)
+        logger.warning(f"📊 Счетчики статистики исправлены сверкой: {corrected}")
+    return drift
+
+
+def _reconcile_loop(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            reconcile_stats(path)
+        except Exception as e:
+            logger.error(f"❌ Ошибка сверки счетчиков: {e}")
+
+
+def start_reconciler(path=db.DATABASE_PATH, interval=STATS_RECONCILE_INTERVAL):
+    """Фоновый поток сверки (один на процесс; повторный вызов ничего не делает)"""
+    global _reconciler, _reconciler_pid
+    if interval <= 0:
+        return
+    with _reconciler_lock:
+        if _reconciler is not None and _reconciler_pid == os.getpid():
+            return
+        # Первая сверка сразу: expired_licenses актуален с момента старта
+        try:
+            reconcile_stats(path)
+        except Exception as e:
+            logger.error(f"❌ Ошибка сверки счетчиков: {e}")
+        _reconciler = threading.Thread(
+            target=_reconcile_loop, args=(path, interval), name='stats-reconciler', daemon=True
+        )
+        _reconciler.start()
+        _reconciler_pid = os.getpid()
+
+
+def stats():
+    """Счетчики сверки для /metrics"""
+    return {
+        "reconcile_interval": STATS_RECONCILE_INTERVAL,
+        "reconciliations": reconciliations,
+        "drift_corrections": drift_corrections,
+        "reconciled_at": reconciled_at.isoformat() if reconciled_at else None
+    }
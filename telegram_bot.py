@@ -1,13 +1,19 @@
 #!/usr/bin/env python3
 import os
-import sqlite3
 import logging
-import aiohttp
 import asyncio
-import hashlib
-import time
 from datetime import datetime, timedelta
-from io import BytesIO
+
+from db import DATABASE_PATH, get_connection, init_schema
+from async_db import run_db, shutdown as shutdown_db_executor
+from db_writer import write
+from license_cache import license_cache
+from user_repository import parse_db_datetime, user_repository
+import payment_proofs
+import expiry_scheduler
+import license_keys
+import key_filter
+import license_changes
 
 # Настройка логирования
 logging.basicConfig(
@@ -17,9 +23,12 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 try:
-    from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+    from telegram import Update
     from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
     from telegram.constants import ParseMode
+    from telegram.error import BadRequest, Forbidden
+    from update_processor import PerUserUpdateProcessor
+    from bot_templates import BotTemplates
 except ImportError:
     logger.error("Telegram библиотека не установлена! Установите: pip install python-telegram-bot")
     exit(1)
@@ -52,6 +61,21 @@ PAYMENT_CARDS = {
 TRIAL_DAYS = 3
 MONTHLY_PRICE = 100  # USD
 
+# Клавиатуры и тексты собираются один раз при старте
+templates = BotTemplates(PAYMENT_CARDS, MONTHLY_PRICE)
+
+# Лицензий на одной странице "Мои лицензии"
+LICENSES_PAGE_SIZE = int(os.environ.get('BOT_LICENSES_PAGE_SIZE', 5))
+
+# Режим получения обновлений: polling (по умолчанию) или webhook (см. bot_webhook.py)
+BOT_MODE = os.environ.get('BOT_MODE', 'polling')
+# Сколько обновлений разных пользователей обрабатывается одновременно (1 - строго последовательно)
+BOT_CONCURRENT_UPDATES = int(os.environ.get('BOT_CONCURRENT_UPDATES', 1))
+# Альтернативный Bot API (локальный сервер или фейк для офлайн-тестов)
+BOT_API_BASE_URL = os.environ.get('BOT_API_BASE_URL', '').rstrip('/')
+# Как часто проверять новые уведомления об истечении лицензий (секунды)
+BOT_NOTICE_INTERVAL = float(os.environ.get('BOT_NOTICE_INTERVAL', 30))
+
 # ============================================================================
 # 🔧 ТОЛЬКО ДОБАВЛЯЕМ ФУНКЦИИ БД - ОСТАЛЬНОЕ НЕ ТРОГАЕМ
 # ============================================================================
@@ -59,89 +83,53 @@ MONTHLY_PRICE = 100  # USD
 def init_database():
     """ТОЛЬКО для синхронизации с API - остальная логика не меняется"""
     try:
-        conn = sqlite3.connect('license_system.db')
-        cursor = conn.cursor()
-        
-        # Создаем таблицы (для совместимости с API)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS licenses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                license_key TEXT UNIQUE NOT NULL,
-                account_number TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                expires_at DATETIME NOT NULL,
-                is_active BOOLEAN DEFAULT 1,
-                plan_type TEXT NOT NULL,
-                telegram_user_id TEXT,
-                payment_verified BOOLEAN DEFAULT 0
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_user_id TEXT UNIQUE NOT NULL,
-                username TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                total_licenses INTEGER DEFAULT 0
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS payments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_user_id TEXT NOT NULL,
-                license_key TEXT NOT NULL,
-                amount REAL NOT NULL,
-                plan_type TEXT NOT NULL,
-                payment_method TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                verified BOOLEAN DEFAULT 0
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        # Единая схема с API (таблицы + индексы)
+        init_schema(get_connection())
         logger.info("✅ База данных инициализирована (для API совместимости)")
         
     except Exception as e:
         logger.error(f"❌ Ошибка инициализации БД: {e}")
 
+def _insert_license(conn, license_key, plan_type, telegram_user_id, expires_at, payment_verified, amount):
+    """Намерение записи: новая лицензия + пользователь + платеж"""
+    conn.execute('''
+        INSERT INTO licenses (license_key, plan_type, telegram_user_id, expires_at, is_active, payment_verified)
+        VALUES (?, ?, ?, ?, 1, ?)
+    ''', (license_key, plan_type, str(telegram_user_id), expires_at, payment_verified))
+    _record_license_owner(conn, license_key, plan_type, telegram_user_id, payment_verified, amount)
+
+def _record_license_owner(conn, license_key, plan_type, telegram_user_id, payment_verified, amount):
+    """Часть намерения записи после вставки лицензии: пользователь + платеж"""
+    conn.execute('''
+        INSERT OR IGNORE INTO users (telegram_user_id, username, total_licenses)
+        VALUES (?, ?, 0)
+    ''', (str(telegram_user_id), ""))
+    
+    conn.execute('''
+        UPDATE users SET total_licenses = total_licenses + 1 
+        WHERE telegram_user_id = ?
+    ''', (str(telegram_user_id),))
+    
+    if amount > 0:
+        conn.execute('''
+            INSERT INTO payments (telegram_user_id, license_key, amount, plan_type, verified)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (str(telegram_user_id), license_key, amount, plan_type, payment_verified))
+
 def save_license_to_db(license_key, plan_type, telegram_user_id, days, amount=0):
     """ТОЛЬКО сохранение в БД для API совместимости"""
     try:
-        conn = sqlite3.connect('license_system.db')
-        cursor = conn.cursor()
-        
         expires_at = datetime.now() + timedelta(days=days)
         
         # Определяем статус оплаты (триал автоматически подтвержден)
         payment_verified = 1 if plan_type == "trial" else 0
         
-        cursor.execute('''
-            INSERT INTO licenses (license_key, plan_type, telegram_user_id, expires_at, is_active, payment_verified)
-            VALUES (?, ?, ?, ?, 1, ?)
-        ''', (license_key, plan_type, str(telegram_user_id), expires_at, payment_verified))
-        
-        cursor.execute('''
-            INSERT OR IGNORE INTO users (telegram_user_id, username, total_licenses)
-            VALUES (?, ?, 0)
-        ''', (str(telegram_user_id), ""))
-        
-        cursor.execute('''
-            UPDATE users SET total_licenses = total_licenses + 1 
-            WHERE telegram_user_id = ?
-        ''', (str(telegram_user_id),))
-        
-        if amount > 0:
-            cursor.execute('''
-                INSERT INTO payments (telegram_user_id, license_key, amount, plan_type, verified)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (str(telegram_user_id), license_key, amount, plan_type, payment_verified))
-        
-        conn.commit()
-        conn.close()
+        # Запись через единственного писателя (групповой коммит)
+        write(_insert_license, license_key, plan_type, telegram_user_id, expires_at, payment_verified, amount)
         
+        # Сбрасываем закэшированный "key_not_found" и отсев фильтра (если API в этом же процессе)
+        license_cache.invalidate(license_key)
+        key_filter.note_inserted([license_key])
         logger.info(f"✅ Лицензия сохранена в БД: {license_key}")
         return True
         
@@ -149,116 +137,115 @@ def save_license_to_db(license_key, plan_type, telegram_user_id, days, amount=0)
         logger.error(f"❌ Ошибка сохранения в БД: {e}")
         return False
 
-def verify_payment_in_db(license_key):
-    """ТОЛЬКО подтверждение оплаты в БД"""
+def _insert_trial_license(conn, license_key, telegram_user_id, expires_at):
+    """Намерение записи: триал, если пользователь его еще не получал (проверка - в самом INSERT)"""
+    inserted = conn.execute('''
+        INSERT INTO licenses (license_key, plan_type, telegram_user_id, expires_at, is_active, payment_verified)
+        SELECT ?, 'trial', ?, ?, 1, 1
+        WHERE NOT EXISTS (
+            SELECT 1 FROM licenses WHERE telegram_user_id = ? AND plan_type = 'trial'
+        )
+    ''', (license_key, str(telegram_user_id), expires_at, str(telegram_user_id))).rowcount
+    if not inserted:
+        return False
+    
+    _record_license_owner(conn, license_key, "trial", telegram_user_id, 1, 0)
+    return True
+
+def save_trial_license(license_key, telegram_user_id, expires_at):
+    """
+    Выдача триала без гонок: INSERT ... WHERE NOT EXISTS в транзакции писателя,
+    уникальный индекс idx_one_trial_per_user - страховка.
+    True - выдан, False - уже использован, None - ошибка БД.
+    """
     try:
-        conn = sqlite3.connect('license_system.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE licenses SET payment_verified = 1 WHERE license_key = ?
-        ''', (license_key,))
-        
-        cursor.execute('''
-            UPDATE payments SET verified = 1 WHERE license_key = ?
-        ''', (license_key,))
-        
-        conn.commit()
-        conn.close()
-        
-        logger.info(f"✅ Оплата подтверждена в БД: {license_key}")
-        return True
-        
+        created = write(_insert_trial_license, license_key, telegram_user_id, expires_at)
     except Exception as e:
-        logger.error(f"❌ Ошибка подтверждения оплаты: {e}")
-        return False
+        logger.error(f"❌ Ошибка сохранения триала в БД: {e}")
+        return None
+    
+    # Триал есть в БД в любом случае - запоминаем в записи пользователя
+    user_repository.mark_trial(telegram_user_id)
+    if created:
+        license_cache.invalidate(license_key)
+        key_filter.note_inserted([license_key])
+        logger.info(f"✅ Триал сохранен в БД: {license_key}")
+    return created
 
-def get_user_licenses_from_db(telegram_user_id):
-    """ТОЛЬКО получение из БД для совместимости"""
+def get_user_licenses_from_db(telegram_user_id, limit=None, before=None, after=None):
+    """
+    Лицензии пользователя, новые первыми (индекс idx_user_created).
+    before/after - курсор (created_at, id): страница старше / новее курсора.
+    """
     try:
-        conn = sqlite3.connect('license_system.db')
-        cursor = conn.cursor()
+        conn = get_connection()
         
-        cursor.execute('''
-            SELECT license_key, plan_type, created_at, expires_at, is_active, payment_verified
-            FROM licenses 
-            WHERE telegram_user_id = ?
-            ORDER BY created_at DESC
-        ''', (str(telegram_user_id),))
+        params = [str(telegram_user_id)]
+        where = "telegram_user_id = ?"
+        order = "DESC"
+        if before is not None:
+            where += " AND (created_at, id) < (?, ?)"
+            params.extend(before)
+        elif after is not None:
+            # Идем вверх от курсора, потом разворачиваем
+            where += " AND (created_at, id) > (?, ?)"
+            params.extend(after)
+            order = "ASC"
         
-        licenses = cursor.fetchall()
-        conn.close()
+        query = f'''
+            SELECT id, license_key, plan_type, created_at, expires_at, is_active, payment_verified
+            FROM licenses 
+            WHERE {where}
+            ORDER BY created_at {order}, id {order}
+        '''
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
         
+        licenses = conn.execute(query, params).fetchall()
+        if order == "ASC":
+            licenses.reverse()
         return licenses
         
     except Exception as e:
         logger.error(f"❌ Ошибка получения лицензий: {e}")
         return []
 
+def get_user_licenses_page(telegram_user_id, before=None, after=None, page_size=None):
+    """Одна страница "Мои лицензии": (строки, есть_новее, есть_старее)"""
+    page_size = page_size or LICENSES_PAGE_SIZE
+    # Лишняя строка показывает, есть ли еще страница в этом направлении
+    rows = get_user_licenses_from_db(telegram_user_id, limit=page_size + 1, before=before, after=after)
+    more = len(rows) > page_size
+    if after is not None:
+        rows = rows[-page_size:] if more else rows
+        return rows, more, True
+    return rows[:page_size], before is not None, more
+
 # ============================================================================
 # ОРИГИНАЛЬНАЯ ЛОГИКА (БЕЗ ИЗМЕНЕНИЙ!)
 # ============================================================================
 
-# Хранилище данных пользователей (ОРИГИНАЛЬНОЕ!)
-users_data = {}
-
 def generate_license_key():
-    """ОРИГИНАЛЬНАЯ функция генерации ключа"""
-    timestamp = str(int(time.time()))[-6:]
-    random_part = hashlib.md5(os.urandom(32)).hexdigest()[:12].upper()
-    
-    key_parts = [
-        "RFX",
-        random_part[:4],
-        random_part[4:8], 
-        random_part[8:12],
-        timestamp[:3],
-        timestamp[3:5]
-    ]
-    
-    return "-".join(key_parts)
+    """Новый ключ из пула (CSPRNG + контрольная сумма, уникальность уже проверена по БД)"""
+    return license_keys.get_pool().take()
 
 def has_trial_license(user_id):
-    """ОРИГИНАЛЬНАЯ проверка триала"""
-    if user_id in users_data:
-        for license_data in users_data[user_id].get('licenses', []):
-            if license_data.get('type') == 'trial':
-                return True
-    return False
+    """Проверка триала (индексированный запрос / кэш записи пользователя)"""
+    return user_repository.has_trial(user_id)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """ОРИГИНАЛЬНАЯ команда /start"""
     user = update.effective_user
     user_id = user.id
     
-    # Инициализируем пользователя если нужно
-    if user_id not in users_data:
-        users_data[user_id] = {
-            'username': user.username or user.first_name,
-            'licenses': [],
-            'payments': []
-        }
-    
-    keyboard = [
-        [InlineKeyboardButton("🆓 Получить триал (3 дня бесплатно)", callback_data="trial")],
-        [InlineKeyboardButton("💳 Купить лицензию ($100/месяц)", callback_data="buy_license")],
-        [InlineKeyboardButton("📋 Мои лицензии", callback_data="my_licenses")],
-        [InlineKeyboardButton("💰 Подтвердить оплату", callback_data="verify_payment")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Регистрируем пользователя в БД (для известных - ответ из кэша записей)
+    await run_db(user_repository.ensure_user, user_id, user.username or user.first_name)
     
     await update.message.reply_text(
-        f"🤖 <b>Добро пожаловать в RFX Trading License Bot!</b>\n\n"
-        f"👋 Привет, {user.first_name}!\n\n"
-        f"🔐 <b>Система лицензирования торгового советника MT5</b>\n\n"
-        f"📋 <b>Доступные опции:</b>\n"
-        f"• 🆓 <b>Триал период:</b> 3 дня бесплатно\n"
-        f"• 💳 <b>Месячная лицензия:</b> $100 USD\n"
-        f"• 📋 Просмотр активных лицензий\n"
-        f"• 💰 Подтверждение оплаты\n\n"
-        f"<i>Выберите действие:</i>",
+        templates.welcome_text(user.first_name),
         parse_mode=ParseMode.HTML,
-        reply_markup=reply_markup
+        reply_markup=templates.main_menu_markup
     )
 
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -276,6 +263,8 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await start_payment_verification(query)
     elif query.data == "back_to_main":
         await start_from_callback(query)
+    elif query.data.startswith(LICENSES_PAGE_PREFIX):
+        await show_user_licenses(query, *parse_licenses_page_data(query.data))
     elif query.data.startswith("pay_card_"):
         # Новый обработчик для выбора карты
         parts = query.data.split("_")
@@ -283,53 +272,37 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         license_key = parts[3] if len(parts) > 3 else ""
         await show_payment_details(query, card_id, license_key)
 
+async def reply_trial_used(query):
+    """Отказ в повторном триале"""
+    await query.edit_message_text(templates.trial_used_text, parse_mode=ParseMode.HTML)
+
 async def handle_trial_request(query):
     """ОРИГИНАЛЬНАЯ выдача триала"""
     user_id = query.from_user.id
     
-    if has_trial_license(user_id):
-        await query.edit_message_text(
-            "❌ <b>Триал уже использован</b>\n\n"
-            "Вы уже получали триал период.\n"
-            "Для продолжения купите месячную лицензию за $100.",
-            parse_mode=ParseMode.HTML
-        )
+    # Быстрый отказ по кэшу записи / индексу
+    if await run_db(has_trial_license, user_id):
+        await reply_trial_used(query)
         return
     
-    # Генерируем триал ключ
-    license_key = generate_license_key()
-    
-    # ОРИГИНАЛЬНОЕ сохранение
-    trial_data = {
-        'key': license_key,
-        'type': 'trial',
-        'created': datetime.now(),
-        'expires': datetime.now() + timedelta(days=TRIAL_DAYS),
-        'active': True
-    }
-    
-    users_data[user_id]['licenses'].append(trial_data)
+    # Генерируем триал ключ (пустой пул пополняется в потоке БД)
+    license_key = await run_db(generate_license_key)
     
-    # НОВОЕ: также сохраняем в БД для API
-    save_license_to_db(license_key, "trial", user_id, TRIAL_DAYS, 0)
+    expires_at = datetime.now() + timedelta(days=TRIAL_DAYS)
     
-    keyboard = [[InlineKeyboardButton("🔙 Главное меню", callback_data="back_to_main")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Окончательно решает транзакция писателя (двойное нажатие не даст два триала)
+    created = await run_db(save_trial_license, license_key, user_id, expires_at)
+    if created is None:
+        await query.edit_message_text("❌ Ошибка выдачи триала. Попробуйте позже.")
+        return
+    if not created:
+        await reply_trial_used(query)
+        return
     
     await query.edit_message_text(
-        f"🎉 <b>Триал период активирован!</b>\n\n"
-        f"🔐 <b>Ваш лицензионный ключ:</b>\n"
-        f"<code>{license_key}</code>\n\n"
-        f"⏰ <b>Срок действия:</b> 3 дня\n"
-        f"📅 <b>Истекает:</b> {trial_data['expires'].strftime('%d.%m.%Y %H:%M')}\n\n"
-        f"📋 <b>Как использовать:</b>\n"
-        f"1. Скопируйте ключ (нажмите на него)\n"
-        f"2. Вставьте в настройки советника MT5\n"
-        f"3. Запустите советника\n\n"
-        f"💡 <b>После окончания триала:</b>\n"
-        f"Купите месячную лицензию за $100 для продолжения работы.",
+        templates.trial_activated_text(license_key, expires_at),
         parse_mode=ParseMode.HTML,
-        reply_markup=reply_markup
+        reply_markup=templates.main_menu_back_markup
     )
 
 async def handle_license_purchase(query):
@@ -337,41 +310,18 @@ async def handle_license_purchase(query):
     user_id = query.from_user.id
     
     # Генерируем ключ для покупки
-    license_key = generate_license_key()
-    
-    # ОРИГИНАЛЬНОЕ сохранение в память
-    purchase_data = {
-        'key': license_key,
-        'type': 'monthly',
-        'created': datetime.now(),
-        'expires': datetime.now() + timedelta(days=30),
-        'active': False,  # Активируется после оплаты
-        'paid': False
-    }
+    license_key = await run_db(generate_license_key)
     
-    users_data[user_id]['licenses'].append(purchase_data)
-    
-    # НОВОЕ: также сохраняем в БД для API (неподтвержденное)
-    save_license_to_db(license_key, "monthly", user_id, 30, MONTHLY_PRICE)
+    # Сохраняем в БД (неподтвержденное, активируется после оплаты)
+    if not await run_db(save_license_to_db, license_key, "monthly", user_id, 30, MONTHLY_PRICE):
+        await query.edit_message_text("❌ Ошибка создания лицензии. Попробуйте позже.")
+        return
     
     # Показываем выбор карт
-    keyboard = []
-    for card_id, card_info in PAYMENT_CARDS.items():
-        keyboard.append([InlineKeyboardButton(
-            card_info["name"], 
-            callback_data=f"pay_card_{card_id}_{license_key}"
-        )])
-    
-    keyboard.append([InlineKeyboardButton("🔙 Главное меню", callback_data="back_to_main")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await query.edit_message_text(
-        f"💳 <b>Покупка месячной лицензии</b>\n\n"
-        f"💰 <b>Сумма:</b> ${MONTHLY_PRICE} USD\n"
-        f"🔐 <b>Лицензионный ключ:</b>\n<code>{license_key}</code>\n\n"
-        f"💳 <b>Выберите способ оплаты:</b>",
+        templates.purchase_text(license_key),
         parse_mode=ParseMode.HTML,
-        reply_markup=reply_markup
+        reply_markup=templates.purchase_markup(license_key)
     )
 
 async def show_payment_details(query, card_id, license_key):
@@ -380,68 +330,33 @@ async def show_payment_details(query, card_id, license_key):
         await query.edit_message_text("❌ Ошибка: неверная карта")
         return
     
-    card_info = PAYMENT_CARDS[card_id]
-    
-    keyboard = [
-        [InlineKeyboardButton("💰 Подтвердить оплату", callback_data="verify_payment")],
-        [InlineKeyboardButton("🔙 Выбрать другую карту", callback_data="buy_license")],
-        [InlineKeyboardButton("🔙 Главное меню", callback_data="back_to_main")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await query.edit_message_text(
-        f"💳 <b>Реквизиты для оплаты</b>\n\n"
-        f"🔐 <b>Лицензионный ключ:</b>\n<code>{license_key}</code>\n\n"
-        f"💰 <b>Сумма:</b> ${MONTHLY_PRICE} USD\n\n"
-        f"💳 <b>Реквизиты карты:</b>\n"
-        f"• <b>Карта:</b> <code>{card_info['number']}</code>\n"
-        f"• <b>Получатель:</b> {card_info['owner']}\n"
-        f"• <b>Банк:</b> {card_info['bank']}\n"
-        f"• <b>Тип:</b> {card_info['name']}\n\n"
-        f"📝 <b>Инструкция:</b>\n"
-        f"1. Переведите точную сумму ${MONTHLY_PRICE} USD\n"
-        f"2. Нажмите 'Подтвердить оплату'\n"
-        f"3. Отправьте скриншот перевода\n\n"
-        f"⚠️ <b>ВАЖНО:</b> Сохраните лицензионный ключ!",
+        templates.payment_details_text(card_id, license_key),
         parse_mode=ParseMode.HTML,
-        reply_markup=reply_markup
+        reply_markup=templates.payment_details_markup
     )
 
 async def start_payment_verification(query):
     """ОРИГИНАЛЬНАЯ процедура подтверждения"""
-    keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="back_to_main")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    # Показываем информацию об обеих картах
-    cards_info = ""
-    for card_id, card_info in PAYMENT_CARDS.items():
-        cards_info += f"• {card_info['name']}: {card_info['number']} ({card_info['owner']})\n"
-    
+    # Текст с обеими картами собран при старте
     await query.edit_message_text(
-        "📸 <b>Подтверждение оплаты</b>\n\n"
-        f"Отправьте скриншот или фото чека об оплате ${MONTHLY_PRICE} USD\n\n"
-        f"💳 <b>Доступные карты для оплаты:</b>\n{cards_info}\n"
-        "После проверки ваша лицензия будет активирована!",
+        templates.payment_verification_text,
         parse_mode=ParseMode.HTML,
-        reply_markup=reply_markup
+        reply_markup=templates.back_markup
     )
 
 async def handle_payment_proof(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """ОРИГИНАЛЬНАЯ обработка скриншота"""
     user_id = update.effective_user.id
     
-    if user_id not in users_data:
+    if await run_db(user_repository.get, user_id) is None:
         await update.message.reply_text(
             "❌ Сначала купите лицензию через /start → 'Купить лицензию'"
         )
         return
     
-    # Ищем неоплаченную лицензию
-    unverified_license = None
-    for license_data in users_data[user_id]['licenses']:
-        if license_data.get('type') == 'monthly' and not license_data.get('paid', False):
-            unverified_license = license_data
-            break
+    # Ищем неоплаченную лицензию (индексированный запрос)
+    unverified_license = await run_db(user_repository.find_unpaid_license, user_id)
     
     if not unverified_license:
         await update.message.reply_text(
@@ -449,129 +364,237 @@ async def handle_payment_proof(update: Update, context: ContextTypes.DEFAULT_TYP
         )
         return
     
-    # Активируем лицензию
-    unverified_license['paid'] = True
-    unverified_license['active'] = True
-    
-    # НОВОЕ: подтверждаем в БД для API
-    verify_payment_in_db(unverified_license['key'])
+    # Чек обрабатывается в фоне: скачивание, хэш, дедупликация и запись в очередь проверки
+    attachment = update.message.photo[-1] if update.message.photo else update.message.document
+    await update.message.reply_text(templates.proof_received_text, parse_mode=ParseMode.HTML)
+    context.application.create_task(
+        process_payment_proof(context.bot, update.effective_chat.id, user_id, attachment, unverified_license),
+        update=update
+    )
+
+async def process_payment_proof(bot, chat_id, user_id, attachment, unverified_license):
+    """Фоновый прием чека и ответ пользователю по результату"""
+    try:
+        telegram_file = await attachment.get_file()
+        result = await payment_proofs.ingest_telegram_file(telegram_file, user_id, unverified_license.license_key)
+    except Exception as e:
+        logger.error(f"❌ Ошибка приема чека: {e}")
+        await bot.send_message(chat_id, templates.proof_failed_text)
+        return
     
-    keyboard = [[InlineKeyboardButton("🔙 Главное меню", callback_data="back_to_main")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    if result.accepted:
+        await bot.send_message(
+            chat_id,
+            templates.proof_pending_text(unverified_license.license_key),
+            parse_mode=ParseMode.HTML,
+            reply_markup=templates.main_menu_back_markup
+        )
+    elif result.status == payment_proofs.DUPLICATE:
+        await bot.send_message(chat_id, templates.proof_duplicate_text, parse_mode=ParseMode.HTML)
+    elif result.status == payment_proofs.ALREADY_PAID:
+        await bot.send_message(chat_id, templates.proof_already_paid_text)
+    else:
+        await bot.send_message(chat_id, templates.proof_failed_text)
+
+# callback_data листания: "lic|<old|new>|<created_at>|<id>" (лимит Telegram - 64 байта)
+LICENSES_PAGE_PREFIX = "lic|"
+
+def licenses_page_data(direction, row):
+    """callback_data кнопки листания от граничной строки страницы"""
+    data = f"{LICENSES_PAGE_PREFIX}{direction}|{row['created_at']}|{row['id']}"
+    if len(data.encode('utf-8')) > 64:
+        logger.warning(f"⚠️ callback_data длиннее 64 байт: {data}")
+        return None
+    return data
+
+def parse_licenses_page_data(data):
+    """callback_data листания -> (before, after)"""
+    _, direction, created_at, license_id = data.split("|", 3)
+    cursor = (created_at, int(license_id))
+    return (cursor, None) if direction == "old" else (None, cursor)
+
+def render_license(license_data):
+    """Блок одной лицензии в списке"""
+    license_key = license_data['license_key']
+    license_type = license_data['plan_type']
+    expires = parse_db_datetime(license_data['expires_at'])
+    is_active = bool(license_data['is_active'])
+    is_paid = bool(license_data['payment_verified'])  # Триал подтвержден при выдаче
+    
+    # Проверяем истечение
+    is_expired = expires < datetime.now()
+    
+    if license_type == 'trial':
+        type_name = "🆓 Триал (3 дня)"
+        status = "✅ Активен" if (is_active and not is_expired) else "❌ Истек"
+    else:
+        type_name = "💳 Месячная лицензия"
+        if not is_paid:
+            status = "⏳ Ожидает оплаты"
+        elif is_expired:
+            status = "❌ Истекла"
+        else:
+            status = "✅ Активна"
     
-    await update.message.reply_text(
-        f"✅ <b>Оплата подтверждена!</b>\n\n"
-        f"🔐 <b>Ваша лицензия активирована:</b>\n"
-        f"<code>{unverified_license['key']}</code>\n\n"
-        f"📅 <b>Действует до:</b> {unverified_license['expires'].strftime('%d.%m.%Y %H:%M')}\n\n"
-        f"✅ <b>Лицензия готова к использованию!</b>",
-        parse_mode=ParseMode.HTML,
-        reply_markup=reply_markup
+    return (
+        f"🔐 <code>{license_key}</code>\n"
+        f"📋 {type_name}\n"
+        f"📅 Истекает: {expires.strftime('%d.%m.%Y %H:%M')}\n"
+        f"📊 Статус: {status}\n\n"
     )
 
-async def show_user_licenses(query):
-    """ОРИГИНАЛЬНЫЙ показ лицензий"""
+async def show_user_licenses(query, before=None, after=None):
+    """Показ лицензий постранично (рендерится только видимая страница)"""
     user_id = query.from_user.id
     
-    if user_id not in users_data or not users_data[user_id]['licenses']:
-        keyboard = [
-            [InlineKeyboardButton("🆓 Получить триал", callback_data="trial")],
-            [InlineKeyboardButton("💳 Купить лицензию", callback_data="buy_license")],
-            [InlineKeyboardButton("🔙 Назад", callback_data="back_to_main")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
+    licenses, has_newer, has_older = await run_db(get_user_licenses_page, user_id, before, after)
+    
+    if not licenses and before is None and after is None:
         await query.edit_message_text(
             "📋 <b>Ваши лицензии</b>\n\n"
             "У вас пока нет лицензий.\n\n"
             "Получите триал на 3 дня бесплатно или купите месячную лицензию!",
             parse_mode=ParseMode.HTML,
-            reply_markup=reply_markup
+            reply_markup=templates.no_licenses_markup
         )
         return
     
-    text = "📋 <b>Ваши лицензии:</b>\n\n"
-    
-    for license_data in users_data[user_id]['licenses']:
-        license_key = license_data['key']
-        license_type = license_data['type']
-        expires = license_data['expires']
-        is_active = license_data.get('active', False)
-        is_paid = license_data.get('paid', True)  # Триал считается оплаченным
-        
-        # Проверяем истечение
-        is_expired = expires < datetime.now()
-        
-        if license_type == 'trial':
-            type_name = "🆓 Триал (3 дня)"
-            status = "✅ Активен" if (is_active and not is_expired) else "❌ Истек"
-        else:
-            type_name = "💳 Месячная лицензия"
-            if not is_paid:
-                status = "⏳ Ожидает оплаты"
-            elif is_expired:
-                status = "❌ Истекла"
-            else:
-                status = "✅ Активна"
-        
-        text += (
-            f"🔐 <code>{license_key}</code>\n"
-            f"📋 {type_name}\n"
-            f"📅 Истекает: {expires.strftime('%d.%m.%Y %H:%M')}\n"
-            f"📊 Статус: {status}\n\n"
-        )
+    if not licenses:
+        # Курсор устарел (лицензии удалены) - начинаем с первой страницы
+        await show_user_licenses(query)
+        return
     
-    keyboard = [
-        [InlineKeyboardButton("💳 Купить еще", callback_data="buy_license")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="back_to_main")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    text = "📋 <b>Ваши лицензии:</b>\n\n" + "".join(render_license(license_data) for license_data in licenses)
     
+    reply_markup = templates.licenses_page_markup(
+        licenses_page_data("new", licenses[0]) if has_newer else None,
+        licenses_page_data("old", licenses[-1]) if has_older else None
+    )
     await query.edit_message_text(text, parse_mode=ParseMode.HTML, reply_markup=reply_markup)
 
 async def start_from_callback(query):
     """ОРИГИНАЛЬНЫЙ возврат в меню"""
-    keyboard = [
-        [InlineKeyboardButton("🆓 Получить триал (3 дня бесплатно)", callback_data="trial")],
-        [InlineKeyboardButton("💳 Купить лицензию ($100/месяц)", callback_data="buy_license")],
-        [InlineKeyboardButton("📋 Мои лицензии", callback_data="my_licenses")],
-        [InlineKeyboardButton("💰 Подтвердить оплату", callback_data="verify_payment")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await query.edit_message_text(
-        f"🤖 <b>RFX Trading License Bot</b>\n\n"
-        f"🔐 <b>Система лицензирования торгового советника</b>\n\n"
-        f"• 🆓 <b>Триал:</b> 3 дня бесплатно\n"
-        f"• 💳 <b>Лицензия:</b> $100 USD/месяц\n\n"
-        f"<i>Выберите действие:</i>",
+        templates.main_menu_text,
         parse_mode=ParseMode.HTML,
-        reply_markup=reply_markup
+        reply_markup=templates.main_menu_markup
     )
 
 # ============================================================================
 # 🚀 ЗАПУСК БОТА (БЕЗ ИЗМЕНЕНИЙ!)
 # ============================================================================
 
+# ============================================================================
+# ⏰ УВЕДОМЛЕНИЯ ОБ ИСТЕЧЕНИИ ЛИЦЕНЗИЙ
+# ============================================================================
+
+def notice_message(notice):
+    """Текст уведомления из строки expiry_notices"""
+    expires_at = parse_db_datetime(notice['expires_at'])
+    if notice['kind'] == expiry_scheduler.EXPIRED:
+        return templates.license_expired_text(notice['license_key'], expires_at)
+    days_left = expiry_scheduler.reminder_days_left(notice['kind'])
+    return templates.expiry_reminder_text(notice['license_key'], expires_at, days_left)
+
+async def send_expiry_notices(bot):
+    """Разослать накопившиеся уведомления; возвращает число обработанных"""
+    notices = await run_db(expiry_scheduler.fetch_unsent_notices)
+    done = []
+    try:
+        for notice in notices:
+            try:
+                await bot.send_message(
+                    chat_id=int(notice['telegram_user_id']),
+                    text=notice_message(notice),
+                    parse_mode=ParseMode.HTML,
+                    reply_markup=templates.expiry_markup
+                )
+            except (Forbidden, BadRequest) as e:
+                # Бот заблокирован / чат недоступен - повторять бессмысленно
+                logger.warning(f"⚠️ Уведомление {notice['id']} не доставлено: {e}")
+            done.append(notice['id'])
+    finally:
+        # Сетевые ошибки прерывают рассылку: остаток уйдет в следующий проход
+        await run_db(expiry_scheduler.mark_notices_sent, done)
+    return len(done)
+
+async def expiry_notice_loop(application):
+    """Фоновая рассылка уведомлений об истечении"""
+    while True:
+        try:
+            await send_expiry_notices(application.bot)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Ошибка рассылки уведомлений: {e}")
+        await asyncio.sleep(BOT_NOTICE_INTERVAL)
+
+# ============================================================================
+# 📜 ИЗМЕНЕНИЯ ЛИЦЕНЗИЙ ИЗ ДРУГИХ ПРОЦЕССОВ
+# ============================================================================
+
+def apply_license_changes(rows):
+    """Лицензию изменили API/админ/выгрузка ключей: сбросить кэши бота (rows=None - все)"""
+    if rows is None:
+        license_cache.clear()
+        user_repository.clear()
+        return
+    for row in rows:
+        license_cache.invalidate(row['license_key'])
+        if row['telegram_user_id']:
+            user_repository.invalidate(row['telegram_user_id'])
+
+async def post_init(application):
+    """Фоновое истечение лицензий, рассылка уведомлений и чтение журнала изменений"""
+    expiry_scheduler.start_sweeper()
+    await run_db(license_changes.start_follower, DATABASE_PATH, apply_license_changes)
+    application.bot_data['expiry_notices'] = asyncio.create_task(expiry_notice_loop(application))
+
+async def post_shutdown(application):
+    """Остановка пулов потоков (БД, чеки) после завершения бота"""
+    task = application.bot_data.pop('expiry_notices', None)
+    if task is not None:
+        task.cancel()
+    expiry_scheduler.get_scheduler().stop()
+    license_changes.get_follower().stop()
+    payment_proofs.shutdown()
+    shutdown_db_executor()
+
+def build_application():
+    """Application с обработчиками бота (общая для polling и webhook)"""
+    builder = Application.builder().token(BOT_TOKEN)
+    # Разные пользователи - параллельно, один пользователь - строго по порядку
+    builder = builder.concurrent_updates(PerUserUpdateProcessor(BOT_CONCURRENT_UPDATES)).post_init(post_init).post_shutdown(post_shutdown)
+    # По умолчанию у PTB одно HTTP-соединение: параллельные ответы встали бы в очередь
+    builder = builder.connection_pool_size(max(1, BOT_CONCURRENT_UPDATES))
+    if BOT_API_BASE_URL:
+        builder = builder.base_url(f"{BOT_API_BASE_URL}/bot").base_file_url(f"{BOT_API_BASE_URL}/file/bot")
+    application = builder.build()
+    
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CallbackQueryHandler(button_handler))
+    application.add_handler(MessageHandler(filters.PHOTO | filters.Document.IMAGE, handle_payment_proof))
+    return application
+
 def main():
     """ОРИГИНАЛЬНАЯ функция запуска"""
     # ТОЛЬКО ДОБАВЛЯЕМ инициализацию БД для API совместимости
     init_database()
     
-    application = Application.builder().token(BOT_TOKEN).build()
-    
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CallbackQueryHandler(button_handler))
-    application.add_handler(MessageHandler(filters.PHOTO | filters.Document.IMAGE, handle_payment_proof))
+    application = build_application()
     
     logger.info("🤖 Запуск RFX Trading License Bot...")
     logger.info("💳 Оригинальные тарифы: 3 дня триал + $100/месяц")
     logger.info(f"💳 Реквизиты UzCard: {PAYMENT_CARDS['uzcard']['number']} ({PAYMENT_CARDS['uzcard']['owner']})")
     logger.info(f"💳 Реквизиты VISA: {PAYMENT_CARDS['visa']['number']} ({PAYMENT_CARDS['visa']['owner']})")
     logger.info("✅ БД синхронизирована с API")
-    logger.info("🔐 Бот готов к работе!")
+    logger.info(f"🔐 Бот готов к работе! Режим: {BOT_MODE}, параллельно обновлений: {BOT_CONCURRENT_UPDATES}")
     
-    application.run_polling()
+    if BOT_MODE == 'webhook':
+        from bot_webhook import run_webhook
+        run_webhook(application)
+    else:
+        application.run_polling()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,55 @@
+import os
+import sys
+import shutil
+import tempfile
+
+# Модули читают настройки из окружения при импорте: база и лимиты тестов - во временном каталоге
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+_TMP = tempfile.mkdtemp(prefix='license-tests-')
+os.environ['DATABASE_PATH'] = os.path.join(_TMP, 'license_system.db')
+os.environ['RATE_LIMIT_DB_PATH'] = os.path.join(_TMP, 'rate_limits.db')
+
+import pytest
+
+import db
+from db_writer import get_writer
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Отдельная БД теста со схемой; писатель останавливается после теста"""
+    path = str(tmp_path / 'license_system.db')
+    db.init_schema(db.get_connection(path))
+    yield path
+    get_writer(path).stop()
+    db.get_pool(path).close_all()
+
+
+def _wipe(conn):
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    )]
+    for table in tables:
+        conn.execute(f'DELETE FROM {table}')
+    conn.execute('DELETE FROM sqlite_sequence')
+
+
+@pytest.fixture
+def service_db():
+    """БД по умолчанию (DATABASE_PATH) для API; очищается после теста"""
+    import key_filter
+    from license_cache import license_cache
+
+    path = db.DATABASE_PATH
+    db.init_schema(db.get_connection(path))
+    yield path
+    get_writer(path).execute(_wipe)
+    # Пустые служебные таблицы заполняются заново, как в новой БД
+    db.init_schema(db.get_connection(path))
+    license_cache.clear()
+    key_filter._filters.clear()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_TMP, ignore_errors=True)
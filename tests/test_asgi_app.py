@@ -0,0 +1,159 @@
+import json
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import asgi_app
+import expiry_scheduler
+import license_service
+import main
+from db_writer import get_writer
+from license_cache import license_cache
+from rate_limit import MemoryBuckets, RateLimiter
+
+
+def _insert_license(conn, license_key, account_number=None):
+    conn.execute('''
+        INSERT INTO licenses (license_key, account_number, plan_type, expires_at, is_active, payment_verified)
+        VALUES (?, ?, 'monthly', ?, 1, 1)
+    ''', (license_key, account_number, (datetime.now() + timedelta(days=30)).isoformat()))
+
+
+def _request(method, path, body=b'', headers=()):
+    """Запрос к ASGI-приложению: (status, headers, body)"""
+    scope = {'type': 'http', 'method': method, 'path': path, 'headers': list(headers), 'client': ('203.0.113.7', 5000)}
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi_app.app(scope, receive, send))
+    start, response = sent
+    return start['status'], dict(start['headers']), response['body']
+
+
+@pytest.fixture
+def licenses(service_db):
+    get_writer(service_db).execute(_insert_license, 'RFX-BOUND', '100')
+    get_writer(service_db).execute(_insert_license, 'RFX-NEW')
+    return service_db
+
+
+@pytest.mark.parametrize('path', [
+    '/check_license/RFX-BOUND/100', '/check_license/RFX-BOUND/200', '/check_license/RFX-MISSING/100', '/stats'
+])
+def test_same_response_as_flask(licenses, path):
+    flask_response = main.app.test_client().get(path)
+    status, headers, body = _request('GET', path)
+
+    assert status == flask_response.status_code
+    assert headers[b'content-type'] == b'application/json'
+    flask_body, asgi_body = flask_response.get_json(), json.loads(body)
+    for verdict in (flask_body, asgi_body):
+        verdict.pop('verified_at', None)
+        verdict.pop('timestamp', None)
+    assert asgi_body == flask_body
+
+
+def test_batch_endpoint(licenses):
+    payload = json.dumps({"licenses": [
+        {"license_key": "RFX-BOUND", "account_number": "100"},
+        {"license_key": "RFX-NEW", "account_number": "300"}
+    ]}).encode()
+    status, _, body = _request('POST', '/check_licenses', payload)
+    assert status == 200
+    assert json.loads(body)['valid'] == 2
+
+    assert _request('POST', '/check_licenses', b'not json')[0] == 400
+    assert _request('POST', '/check_licenses', b'x' * (asgi_app.MAX_BODY_BYTES + 1))[0] == 413
+
+
+@pytest.fixture
+def memory_limits(monkeypatch):
+    """Лимиты в памяти процесса: попадания в кэш не уходят в пул потоков"""
+    monkeypatch.setattr(license_service, 'rate_limiter', RateLimiter(MemoryBuckets()))
+
+
+def test_cache_hit_served_without_thread_pool(licenses, memory_limits, monkeypatch):
+    assert _request('GET', '/check_license/RFX-BOUND/100')[0] == 200
+
+    async def no_pool(*args, **kwargs):
+        raise AssertionError("cache hit went to the thread pool")
+
+    monkeypatch.setattr(asgi_app, 'run_db', no_pool)
+    assert _request('GET', '/check_license/RFX-BOUND/100')[0] == 200
+
+
+def test_cache_miss_counted_once(licenses):
+    misses = license_cache.stats()['misses']
+    assert _request('GET', '/check_license/RFX-BOUND/100')[0] == 200
+    # Проба из event loop и повторный поиск в пуле потоков - один промах
+    assert license_cache.stats()['misses'] - misses == 1
+
+
+def test_not_modified_from_event_loop(licenses, memory_limits, monkeypatch):
+    status, headers, _ = _request('GET', '/check_license/RFX-BOUND/100')
+    assert status == 200
+    assert headers[b'cache-control'].startswith(b'public, max-age=')
+    assert b's-maxage=' in headers[b'cache-control']
+    assert headers[b'vary'] == b'Accept-Encoding'
+
+    async def no_pool(*args, **kwargs):
+        raise AssertionError("cache hit went to the thread pool")
+
+    monkeypatch.setattr(asgi_app, 'run_db', no_pool)
+    status, not_modified_headers, body = _request(
+        'GET', '/check_license/RFX-BOUND/100', headers=[(b'if-none-match', headers[b'etag'])]
+    )
+    assert (status, body) == (304, b'')
+    assert not_modified_headers[b'etag'] == headers[b'etag']
+
+
+def test_admin_routes_require_token(licenses, monkeypatch):
+    monkeypatch.setattr(license_service, 'ADMIN_API_TOKEN', '')
+    assert _request('GET', '/admin/licenses')[0] == 503
+
+    monkeypatch.setattr(license_service, 'ADMIN_API_TOKEN', 'admin-secret')
+    assert _request('GET', '/admin/licenses')[0] == 401
+    assert _request('GET', '/admin/licenses', headers=[(b'x-admin-token', b'wrong')])[0] == 401
+    status, _, body = _request('GET', '/admin/licenses', headers=[(b'x-admin-token', b'admin-secret')])
+    assert status == 200 and json.loads(body)['total'] == 2
+
+
+
+def test_admin_revoke_license(licenses, monkeypatch):
+    monkeypatch.setattr(license_service, 'ADMIN_API_TOKEN', 'admin-secret')
+    assert _request('GET', '/check_license/RFX-BOUND/100')[0] == 200
+
+    admin = [(b'x-admin-token', b'admin-secret')]
+    assert _request('POST', '/admin/revoke_license/RFX-BOUND', headers=admin)[0] == 200
+    assert _request('POST', '/admin/revoke_license/RFX-MISSING', headers=admin)[0] == 404
+    assert _request('GET', '/check_license/RFX-BOUND/100')[0] == 403
+    assert json.loads(_request('GET', '/revoked_licenses')[2])['revoked'] == ['RFX-BOUND']
+
+def test_unknown_route_and_method():
+    assert _request('GET', '/nope')[0] == 404
+    status, headers, _ = _request('DELETE', '/check_licenses')
+    assert status == 405
+    assert headers[b'allow'] == b'POST'
+
+
+def test_lifespan_initializes_schema(service_db):
+    messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message['type'])
+
+    asyncio.run(asgi_app.app({'type': 'lifespan'}, receive, send))
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+    # Планировщик истечения останавливается вместе с приложением
+    assert not expiry_scheduler.sweeper_running(license_service.DATABASE_PATH)
@@ -0,0 +1,64 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+import async_db
+
+
+def test_run_db_runs_off_event_loop():
+    async def main():
+        loop_thread = threading.get_ident()
+        worker_thread = await async_db.run_db(threading.get_ident)
+        return loop_thread, worker_thread
+
+    loop_thread, worker_thread = asyncio.run(main())
+    assert worker_thread != loop_thread
+
+
+def test_run_db_passes_arguments_and_errors():
+    async def fail():
+        await async_db.run_db(int, 'not a number')
+
+    assert asyncio.run(async_db.run_db(pow, 2, exp=10)) == 1024
+    with pytest.raises(ValueError):
+        asyncio.run(fail())
+
+
+def test_pool_is_bounded_and_loop_stays_responsive():
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def blocking_query():
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        tick_task = asyncio.create_task(ticker())
+        await asyncio.gather(*(async_db.run_db(blocking_query) for _ in range(async_db.DB_EXECUTOR_WORKERS * 3)))
+        tick_task.cancel()
+        return ticks
+
+    completed = async_db.stats()['completed']
+    ticks = asyncio.run(main())
+
+    assert peak <= async_db.DB_EXECUTOR_WORKERS
+    # Пока потоки ждут SQLite, event loop продолжает работать
+    assert ticks > 10
+    assert async_db.stats()['completed'] - completed == async_db.DB_EXECUTOR_WORKERS * 3
+    assert async_db.stats()['in_flight'] == 0
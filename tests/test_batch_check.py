@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import db
+import license_service
+import main
+from db_writer import get_writer
+
+
+def _insert_license(conn, license_key, account_number=None, payment_verified=1, days=30):
+    conn.execute('''
+        INSERT INTO licenses (license_key, account_number, plan_type, expires_at, is_active, payment_verified)
+        VALUES (?, ?, 'monthly', ?, 1, ?)
+    ''', (license_key, account_number, (datetime.now() + timedelta(days=days)).isoformat(), payment_verified))
+
+
+def _bind(conn, license_key, account_number):
+    conn.execute('UPDATE licenses SET account_number = ? WHERE license_key = ?', (account_number, license_key))
+
+
+def _bound_account(path, license_key):
+    return db.get_connection(path).execute(
+        'SELECT account_number FROM licenses WHERE license_key = ?', (license_key,)
+    ).fetchone()[0]
+
+
+@pytest.fixture
+def client(service_db):
+    return main.app.test_client()
+
+
+def _check(client, items):
+    response = client.post('/check_licenses', json={"licenses": [
+        {"license_key": license_key, "account_number": account_number} for license_key, account_number in items
+    ]})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_verdicts_match_single_checks(client, service_db):
+    writer = get_writer(service_db)
+    writer.execute(_insert_license, 'RFX-VALID', '100')
+    writer.execute(_insert_license, 'RFX-UNPAID', '100', payment_verified=0)
+    writer.execute(_insert_license, 'RFX-EXPIRED', '100', days=-1)
+
+    body = _check(client, [('RFX-VALID', '100'), ('RFX-VALID', '200'), ('RFX-UNPAID', '100'),
+                           ('RFX-EXPIRED', '100'), ('RFX-MISSING', '100')])
+
+    assert body['total'] == 5 and body['valid'] == 1
+    assert [(item['status'], item.get('reason')) for item in body['results']] == [
+        (200, None), (403, 'wrong_account'), (402, 'payment_not_verified'), (410, 'expired'), (404, 'key_not_found')
+    ]
+    assert 'verified_at' in body['results'][0]
+    # Тот же вердикт, что и у одиночной проверки
+    single = client.get('/check_license/RFX-VALID/200')
+    assert (single.status_code, single.get_json()['reason']) == (403, 'wrong_account')
+
+
+def test_bindings_applied_in_one_transaction(client, service_db):
+    writer = get_writer(service_db)
+    for i in range(3):
+        writer.execute(_insert_license, f'RFX-NEW{i}')
+    commits = writer.commits
+
+    body = _check(client, [(f'RFX-NEW{i}', str(100 + i)) for i in range(3)])
+
+    assert body['valid'] == 3
+    assert writer.commits - commits == 1
+    assert [_bound_account(service_db, f'RFX-NEW{i}') for i in range(3)] == ['100', '101', '102']
+
+
+def test_repeated_key_first_item_wins(client, service_db):
+    get_writer(service_db).execute(_insert_license, 'RFX-NEW')
+
+    body = _check(client, [('RFX-NEW', '100'), ('RFX-NEW', '200'), ('RFX-NEW', '100')])
+
+    assert [item['status'] for item in body['results']] == [200, 403, 200]
+    assert body['results'][1]['bound_account'] == '100'
+    assert _bound_account(service_db, 'RFX-NEW') == '100'
+
+
+def test_binding_lost_to_concurrent_request_is_reread(client, service_db, monkeypatch):
+    get_writer(service_db).execute(_insert_license, 'RFX-NEW')
+    fetch_licenses = license_service.fetch_licenses
+
+    def racing_fetch(license_keys):
+        rows = fetch_licenses(license_keys)
+        # Параллельный запрос привязывает ключ между чтением и записью пакета
+        get_writer(service_db).execute(_bind, 'RFX-NEW', '999')
+        return rows
+
+    monkeypatch.setattr(license_service, 'fetch_licenses', racing_fetch)
+    body = _check(client, [('RFX-NEW', '100')])
+
+    assert body['results'][0]['status'] == 403
+    assert body['results'][0]['bound_account'] == '999'
+    assert _bound_account(service_db, 'RFX-NEW') == '999'
+
+
+def test_invalid_and_oversized_batches(client, monkeypatch):
+    assert client.post('/check_licenses', json={"licenses": "RFX-KEY"}).status_code == 400
+    assert client.post('/check_licenses', json={"licenses": [{"account_number": "1"}]}).status_code == 400
+    assert client.post('/check_licenses', data='not json').status_code == 400
+
+    monkeypatch.setattr(license_service, 'BATCH_MAX_ITEMS', 2)
+    response = client.post('/check_licenses', json=[["RFX-A", "1"], ["RFX-B", "1"], ["RFX-C", "1"]])
+    assert response.status_code == 413
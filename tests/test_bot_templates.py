@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from bot_templates import BotTemplates
+
+CARDS = {
+    "uzcard": {"name": "💳 UzCard", "number": "8600 0000 0000 0001", "owner": "OWNER", "bank": "Bank A"},
+    "humo": {"name": "💳 Humo", "number": "9860 0000 0000 0002", "owner": "OWNER", "bank": "Bank B"}
+}
+
+
+def test_welcome_escapes_user_name():
+    text = BotTemplates(CARDS, 100).welcome_text("<b>Eve</b> & co")
+    assert "👋 Привет, &lt;b&gt;Eve&lt;/b&gt; &amp; co!" in text
+    assert BotTemplates(CARDS, 100).welcome_text(None).startswith("🤖 <b>Добро пожаловать")
+
+
+def test_purchase_markup_carries_license_key():
+    markup = BotTemplates(CARDS, 100).purchase_markup("RFX-KEY")
+    assert [[button.callback_data for button in row] for row in markup.inline_keyboard] == [
+        ["pay_card_uzcard_RFX-KEY"], ["pay_card_humo_RFX-KEY"], ["back_to_main"]
+    ]
+
+
+def test_payment_texts_use_cards_and_price():
+    templates = BotTemplates(CARDS, 150)
+    details = templates.payment_details_text("humo", "RFX-KEY")
+    assert "<code>RFX-KEY</code>" in details
+    assert "<code>9860 0000 0000 0002</code>" in details and "Bank B" in details
+    assert "$150 USD" in details and "8600" not in details
+
+    verification = templates.payment_verification_text
+    assert "$150 USD" in verification
+    assert "8600 0000 0000 0001" in verification and "9860 0000 0000 0002" in verification
+
+
+def test_dates_rendered_in_templates():
+    templates = BotTemplates(CARDS, 100)
+    expires_at = datetime(2026, 3, 1, 12, 30)
+    assert "<code>RFX-T</code>" in templates.trial_activated_text("RFX-T", expires_at)
+    assert "📅 <b>Истекает:</b> 01.03.2026 12:30" in templates.trial_activated_text("RFX-T", expires_at)
+    assert "<code>RFX-P</code>" in templates.proof_pending_text("RFX-P")
+
+
+def test_main_menu_buttons():
+    templates = BotTemplates(CARDS, 100)
+    assert [row[0].callback_data for row in templates.main_menu_markup.inline_keyboard] == [
+        "trial", "buy_license", "my_licenses", "verify_payment"
+    ]
@@ -0,0 +1,80 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot_webhook import SECRET_HEADER, WebhookReceiver, check_webhook_config, is_loopback, serve_webhook
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 42, "type": "private"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Alice"},
+        "text": "/start"
+    }
+}
+
+
+def _post(receiver, body=None, headers=None, data=None):
+    """POST в приемник; статус ответа и обновления, попавшие в очередь"""
+    async def run():
+        receiver.application.update_queue = asyncio.Queue()
+        async with TestClient(TestServer(receiver.make_app())) as client:
+            response = await client.post(receiver.path, json=body, data=data, headers=headers or {})
+            queued = []
+            while not receiver.application.update_queue.empty():
+                queued.append(receiver.application.update_queue.get_nowait())
+            return response.status, queued
+
+    return asyncio.run(run())
+
+
+def _receiver(secret=''):
+    return WebhookReceiver(SimpleNamespace(bot=None, update_queue=None), path='/hook', secret=secret)
+
+
+def test_update_queued_for_handlers():
+    receiver = _receiver()
+    status, queued = _post(receiver, UPDATE)
+    assert status == 200
+    assert [update.update_id for update in queued] == [1]
+    assert queued[0].message.text == '/start'
+    assert receiver.received == 1
+
+
+def test_secret_token_required():
+    receiver = _receiver(secret='s3cret')
+    assert _post(receiver, UPDATE) == (403, [])
+    assert _post(receiver, UPDATE, headers={SECRET_HEADER: 'wrong'}) == (403, [])
+
+    status, queued = _post(receiver, UPDATE, headers={SECRET_HEADER: 's3cret'})
+    assert status == 200 and len(queued) == 1
+    assert (receiver.received, receiver.rejected) == (1, 2)
+
+
+def test_malformed_update_rejected():
+    receiver = _receiver()
+    assert _post(receiver, data='not json', headers={'Content-Type': 'application/json'}) == (400, [])
+    assert receiver.rejected == 1
+
+
+@pytest.mark.parametrize('host, loopback', [
+    ('127.0.0.1', True), ('::1', True), ('localhost', True), ('127.0.0.2', True),
+    ('0.0.0.0', False), ('10.0.0.5', False), ('bot.example.com', False)
+])
+def test_is_loopback(host, loopback):
+    assert is_loopback(host) is loopback
+
+
+def test_public_receiver_requires_secret():
+    check_webhook_config('127.0.0.1', '')
+    check_webhook_config('0.0.0.0', 's3cret')
+    with pytest.raises(RuntimeError):
+        check_webhook_config('0.0.0.0', '')
+
+    # Приемник не запускается (и не трогает Application) без секрета
+    with pytest.raises(RuntimeError):
+        asyncio.run(serve_webhook(None, host='0.0.0.0', port=0, secret=''))
@@ -0,0 +1,102 @@
+import threading
+
+import db
+
+
+def _connection_in_thread(path):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(db.get_connection(path)))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_connection_reused_within_thread(db_path):
+    assert db.get_connection(db_path) is db.get_connection(db_path)
+    assert _connection_in_thread(db_path) is not db.get_connection(db_path)
+
+
+def test_connection_pragmas(db_path):
+    conn = db.get_connection(db_path)
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == db.DB_BUSY_TIMEOUT_MS
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1
+
+
+def test_init_schema_is_idempotent(db_path):
+    conn = db.get_connection(db_path)
+    db.init_schema(conn)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {'licenses', 'users', 'payments'} <= tables
+
+
+def test_close_current(db_path):
+    conn = db.get_connection(db_path)
+    db.get_pool(db_path).close_current()
+    assert db.get_connection(db_path) is not conn
+
+
+def _run_threads(count, target):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_thread_connection_returned_on_exit(db_path):
+    pool = db.get_pool(db_path)
+    _connection_in_thread(db_path)
+    created = pool.stats()['created_connections']
+
+    # Поток на запрос (werkzeug threaded): следующий поток получает то же соединение
+    connections = {id(_connection_in_thread(db_path)) for _ in range(20)}
+    stats = pool.stats()
+    assert len(connections) == 1
+    assert stats['created_connections'] == created
+    assert (stats['in_use_connections'], stats['idle_connections']) == (1, 1)
+
+
+def test_idle_connections_bounded(db_path):
+    pool = db.get_pool(db_path)
+    barrier = threading.Barrier(pool.max_idle + 5)
+
+    def hold_connection():
+        db.get_connection(db_path).execute('SELECT 1')
+        barrier.wait()
+
+    _run_threads(pool.max_idle + 5, hold_connection)
+    stats = pool.stats()
+    # Выданным остается только соединение основного потока теста
+    assert stats['in_use_connections'] == 1
+    assert stats['idle_connections'] == pool.max_idle
+    assert stats['closed_connections'] == 5
+
+
+def test_open_transaction_rolled_back_on_return(db_path):
+    def leave_transaction_open():
+        conn = db.get_connection(db_path)
+        conn.execute("INSERT INTO users (telegram_user_id, username) VALUES ('1', 'lost')")
+
+    _run_threads(1, leave_transaction_open)
+    assert not _connection_in_thread(db_path).in_transaction
+    assert db.get_connection(db_path).execute('SELECT COUNT(*) FROM users').fetchone()[0] == 0
+
+
+def test_close_all_closes_live_connections_on_exit(db_path):
+    pool = db.get_pool(db_path)
+    started, release = threading.Event(), threading.Event()
+
+    def hold_connection():
+        db.get_connection(db_path)
+        started.set()
+        release.wait(5)
+
+    thread = threading.Thread(target=hold_connection)
+    thread.start()
+    assert started.wait(5)
+    pool.close_all()
+    release.set()
+    thread.join()
+
+    assert pool.stats()['open_connections'] == 0
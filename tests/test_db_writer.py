@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+import db
+from db_writer import WriteQueue
+
+
+def _create_items(conn):
+    conn.execute('CREATE TABLE IF NOT EXISTS items (name TEXT PRIMARY KEY)')
+
+
+def _insert_item(conn, name):
+    conn.execute('INSERT INTO items (name) VALUES (?)', (name,))
+    return name
+
+
+def _insert_and_fail(conn, name):
+    conn.execute('INSERT INTO items (name) VALUES (?)', (name,))
+    raise RuntimeError("intent failed")
+
+
+def _wait(conn, started, release):
+    started.set()
+    release.wait(5)
+
+
+@pytest.fixture
+def writer(db_path):
+    queue = WriteQueue(db_path)
+    queue.execute(_create_items)
+    yield queue
+    queue.stop()
+
+
+def _block(writer):
+    """Занять писателя: намерения, поставленные до release.set(), уйдут следующей транзакцией"""
+    started, release = threading.Event(), threading.Event()
+    blocker = writer.submit(_wait, started, release)
+    assert started.wait(5)
+    return blocker, release
+
+
+def _item_names(path):
+    return {row[0] for row in db.get_connection(path).execute('SELECT name FROM items')}
+
+
+def test_execute_returns_intent_result(writer, db_path):
+    assert writer.execute(_insert_item, 'first') == 'first'
+    assert _item_names(db_path) == {'first'}
+
+
+def test_queued_intents_share_one_commit(writer, db_path):
+    # Пока писатель занят, намерения копятся в очереди и коммитятся одной транзакцией
+    blocker, release = _block(writer)
+    futures = [writer.submit(_insert_item, f'item-{i}') for i in range(20)]
+    commits = writer.commits
+    release.set()
+
+    assert [future.result(5) for future in futures] == [f'item-{i}' for i in range(20)]
+    blocker.result(5)
+    assert writer.commits - commits == 2
+    assert writer.stats()['max_batch'] == 20
+    assert len(_item_names(db_path)) == 20
+
+
+def test_failed_intent_rolls_back_only_itself(writer, db_path):
+    _, release = _block(writer)
+    before = writer.submit(_insert_item, 'before')
+    failed = writer.submit(_insert_and_fail, 'failed')
+    after = writer.submit(_insert_item, 'after')
+    release.set()
+
+    assert before.result(5) == 'before'
+    assert after.result(5) == 'after'
+    with pytest.raises(RuntimeError):
+        failed.result(5)
+    assert _item_names(db_path) == {'before', 'after'}
+    assert writer.stats()['failed_intents'] == 1
@@ -0,0 +1,137 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import db
+from db_writer import get_writer
+from expiry_scheduler import EXPIRED, ExpiryScheduler, fetch_unsent_notices, mark_notices_sent
+
+DAY = 86400
+NOW = time.time()
+# Выдана месяц назад (created_at в UTC, как пишет CURRENT_TIMESTAMP): все напоминания позже выдачи
+CREATED_AT = datetime.fromtimestamp(NOW - 30 * DAY, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _insert_license(conn, license_key, expires_ts, telegram_user_id='42', created_at=CREATED_AT):
+    conn.execute('''
+        INSERT INTO licenses (license_key, plan_type, telegram_user_id, expires_at, is_active,
+                              payment_verified, created_at)
+        VALUES (?, 'monthly', ?, ?, 1, 1, ?)
+    ''', (license_key, telegram_user_id, datetime.fromtimestamp(expires_ts), created_at))
+
+
+@pytest.fixture
+def scheduler(db_path):
+    return ExpiryScheduler(db_path, reminder_days=(3, 1), refresh_interval=60, batch=2)
+
+
+def _add(path, license_key, expires_ts, **kwargs):
+    get_writer(path).execute(_insert_license, license_key, expires_ts, **kwargs)
+
+
+def _active(path):
+    return {row[0] for row in db.get_connection(path).execute(
+        'SELECT license_key FROM licenses WHERE is_active = 1'
+    )}
+
+
+def _notices(path):
+    return sorted((row['license_key'], row['kind']) for row in fetch_unsent_notices(path=path))
+
+
+def test_heap_orders_events(scheduler, db_path):
+    _add(db_path, 'RFX-LATE', NOW + 2 * DAY)
+    _add(db_path, 'RFX-SOON', NOW + 100)
+    _add(db_path, 'RFX-FAR', NOW + 30 * DAY)
+
+    # FAR вне окна; SOON: истечение (напоминания уже прошли - только ближайшее);
+    # LATE: напоминание за 1 день и истечение (за 3 дня уже прошло, но есть более близкое)
+    assert scheduler.load(NOW) == 5
+    assert scheduler.next_due() <= NOW
+    events = sorted((kind, key) for _, kind, key, _ in scheduler._heap)
+    assert events == [
+        (EXPIRED, 'RFX-LATE'), (EXPIRED, 'RFX-SOON'),
+        ('remind_1', 'RFX-LATE'), ('remind_1', 'RFX-SOON'), ('remind_3', 'RFX-LATE')
+    ]
+
+
+def test_due_licenses_deactivated_in_batches(scheduler, db_path):
+    for i in range(5):
+        _add(db_path, f'RFX-{i}', NOW - 10 - i)
+    _add(db_path, 'RFX-ACTIVE', NOW + 10 * DAY)
+    scheduler.load(NOW)
+
+    deactivated, _ = scheduler.run_due(NOW)
+    assert deactivated == 5
+    assert _active(db_path) == {'RFX-ACTIVE'}
+    assert _notices(db_path) == [(f'RFX-{i}', EXPIRED) for i in range(5)]
+    assert scheduler.stats()['deactivated'] == 5
+
+
+def test_reminder_recorded_once(scheduler, db_path):
+    _add(db_path, 'RFX-1', NOW + 2 * DAY)
+    scheduler.load(NOW)
+    assert scheduler.run_due(NOW) == (0, 1)
+    assert _notices(db_path) == [('RFX-1', 'remind_3')]
+
+    # Перезагрузка кучи не ставит отправленное напоминание повторно
+    mark_notices_sent([row['id'] for row in fetch_unsent_notices(path=db_path)], path=db_path)
+    scheduler.load(NOW)
+    assert [kind for _, kind, _, _ in sorted(scheduler._heap)] == ['remind_1', EXPIRED]
+    assert scheduler.run_due(NOW) == (0, 0)
+    assert scheduler.run_due(NOW + DAY + 1) == (0, 1)
+    assert _notices(db_path) == [('RFX-1', 'remind_1')]
+
+
+def test_renewed_license_gets_no_stale_events(scheduler, db_path):
+    _add(db_path, 'RFX-1', NOW + 100)
+    scheduler.load(NOW)
+    # Продление после загрузки кучи: событие старого срока ничего не делает
+    db.get_connection(db_path).execute(
+        'UPDATE licenses SET expires_at = ? WHERE license_key = ?',
+        (datetime.fromtimestamp(NOW + 30 * DAY), 'RFX-1')
+    )
+    db.get_connection(db_path).commit()
+
+    assert scheduler.run_due(NOW + 200) == (0, 0)
+    assert _active(db_path) == {'RFX-1'}
+
+
+def test_license_without_user_expires_silently(scheduler, db_path):
+    _add(db_path, 'RFX-API', NOW - 1, telegram_user_id=None)
+    scheduler.load(NOW)
+    assert scheduler.run_due(NOW) == (1, 0)
+    assert _notices(db_path) == []
+
+
+def _insert_trial(conn, license_key, expires_at):
+    # created_at по умолчанию - CURRENT_TIMESTAMP, как у бота
+    conn.execute('''
+        INSERT INTO licenses (license_key, plan_type, telegram_user_id, expires_at, is_active, payment_verified)
+        VALUES (?, 'trial', '42', ?, 1, 1)
+    ''', (license_key, expires_at))
+
+
+@pytest.fixture
+def local_timezone():
+    """Локальное время сервера впереди UTC: expires_at локальный, created_at - UTC"""
+    previous = os.environ.get('TZ')
+    os.environ['TZ'] = 'Etc/GMT-5'
+    time.tzset()
+    yield
+    if previous is None:
+        del os.environ['TZ']
+    else:
+        os.environ['TZ'] = previous
+    time.tzset()
+
+
+def test_trial_gets_no_reminder_for_its_whole_length(local_timezone, scheduler, db_path):
+    get_writer(db_path).execute(_insert_trial, 'RFX-TRIAL', datetime.now() + timedelta(days=3))
+    scheduler.load(time.time())
+
+    # "Осталось 3 дня" у триала на 3 дня - это момент выдачи; напоминание за день остается
+    events = sorted(kind for _, kind, _, _ in scheduler._heap)
+    assert events == [EXPIRED, 'remind_1']
@@ -0,0 +1,86 @@
+import pytest
+
+import db
+import health_checks
+import main
+from health_checks import liveness, readiness
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(health_checks, '_cache', {})
+
+
+def test_liveness_never_touches_database(monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise AssertionError("liveness must not open the database")
+
+    monkeypatch.setattr(db, 'get_connection', unavailable)
+    body, status = liveness()
+    assert status == 200 and body['status'] == 'alive'
+
+
+def test_ready(db_path):
+    body, status = readiness(db_path)
+    assert status == 200
+    assert body['status'] == 'ready' and body['cached'] is False
+    assert {name: check['status'] for name, check in body['checks'].items()} == {
+        'database': 'ok', 'wal': 'ok', 'db_writer': 'ok', 'db_pool': 'ok'
+    }
+
+
+def test_database_unavailable(tmp_path):
+    body, status = readiness(str(tmp_path / 'missing' / 'license_system.db'))
+    assert status == 503
+    assert body['checks']['database']['status'] == 'fail'
+    assert 'error' in body['checks']['database']
+
+
+def test_write_queue_backlog_fails(db_path, monkeypatch):
+    monkeypatch.setattr(health_checks, 'READYZ_MAX_WRITE_QUEUE', -1)
+    body, status = readiness(db_path)
+    assert status == 503
+    assert body['checks']['db_writer']['status'] == 'fail'
+
+
+def test_large_wal_only_warns(db_path, monkeypatch):
+    monkeypatch.setattr(health_checks, 'READYZ_WAL_WARN_BYTES', -1)
+    body, status = readiness(db_path)
+    assert status == 200
+    assert body['checks']['wal']['status'] == 'warn'
+
+
+def test_failing_extra_check(db_path):
+    def bot_down():
+        raise RuntimeError("bot is not polling")
+
+    body, status = readiness(db_path, extra_checks={"bot": bot_down})
+    assert status == 503
+    assert body['checks']['bot'] == {
+        "status": "fail", "error": "bot is not polling", "latency_ms": body['checks']['bot']['latency_ms']
+    }
+
+
+def test_result_cached_between_probes(db_path, monkeypatch):
+    assert readiness(db_path, cache_only=True) is None
+    probes = health_checks.probes
+    readiness(db_path)
+
+    # Пока результат свежий, БД недоступна - проба все равно отвечает из кэша
+    monkeypatch.setattr(health_checks, '_check_database', lambda path: 1 / 0)
+    body, status = readiness(db_path)
+    assert status == 200 and body['cached'] is True
+    assert readiness(db_path, cache_only=True)[1] == 200
+    assert health_checks.probes - probes == 1
+
+    monkeypatch.setattr(health_checks, 'READYZ_CACHE_TTL', 0)
+    body, status = readiness(db_path)
+    assert status == 503 and body['checks']['database']['status'] == 'fail'
+
+
+def test_http_probes(service_db):
+    client = main.app.test_client()
+    assert client.get('/livez').status_code == 200
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'ready'
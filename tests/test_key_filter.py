@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+import key_filter
+from db_writer import get_writer
+from key_filter import BloomFilter, KeyFilter
+from license_keys import generate_key, issue_keys
+
+
+def _insert_license(conn, license_key):
+    conn.execute('''
+        INSERT INTO licenses (license_key, plan_type, expires_at, is_active, payment_verified)
+        VALUES (?, 'monthly', ?, 1, 1)
+    ''', (license_key, datetime.now() + timedelta(days=30)))
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(10000, fp_rate=0.01)
+    keys = [generate_key() for _ in range(5000)]
+    for license_key in keys:
+        bloom.add(license_key)
+
+    assert all(license_key in bloom for license_key in keys)
+    false_positives = sum(generate_key() in bloom for _ in range(5000))
+    assert false_positives < 100
+
+
+def test_rejects_malformed_and_unknown_keys(db_path):
+    issued = issue_keys(3, path=db_path)
+    prefilter = KeyFilter(db_path)
+
+    assert all(prefilter.check(license_key) for license_key in issued)
+    assert prefilter.check('RFX-7K3N-Q9PX-2TZR-4HW-GK') is False
+    assert prefilter.check('not-a-key') is False
+    assert prefilter.check(generate_key()) is False
+    stats = prefilter.stats()
+    assert stats['rejected_malformed'] == 2
+    assert stats['rejected_unknown'] == 1
+
+
+def test_legacy_and_nonconforming_keys_pass(db_path):
+    writer = get_writer(db_path)
+    writer.execute(_insert_license, 'RFX-A1B2-C3D4-E5F6-123-45')
+    # Ключ, выданный вручную в обход генератора
+    writer.execute(_insert_license, 'MANUAL-KEY')
+
+    prefilter = KeyFilter(db_path)
+    assert prefilter.check('RFX-A1B2-C3D4-E5F6-123-45')
+    assert prefilter.check('MANUAL-KEY')
+    assert prefilter.stats()['nonconforming_keys'] == 1
+
+
+def test_keys_inserted_elsewhere_found_after_refresh(db_path, monkeypatch):
+    prefilter = KeyFilter(db_path)
+    prefilter.load()
+    # Ключ выдал другой процесс (бот): фильтр узнает о нем догрузкой по rowid
+    license_key = generate_key()
+    get_writer(db_path).execute(_insert_license, license_key)
+
+    monkeypatch.setattr(key_filter, 'KEY_FILTER_REFRESH_INTERVAL', 0)
+    assert prefilter.check(license_key)
+    assert prefilter.stats()['refreshes'] == 1
+
+
+def test_event_loop_check_never_touches_database(db_path, monkeypatch):
+    prefilter = KeyFilter(db_path)
+    assert prefilter.check(generate_key(), allow_refresh=False) is None
+
+    prefilter.load()
+    monkeypatch.setattr(key_filter, 'KEY_FILTER_REFRESH_INTERVAL', 0)
+    assert prefilter.check(generate_key(), allow_refresh=False) is None
+    assert prefilter.check('not-a-key', allow_refresh=False) is False
+
+
+def test_issued_keys_visible_without_refresh(db_path):
+    prefilter = key_filter.get_filter(db_path)
+    prefilter.load()
+    license_key = issue_keys(1, path=db_path)[0]
+
+    assert prefilter.check(license_key)
+    assert prefilter.stats()['refreshes'] == 0
@@ -0,0 +1,105 @@
+import time
+from datetime import datetime, timedelta
+
+from license_cache import LicenseCache
+
+VERDICT = {"valid": True}
+REJECTED = {"valid": False}
+
+
+def test_hit_and_miss():
+    cache = LicenseCache(max_size=10)
+    assert cache.get('RFX-KEY', '1') is None
+    cache.set('RFX-KEY', '1', VERDICT, 200, etag='W/"abc"')
+
+    assert cache.get('RFX-KEY', '1') == (VERDICT, 200, 'W/"abc"')
+    assert cache.get('RFX-KEY', '2') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 2)
+
+
+def test_probe_miss_not_counted():
+    cache = LicenseCache(max_size=10)
+    assert cache.get('RFX-KEY', '1', count_miss=False) is None
+    assert cache.stats()['misses'] == 0
+
+
+def test_invalidate_drops_entries_for_all_accounts():
+    cache = LicenseCache(max_size=10)
+    cache.set('RFX-KEY', '1', VERDICT, 200)
+    cache.set('RFX-KEY', '2', VERDICT, 200)
+    cache.set('RFX-OTHER', '1', VERDICT, 200)
+
+    cache.invalidate('RFX-KEY')
+    assert cache.get('RFX-KEY', '1') is None
+    assert cache.get('RFX-KEY', '2') is None
+    assert cache.get('RFX-OTHER', '1') is not None
+
+
+def test_lru_eviction():
+    cache = LicenseCache(max_size=2)
+    cache.set('RFX-A', '1', VERDICT, 200)
+    cache.set('RFX-B', '1', VERDICT, 200)
+    cache.get('RFX-A', '1')
+    cache.set('RFX-C', '1', VERDICT, 200)
+
+    assert cache.get('RFX-B', '1') is None
+    assert cache.get('RFX-A', '1') is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_negative_verdicts_expire_sooner():
+    cache = LicenseCache(max_size=10, ttl=300, negative_ttl=0.01)
+    cache.set('RFX-KEY', '1', REJECTED, 404)
+    assert cache.get('RFX-KEY', '1') == (REJECTED, 404, None)
+    time.sleep(0.02)
+    assert cache.get('RFX-KEY', '1') is None
+
+
+def test_entry_lives_no_longer_than_license():
+    cache = LicenseCache(max_size=10, ttl=300)
+    cache.set('RFX-KEY', '1', VERDICT, 200, datetime.now() - timedelta(seconds=1))
+    assert cache.get('RFX-KEY', '1') is None
+
+    cache.set('RFX-KEY', '1', VERDICT, 200, datetime.now() + timedelta(seconds=0.05))
+    assert cache.get('RFX-KEY', '1') is not None
+    time.sleep(0.06)
+    assert cache.get('RFX-KEY', '1') is None
+
+
+def test_set_after_invalidate_is_dropped():
+    cache = LicenseCache(max_size=10)
+    # Промах: поколение берется до чтения из БД
+    generation = cache.generation('RFX-KEY')
+    # Пока вердикт читался, лицензию изменили
+    cache.invalidate('RFX-KEY')
+    cache.set('RFX-KEY', '1', VERDICT, 200, generation=generation)
+
+    assert cache.get('RFX-KEY', '1') is None
+    assert cache.stats()['stale_sets'] == 1
+
+    cache.set('RFX-KEY', '1', VERDICT, 200, generation=cache.generation('RFX-KEY'))
+    assert cache.get('RFX-KEY', '1') == (VERDICT, 200, None)
+
+
+def test_other_keys_unaffected_by_invalidate():
+    cache = LicenseCache(max_size=10)
+    generation = cache.generation('RFX-KEY')
+    cache.invalidate('RFX-OTHER')
+    cache.set('RFX-KEY', '1', VERDICT, 200, generation=generation)
+    assert cache.get('RFX-KEY', '1') is not None
+
+
+def test_clear_makes_pending_loads_stale():
+    cache = LicenseCache(max_size=2)
+    generation = cache.generation('RFX-KEY')
+    cache.clear()
+    cache.set('RFX-KEY', '1', VERDICT, 200, generation=generation)
+    assert cache.get('RFX-KEY', '1') is None
+
+
+def test_generations_stay_bounded():
+    cache = LicenseCache(max_size=2)
+    for i in range(10):
+        cache.invalidate(f'RFX-{i}')
+    assert len(cache._generations) <= 2
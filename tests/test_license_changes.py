@@ -0,0 +1,140 @@
+import json
+from datetime import datetime, timedelta
+
+import db
+import license_changes
+import license_service
+from db_writer import get_writer
+from license_changes import ChangeFollower, cursor_expired, fetch_changes, iter_changes, iter_ndjson
+
+
+def _insert_licenses(conn, license_keys):
+    conn.executemany('''
+        INSERT INTO licenses (license_key, plan_type, expires_at, is_active, payment_verified)
+        VALUES (?, 'monthly', ?, 1, 0)
+    ''', [(license_key, datetime.now() + timedelta(days=30)) for license_key in license_keys])
+
+
+def _verify(conn, license_key):
+    conn.execute('UPDATE licenses SET payment_verified = 1 WHERE license_key = ?', (license_key,))
+
+
+def _delete(conn, license_key):
+    conn.execute('DELETE FROM licenses WHERE license_key = ?', (license_key,))
+
+
+def _keys(count):
+    return [f'RFX-{i:04d}' for i in range(count)]
+
+
+def test_cursor_resume_reads_every_change_once(db_path):
+    get_writer(db_path).execute(_insert_licenses, _keys(7))
+    conn = db.get_connection(db_path)
+
+    seen = []
+    since = 0
+    while True:
+        rows, since, has_more = fetch_changes(conn, since, limit=3)
+        seen.extend(row['license_key'] for row in rows)
+        if not has_more:
+            break
+    assert seen == _keys(7)
+
+    # Продолжение с сохраненного курсора - только новые изменения
+    get_writer(db_path).execute(_verify, 'RFX-0003')
+    get_writer(db_path).execute(_delete, 'RFX-0005')
+    rows, cursor, has_more = fetch_changes(conn, since)
+    assert [(row['op'], row['license_key']) for row in rows] == [('update', 'RFX-0003'), ('delete', 'RFX-0005')]
+    assert not has_more
+    assert fetch_changes(conn, cursor) == ([], cursor, False)
+
+
+def test_version_is_last_change_id(db_path):
+    writer = get_writer(db_path)
+    writer.execute(_insert_licenses, _keys(2))
+    writer.execute(_verify, 'RFX-0000')
+    # Повторное подтверждение ничего не меняет - в журнал не идет
+    writer.execute(_verify, 'RFX-0000')
+
+    conn = db.get_connection(db_path)
+    versions = dict(conn.execute('SELECT license_key, version FROM licenses'))
+    changes = list(iter_changes(0, db_path))
+    assert len(changes) == 3
+    assert versions['RFX-0000'] == changes[-1]['id']
+    assert versions['RFX-0001'] == changes[1]['id']
+
+
+def test_ndjson_matches_pages(db_path):
+    get_writer(db_path).execute(_insert_licenses, _keys(5))
+    lines = b''.join(iter_ndjson(2, db_path, chunk=2)).decode('ascii').splitlines()
+    changes = [json.loads(line) for line in lines]
+    assert [change['license_key'] for change in changes] == _keys(5)[2:]
+    assert [change['version'] for change in changes] == [3, 4, 5]
+
+
+def test_pruned_cursor_requires_resync(db_path):
+    get_writer(db_path).execute(_insert_licenses, _keys(4))
+    get_writer(db_path).execute(license_changes._prune, '9999-12-31')
+
+    conn = db.get_connection(db_path)
+    # Последняя запись остается: курсор на ней или дальше актуален
+    assert license_changes.latest_version(conn) == 4
+    assert cursor_expired(conn, 0)
+    assert not cursor_expired(conn, 3)
+    assert not cursor_expired(conn, 4)
+
+
+def test_follower_delivers_new_changes(db_path):
+    batches = []
+    follower = ChangeFollower(db_path)
+    follower.subscribe(batches.append)
+    get_writer(db_path).execute(_insert_licenses, _keys(2))
+
+    # Первый опрос начинает с конца журнала
+    assert follower.poll() == 0
+    get_writer(db_path).execute(_verify, 'RFX-0001')
+    assert follower.poll() == 1
+    assert [row['license_key'] for row in batches[0]] == ['RFX-0001']
+
+    get_writer(db_path).execute(license_changes._prune, '9999-12-31')
+    follower.cursor = 0
+    get_writer(db_path).execute(_verify, 'RFX-0000')
+    follower.poll()
+    assert batches[1] is None
+    assert follower.stats()['resyncs'] == 1
+
+
+def test_admin_feed_pages_and_expired_cursor(service_db):
+    since = license_changes.latest_version(db.get_connection(service_db))
+    get_writer(service_db).execute(_insert_licenses, _keys(5))
+
+    body, status, _ = license_service.admin_license_changes({'since': str(since), 'limit': '2'})
+    assert status == 200
+    assert [change['license_key'] for change in body['changes']] == _keys(5)[:2]
+    assert body['has_more'] and body['next_cursor'] == body['changes'][-1]['version']
+    body, status, _ = license_service.admin_license_changes({'since': str(body['next_cursor']), 'limit': '10'})
+    assert [change['license_key'] for change in body['changes']] == _keys(5)[2:]
+    assert not body['has_more']
+
+    assert license_service.admin_license_changes({'since': '-1'})[1] == 400
+    get_writer(service_db).execute(license_changes._prune, '9999-12-31')
+    body, status, _ = license_service.admin_license_changes({'since': str(since)})
+    assert status == 410
+    assert body['error'] == 'cursor_expired'
+
+def test_feed_accepts_replica_token(monkeypatch):
+    monkeypatch.setattr(license_service, 'ADMIN_API_TOKEN', 'admin-secret')
+    monkeypatch.setattr(license_service, 'REPLICA_API_TOKEN', 'replica-secret')
+    feed = '/admin/license_changes'
+
+    assert license_service.admin_denied('replica-secret', feed) is None
+    assert license_service.admin_denied('admin-secret', feed) is None
+    assert license_service.admin_denied('replica-secret', '/admin/verify_payment')[1] == 401
+    assert license_service.admin_denied('wrong', feed)[1] == 401
+    assert license_service.admin_denied('', feed)[1] == 401
+
+
+def test_feed_disabled_without_tokens(monkeypatch):
+    monkeypatch.setattr(license_service, 'ADMIN_API_TOKEN', '')
+    monkeypatch.setattr(license_service, 'REPLICA_API_TOKEN', '')
+    assert license_service.admin_denied('anything', '/admin/license_changes')[1] == 503
@@ -0,0 +1,55 @@
+import db
+import license_keys
+from license_keys import KeyPool, generate_key, issue_keys, key_is_well_formed, legacy_key_format
+
+VALID_KEY = 'RFX-7K3M-Q9PX-2TZR-4HW-GK'
+
+
+def test_generated_keys_are_well_formed():
+    keys = {generate_key() for _ in range(1000)}
+    assert len(keys) == 1000
+    assert all(key_is_well_formed(license_key) for license_key in keys)
+
+
+def test_checksum_rejects_typo():
+    assert key_is_well_formed(VALID_KEY)
+    # Одна опечатка в теле или в контрольной сумме
+    assert not key_is_well_formed('RFX-7K3N-Q9PX-2TZR-4HW-GK')
+    assert not key_is_well_formed('RFX-7K3M-Q9PX-2TZR-4HW-GM')
+    # Переставленные символы
+    assert not key_is_well_formed('RFX-K73M-Q9PX-2TZR-4HW-GK')
+
+
+def test_malformed_keys_rejected():
+    for license_key in ('', 'RFX', VALID_KEY.lower(), VALID_KEY + 'X', 'ABC' + VALID_KEY[3:],
+                        # I, L, O, U вне алфавита Crockford
+                        'RFX-7K3I-Q9PX-2TZR-4HW-GK'):
+        assert not key_is_well_formed(license_key)
+
+
+def test_legacy_keys_recognized_separately():
+    legacy_key = 'RFX-A1B2-C3D4-E5F6-123-45'
+    assert legacy_key_format(legacy_key)
+    assert not key_is_well_formed(legacy_key)
+    assert not legacy_key_format(VALID_KEY)
+
+
+def test_issue_keys_inserts_unique_keys(db_path):
+    keys = issue_keys(50, plan_type='monthly', days=30, path=db_path)
+
+    assert len(set(keys)) == 50
+    assert all(key_is_well_formed(license_key) for license_key in keys)
+    rows = db.get_connection(db_path).execute(
+        'SELECT COUNT(*) FROM licenses WHERE payment_verified = 1 AND is_active = 1'
+    ).fetchone()
+    assert rows[0] == 50
+
+
+def test_pool_skips_existing_keys(db_path, monkeypatch):
+    taken = issue_keys(1, path=db_path)[0]
+    generated = iter([taken, VALID_KEY])
+    monkeypatch.setattr(license_keys, 'generate_key', lambda: next(generated))
+
+    pool = KeyPool(db_path, size=1)
+    assert pool.take() == VALID_KEY
+    assert pool.stats()['issued'] == 1
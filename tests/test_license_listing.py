@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+import db
+import license_service
+import main
+from db_writer import get_writer
+from license_listing import LicenseQuery, iter_ndjson
+
+# (ключ, план, пользователь, оплачена, created_at, expires_at); created_at повторяются - порядок по id
+LICENSES = [
+    ('RFX-0', 'trial', '1', 1, '2026-01-01 00:00:00', '2026-01-04 00:00:00'),
+    ('RFX-1', 'monthly', '1', 1, '2026-01-01 00:00:00', '2026-02-01 00:00:00'),
+    ('RFX-2', 'monthly', '2', 0, '2026-01-02 00:00:00', '2026-02-02 00:00:00'),
+    ('RFX-3', 'trial', '2', 1, '2026-01-02 00:00:00', '2026-01-05 00:00:00'),
+    ('RFX-4', 'monthly', '3', 1, '2026-01-03 00:00:00', '2026-02-03 00:00:00'),
+    ('RFX-5', 'monthly', '3', 0, '2026-01-03 00:00:00', '2026-02-03 00:00:00'),
+    ('RFX-6', 'monthly', '1', 1, '2026-01-04 00:00:00', '2026-02-04 00:00:00')
+]
+
+
+def _insert_licenses(conn):
+    conn.executemany('''
+        INSERT INTO licenses (license_key, plan_type, telegram_user_id, payment_verified, created_at, expires_at, is_active)
+        VALUES (?, ?, ?, ?, ?, ?, 1)
+    ''', LICENSES)
+
+
+@pytest.fixture
+def client(service_db, monkeypatch):
+    monkeypatch.setattr(license_service, 'ADMIN_API_TOKEN', 'admin-secret')
+    get_writer(service_db).execute(_insert_licenses)
+    client = main.app.test_client()
+    client.environ_base['HTTP_X_ADMIN_TOKEN'] = 'admin-secret'
+    return client
+
+
+def _walk(client, query, limit):
+    """Все страницы списка: ключи по страницам"""
+    pages, cursor = [], None
+    while True:
+        url = f'/admin/licenses?limit={limit}&{query}' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200
+        body = response.get_json()
+        pages.append([item['license_key'] for item in body['licenses']])
+        cursor = body['next_cursor']
+        if cursor is None:
+            return pages
+
+
+def test_newest_first_pages(client):
+    assert _walk(client, '', 3) == [['RFX-6', 'RFX-5', 'RFX-4'], ['RFX-3', 'RFX-2', 'RFX-1'], ['RFX-0']]
+
+
+def test_exact_page_boundary(client):
+    assert _walk(client, '', 7) == [['RFX-6', 'RFX-5', 'RFX-4', 'RFX-3', 'RFX-2', 'RFX-1', 'RFX-0']]
+    assert _walk(client, 'plan_type=trial', 2) == [['RFX-3', 'RFX-0']]
+
+
+def test_expiry_range_ascending(client):
+    pages = _walk(client, 'expires_after=2026-02-01&expires_before=2026-02-04T00:00:00Z', 2)
+    assert pages == [['RFX-1', 'RFX-2'], ['RFX-4', 'RFX-5']]
+
+
+@pytest.mark.parametrize('query, keys', [
+    ('plan_type=monthly&payment_verified=false', ['RFX-5', 'RFX-2']),
+    ('telegram_user_id=1', ['RFX-6', 'RFX-1', 'RFX-0']),
+    ('telegram_user_id=1&plan_type=monthly&expires_before=2026-02-02', ['RFX-1'])
+])
+def test_filters(client, query, keys):
+    assert sum(_walk(client, query, 2), []) == keys
+
+
+@pytest.mark.parametrize('query', [
+    'limit=x', 'cursor=broken', 'cursor=2026-01-01|x', 'payment_verified=yes', 'expires_after=tomorrow'
+])
+def test_bad_query(client, query):
+    assert client.get(f'/admin/licenses?{query}').status_code == 400
+
+
+def test_ndjson_export_streams_all_rows(client):
+    response = client.get('/admin/licenses?format=ndjson&plan_type=monthly')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [row['license_key'] for row in rows] == ['RFX-6', 'RFX-5', 'RFX-4', 'RFX-2', 'RFX-1']
+    assert rows[0]['payment_verified'] is True
+
+    assert client.get('/admin/licenses?format=ndjson&cursor=broken').status_code == 400
+
+
+def test_export_reads_in_chunks(client):
+    chunks = list(iter_ndjson(LicenseQuery(), path=db.DATABASE_PATH, chunk=3))
+    assert [chunk.count(b'\n') for chunk in chunks] == [3, 3, 1]
+    assert [json.loads(line)['license_key'] for line in b''.join(chunks).splitlines()] == [
+        f'RFX-{i}' for i in reversed(range(7))
+    ]
@@ -0,0 +1,130 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+import license_service
+import license_tokens
+import main
+from db_writer import get_writer
+from license_tokens import InvalidToken, issue_token, load_private_key, load_public_key, public_key_b64, verify_token
+
+PRIVATE_KEY = Ed25519PrivateKey.generate()
+PUBLIC_KEY = PRIVATE_KEY.public_key()
+
+
+def _issue(ttl=60, license_expires_ts=None):
+    return issue_token('RFX-KEY', '100', 'monthly', '2030-01-01T00:00:00', license_expires_ts,
+                       ttl=ttl, private_key=PRIVATE_KEY)
+
+
+def test_issue_and_verify_round_trip():
+    token, token_exp = _issue()
+    claims = verify_token(token, '100', public_key=PUBLIC_KEY)
+    assert (claims['k'], claims['a'], claims['p'], claims['exp']) == ('RFX-KEY', '100', 'monthly', token_exp)
+    assert token_exp - time.time() <= 60
+
+
+def test_token_never_outlives_license():
+    license_expires_ts = time.time() + 10
+    _, token_exp = _issue(ttl=3600, license_expires_ts=license_expires_ts)
+    assert token_exp == int(license_expires_ts)
+
+
+@pytest.mark.parametrize('mutate', [
+    lambda token: token[:-2] + ('AA' if not token.endswith('AA') else 'BB'),
+    lambda token: 'e30' + token[3:],
+    lambda token: token.replace('.', ''),
+])
+def test_tampered_token_rejected(mutate):
+    token, _ = _issue()
+    with pytest.raises(InvalidToken):
+        verify_token(mutate(token), public_key=PUBLIC_KEY)
+
+
+def test_wrong_key_account_and_expiry_rejected():
+    token, token_exp = _issue()
+    with pytest.raises(InvalidToken):
+        verify_token(token, public_key=Ed25519PrivateKey.generate().public_key())
+    with pytest.raises(InvalidToken):
+        verify_token(token, '200', public_key=PUBLIC_KEY)
+    with pytest.raises(InvalidToken):
+        verify_token(token, public_key=PUBLIC_KEY, now=token_exp)
+
+
+def test_public_key_for_ea_verifies_tokens():
+    # Советнику отдается только base64url открытого ключа
+    token, _ = _issue()
+    assert verify_token(token, public_key=load_public_key(public_key_b64(PRIVATE_KEY)))['k'] == 'RFX-KEY'
+
+
+def test_malformed_private_key_refused():
+    with pytest.raises(ValueError):
+        load_private_key('c2hvcnQ')
+
+
+def _insert_license(conn, license_key, payment_verified=1):
+    conn.execute('''
+        INSERT INTO licenses (license_key, plan_type, expires_at, is_active, payment_verified)
+        VALUES (?, 'monthly', ?, 1, ?)
+    ''', (license_key, (datetime.now() + timedelta(days=30)).isoformat(), payment_verified))
+
+
+@pytest.fixture
+def client(service_db):
+    get_writer(service_db).execute(_insert_license, 'RFX-PAID')
+    get_writer(service_db).execute(_insert_license, 'RFX-UNPAID', payment_verified=0)
+    return main.app.test_client()
+
+
+def test_token_endpoint(client, monkeypatch):
+    monkeypatch.setattr(license_tokens, '_private_key', PRIVATE_KEY)
+
+    response = client.get('/license_token/RFX-PAID/100')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert verify_token(body['token'], '100', public_key=PUBLIC_KEY)['k'] == 'RFX-PAID'
+    assert 0 < body['token_ttl'] <= license_service.LICENSE_TOKEN_TTL
+
+    # Токен выдается только по действительной лицензии и для привязанного счета
+    assert client.get('/license_token/RFX-PAID/200').status_code == 403
+    response = client.get('/license_token/RFX-UNPAID/100')
+    assert response.status_code == 402
+    assert 'token' not in response.get_json()
+
+
+def test_token_endpoint_disabled_without_key(client, monkeypatch):
+    monkeypatch.setattr(license_tokens, '_private_key', None)
+    assert client.get('/license_token/RFX-PAID/100').status_code == 503
+
+
+@pytest.fixture
+def admin_client(client, monkeypatch):
+    monkeypatch.setattr(license_service, 'ADMIN_API_TOKEN', 'admin-secret')
+    client.environ_base['HTTP_X_ADMIN_TOKEN'] = 'admin-secret'
+    return client
+
+
+def test_revoked_license_listed_and_refused_token(admin_client, monkeypatch):
+    monkeypatch.setattr(license_tokens, '_private_key', PRIVATE_KEY)
+    token = admin_client.get('/license_token/RFX-PAID/100').get_json()['token']
+    assert admin_client.get('/revoked_licenses').get_json()['revoked'] == []
+
+    response = admin_client.post('/admin/revoke_license/RFX-PAID')
+    assert response.status_code == 200
+    assert response.get_json()['license_key'] == 'RFX-PAID'
+
+    # Советник с живым токеном находит ключ в списке отзыва при обновлении
+    assert verify_token(token, '100', public_key=PUBLIC_KEY)['k'] in admin_client.get('/revoked_licenses').get_json()['revoked']
+    # Вердикт из кэша сброшен: новый токен не выдается, проверка отказывает
+    response = admin_client.get('/license_token/RFX-PAID/100')
+    assert response.status_code == 403
+    assert 'token' not in response.get_json()
+    assert admin_client.get('/check_license/RFX-PAID/100').get_json()['valid'] is False
+
+
+def test_revoke_unknown_license(admin_client):
+    assert admin_client.post('/admin/revoke_license/RFX-MISSING').status_code == 404
+    del admin_client.environ_base['HTTP_X_ADMIN_TOKEN']
+    assert admin_client.post('/admin/revoke_license/RFX-PAID').status_code == 401
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+import telegram_bot
+from db_writer import get_writer
+
+
+def _insert_licenses(conn, telegram_user_id, count, created_at):
+    # Пары лицензий с одинаковым created_at: порядок внутри пары задает id
+    for i in range(count):
+        conn.execute('''
+            INSERT INTO licenses (license_key, plan_type, telegram_user_id, expires_at, is_active,
+                                  payment_verified, created_at)
+            VALUES (?, 'monthly', ?, ?, 1, 1, ?)
+        ''', (f'RFX-{i:02d}', str(telegram_user_id), created_at + timedelta(days=40),
+              (created_at + timedelta(minutes=i // 2)).strftime('%Y-%m-%d %H:%M:%S')))
+
+
+def _keys(rows):
+    return [row['license_key'] for row in rows]
+
+
+def _cursor(data):
+    return telegram_bot.parse_licenses_page_data(data)
+
+
+def test_walk_pages_both_ways(service_db):
+    get_writer(service_db).execute(_insert_licenses, 42, 12, datetime(2026, 1, 1))
+    newest_first = [f'RFX-{i:02d}' for i in reversed(range(12))]
+
+    first, has_newer, has_older = telegram_bot.get_user_licenses_page(42, page_size=5)
+    assert _keys(first) == newest_first[:5]
+    assert (has_newer, has_older) == (False, True)
+
+    before, after = _cursor(telegram_bot.licenses_page_data("old", first[-1]))
+    second, has_newer, has_older = telegram_bot.get_user_licenses_page(42, before, after, page_size=5)
+    assert _keys(second) == newest_first[5:10]
+    assert (has_newer, has_older) == (True, True)
+
+    before, after = _cursor(telegram_bot.licenses_page_data("old", second[-1]))
+    last, has_newer, has_older = telegram_bot.get_user_licenses_page(42, before, after, page_size=5)
+    assert _keys(last) == newest_first[10:]
+    assert (has_newer, has_older) == (True, False)
+
+    # Назад: страница "новее" - ровно предыдущая, в том же порядке
+    before, after = _cursor(telegram_bot.licenses_page_data("new", last[0]))
+    back, has_newer, has_older = telegram_bot.get_user_licenses_page(42, before, after, page_size=5)
+    assert _keys(back) == newest_first[5:10]
+    assert (has_newer, has_older) == (True, True)
+
+    before, after = _cursor(telegram_bot.licenses_page_data("new", back[0]))
+    top, has_newer, has_older = telegram_bot.get_user_licenses_page(42, before, after, page_size=5)
+    assert _keys(top) == newest_first[:5]
+    assert (has_newer, has_older) == (False, True)
+
+
+def test_exact_page_has_no_older_button(service_db):
+    get_writer(service_db).execute(_insert_licenses, 42, 5, datetime(2026, 1, 1))
+    rows, has_newer, has_older = telegram_bot.get_user_licenses_page(42, page_size=5)
+    assert len(rows) == 5
+    assert (has_newer, has_older) == (False, False)
+    assert telegram_bot.templates.licenses_page_markup(None, None) is telegram_bot.templates.licenses_markup
+
+
+def test_callback_data_fits_telegram_limit(service_db):
+    get_writer(service_db).execute(_insert_licenses, 42, 1, datetime(2026, 1, 1))
+    rows = telegram_bot.get_user_licenses_from_db(42)
+    data = telegram_bot.licenses_page_data("old", rows[0])
+    assert len(data.encode('utf-8')) <= 64
+    assert telegram_bot.parse_licenses_page_data(data) == (('2026-01-01 00:00:00', rows[0]['id']), None)
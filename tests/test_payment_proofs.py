@@ -0,0 +1,137 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import db
+import payment_proofs
+from db_writer import get_writer
+from payment_proofs import ingest_bytes, ingest_telegram_file
+
+PROOF = b'\x89PNG receipt 100 USD'
+
+
+def _insert_license(conn, license_key, telegram_user_id, payment_verified=0):
+    conn.execute('''
+        INSERT INTO licenses (license_key, plan_type, telegram_user_id, expires_at, is_active, payment_verified)
+        VALUES (?, 'monthly', ?, ?, 1, ?)
+    ''', (license_key, str(telegram_user_id), datetime.now() + timedelta(days=30), payment_verified))
+
+
+@pytest.fixture
+def licenses(db_path):
+    writer = get_writer(db_path)
+    writer.execute(_insert_license, 'RFX-A', 1)
+    writer.execute(_insert_license, 'RFX-B', 2)
+    writer.execute(_insert_license, 'RFX-PAID', 1, 1)
+    return db_path
+
+
+def _verified(path, license_key):
+    return db.get_connection(path).execute(
+        'SELECT payment_verified FROM licenses WHERE license_key = ?', (license_key,)
+    ).fetchone()[0]
+
+
+def _proof_statuses(path):
+    return [tuple(row) for row in db.get_connection(path).execute(
+        'SELECT license_key, status FROM payment_proofs ORDER BY id'
+    )]
+
+
+def test_accepted_proof_stays_pending(licenses):
+    result = ingest_bytes(PROOF, 1, 'RFX-A', file_id='file-1', path=licenses)
+    assert result.accepted
+    assert result.content_hash == payment_proofs.content_hash(PROOF)
+    # Чек сам по себе оплату не подтверждает - решает админ
+    assert _verified(licenses, 'RFX-A') == 0
+
+    row = db.get_connection(licenses).execute('SELECT * FROM payment_proofs').fetchone()
+    assert (row['telegram_user_id'], row['license_key'], row['file_id'], row['file_size']) == ('1', 'RFX-A', 'file-1', len(PROOF))
+    assert (row['status'], row['reviewed_at']) == ('pending', None)
+
+
+def test_confirm_payment_approves_pending_proofs(licenses):
+    ingest_bytes(PROOF, 1, 'RFX-A', path=licenses)
+    ingest_bytes(PROOF + b'2', 2, 'RFX-B', path=licenses)
+
+    assert payment_proofs.confirm_payment('RFX-A', path=licenses)
+    assert _verified(licenses, 'RFX-A') == 1
+    assert _proof_statuses(licenses) == [('RFX-A', 'approved'), ('RFX-B', 'pending')]
+    assert not payment_proofs.confirm_payment('RFX-MISSING', path=licenses)
+
+
+def test_legacy_proofs_of_paid_licenses_approved(db_path):
+    conn = db.get_connection(db_path)
+    conn.execute('DROP TABLE payment_proofs')
+    conn.execute('''
+        CREATE TABLE payment_proofs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            content_hash TEXT UNIQUE NOT NULL,
+            telegram_user_id TEXT NOT NULL,
+            license_key TEXT NOT NULL,
+            file_id TEXT,
+            file_size INTEGER,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    _insert_license(conn, 'RFX-PAID', 1, 1)
+    _insert_license(conn, 'RFX-OPEN', 2)
+    conn.executemany(
+        'INSERT INTO payment_proofs (content_hash, telegram_user_id, license_key) VALUES (?, ?, ?)',
+        [('h1', '1', 'RFX-PAID'), ('h2', '2', 'RFX-OPEN')]
+    )
+    conn.commit()
+
+    db.init_schema(conn)
+    assert _proof_statuses(db_path) == [('RFX-PAID', 'approved'), ('RFX-OPEN', 'pending')]
+
+
+def test_same_screenshot_rejected_for_another_license(licenses):
+    assert ingest_bytes(PROOF, 1, 'RFX-A', path=licenses).accepted
+
+    result = ingest_bytes(bytearray(PROOF), 2, 'RFX-B', path=licenses)
+    assert result.status == payment_proofs.DUPLICATE
+    assert result.duplicate_of == ('1', 'RFX-A')
+    assert _verified(licenses, 'RFX-B') == 0
+
+
+@pytest.mark.parametrize('license_key, data, status', [
+    ('RFX-PAID', PROOF, payment_proofs.ALREADY_PAID),
+    ('RFX-MISSING', PROOF, payment_proofs.UNKNOWN_LICENSE),
+    ('RFX-A', b'', payment_proofs.EMPTY)
+])
+def test_rejected_proofs_not_stored(licenses, license_key, data, status):
+    assert ingest_bytes(data, 1, license_key, path=licenses).status == status
+    assert db.get_connection(licenses).execute('SELECT COUNT(*) FROM payment_proofs').fetchone()[0] == 0
+
+
+def test_too_large_refused_before_download(licenses, monkeypatch):
+    monkeypatch.setattr(payment_proofs, 'PAYMENT_PROOF_MAX_BYTES', 4)
+
+    class TelegramFile:
+        file_id = 'big'
+        file_size = 5
+
+        async def download_to_memory(self, buffer):
+            raise AssertionError("слишком большой файл не скачивается")
+
+    result = asyncio.run(ingest_telegram_file(TelegramFile(), 1, 'RFX-A', path=licenses))
+    assert result.status == payment_proofs.TOO_LARGE
+    assert _verified(licenses, 'RFX-A') == 0
+
+
+def test_telegram_file_downloaded_to_memory(licenses):
+    class TelegramFile:
+        file_id = 'photo-1'
+        file_size = len(PROOF)
+
+        async def download_to_memory(self, buffer):
+            buffer.write(PROOF)
+
+    try:
+        result = asyncio.run(ingest_telegram_file(TelegramFile(), 1, 'RFX-A', path=licenses))
+    finally:
+        payment_proofs.shutdown()
+    assert result.accepted
+    assert result.content_hash == payment_proofs.content_hash(PROOF)
@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import db
+import license_service
+import main
+import payment_review
+from db_writer import get_writer
+from payment_proofs import ingest_bytes
+
+ADMIN_TOKEN = 'admin-secret'
+
+
+def _insert_licenses(conn, count):
+    for i in range(count):
+        conn.execute('''
+            INSERT INTO licenses (license_key, plan_type, telegram_user_id, expires_at, is_active, payment_verified)
+            VALUES (?, 'monthly', ?, ?, 1, 0)
+        ''', (f'RFX-P{i}', str(100 + i), datetime.now() + timedelta(days=30)))
+        conn.execute('''
+            INSERT INTO payments (telegram_user_id, license_key, amount, plan_type, verified)
+            VALUES (?, ?, 100, 'monthly', 0)
+        ''', (str(100 + i), f'RFX-P{i}'))
+
+
+@pytest.fixture
+def client(service_db, monkeypatch):
+    monkeypatch.setattr(license_service, 'ADMIN_API_TOKEN', ADMIN_TOKEN)
+    get_writer(service_db).execute(_insert_licenses, 4)
+    # Чеки 1..5: по одному на P0..P3, второй чек P0 - пятым
+    for i in range(4):
+        ingest_bytes(f'receipt-{i}'.encode(), 100 + i, f'RFX-P{i}')
+    ingest_bytes(b'receipt-0-again', 100, 'RFX-P0')
+
+    client = main.app.test_client()
+    client.environ_base['HTTP_X_ADMIN_TOKEN'] = ADMIN_TOKEN
+    return client
+
+
+def _license(license_key):
+    return tuple(db.get_connection(db.DATABASE_PATH).execute(
+        'SELECT is_active, payment_verified FROM licenses WHERE license_key = ?', (license_key,)
+    ).fetchone())
+
+
+def _proofs():
+    return dict(db.get_connection(db.DATABASE_PATH).execute('SELECT id, status FROM payment_proofs'))
+
+
+def _queue(client):
+    body = client.get('/admin/pending_payments').get_json()
+    return [proof['proof_id'] for proof in body['proofs']]
+
+
+def test_admin_token_required(client, monkeypatch):
+    assert client.get('/admin/pending_payments', headers={'X-Admin-Token': 'wrong'}).status_code == 401
+    assert main.app.test_client().get('/admin/pending_payments').status_code == 401
+    assert main.app.test_client().post('/admin/review_payments', json={"approve": [1]}).status_code == 401
+    assert _license('RFX-P0') == (1, 0)
+
+    monkeypatch.setattr(license_service, 'ADMIN_API_TOKEN', '')
+    assert client.get('/admin/pending_payments').status_code == 503
+
+
+def test_queue_pages_oldest_first(client):
+    proof_ids, cursor = [], None
+    while True:
+        query = '/admin/pending_payments?limit=2' + (f'&cursor={cursor}' if cursor else '')
+        body = client.get(query).get_json()
+        assert body['total'] <= 2
+        proof_ids.extend(proof['proof_id'] for proof in body['proofs'])
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+    assert proof_ids == [1, 2, 3, 4, 5]
+
+    first = client.get('/admin/pending_payments?limit=1').get_json()['proofs'][0]
+    assert (first['license_key'], first['amount'], first['is_active']) == ('RFX-P0', 100, True)
+
+
+def test_exact_last_page_has_no_cursor(client):
+    body = client.get('/admin/pending_payments?limit=5').get_json()
+    assert body['total'] == 5 and body['next_cursor'] is None
+
+
+def test_bulk_review_in_one_transaction(client):
+    # Вердикт закэширован до проверки оплаты
+    assert client.get('/check_license/RFX-P0/100').status_code == 402
+    writer = get_writer(db.DATABASE_PATH)
+    commits = writer.commits
+
+    response = client.post('/admin/review_payments', json={"approve": [1, 99], "reject": [2]})
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "success": True,
+        "approved": [1],
+        "rejected": [2],
+        "skipped": [99],
+        "verified_licenses": ['RFX-P0']
+    }
+    assert writer.commits - commits == 1
+
+    # Одобрение оплачивает лицензию и закрывает ее второй чек; отказ лицензию не трогает
+    assert _license('RFX-P0') == (1, 1)
+    assert _license('RFX-P1') == (1, 0)
+    assert _proofs() == {1: 'approved', 2: 'rejected', 3: 'pending', 4: 'pending', 5: 'approved'}
+    assert client.get('/check_license/RFX-P0/100').status_code == 200
+    assert _queue(client) == [3, 4]
+
+    # Отклоненный чек можно заменить правильным
+    assert ingest_bytes(b'receipt-1-fixed', 101, 'RFX-P1').accepted
+    assert _queue(client) == [3, 4, 6]
+
+    # Повторное решение по уже обработанным чекам ничего не меняет
+    body = client.post('/admin/review_payments', json={"reject": [1, 2]}).get_json()
+    assert body['rejected'] == [] and body['skipped'] == [1, 2]
+    assert _license('RFX-P0') == (1, 1)
+
+
+@pytest.mark.parametrize('body', [
+    None,
+    [],
+    {"approve": 1},
+    {"approve": ['RFX-P0']},
+    {"approve": [True]},
+    {"approve": [1], "reject": [1]}
+])
+def test_bad_review_request(client, body):
+    assert client.post('/admin/review_payments', json=body).status_code == 400
+    assert set(_proofs().values()) == {'pending'}
+
+
+def test_review_batch_limit(client, monkeypatch):
+    monkeypatch.setattr(payment_review, 'REVIEW_BULK_MAX', 2)
+    response = client.post('/admin/review_payments', json={"approve": [1, 2, 3]})
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize('query', ['limit=x', 'cursor=broken', 'cursor=2026-01-01|x'])
+def test_bad_queue_request(client, query):
+    assert client.get(f'/admin/pending_payments?{query}').status_code == 400
@@ -0,0 +1,129 @@
+import pytest
+
+import license_service
+from license_keys import generate_key, issue_keys
+import rate_limit
+from rate_limit import MemoryBuckets, RateLimiter, SqliteBuckets, client_address, retry_after_header
+
+CLIENT_IP = '203.0.113.7'
+
+
+def _limiter(backend=None, **limits):
+    limits = {'key_rate': 1, 'key_burst': 2, 'ip_rate': 100, 'ip_burst': 100, **limits}
+    return RateLimiter(backend or MemoryBuckets(), enabled=True, key_enabled=True, **limits)
+
+
+def test_key_bucket_throttles_after_burst():
+    limiter = _limiter()
+    assert limiter.check('RFX-KEY', CLIENT_IP) == 0
+    assert limiter.check('RFX-KEY', CLIENT_IP) == 0
+
+    wait = limiter.check('RFX-KEY', CLIENT_IP)
+    assert 0 < wait <= 1
+    assert limiter.stats()['throttled_key'] == 1
+    # Другой ключ с того же IP не затронут
+    assert limiter.check('RFX-OTHER', CLIENT_IP) == 0
+
+
+def test_throttled_check_takes_no_tokens():
+    backend = MemoryBuckets()
+    limiter = _limiter(backend, key_burst=1)
+    limiter.check('RFX-KEY', CLIENT_IP)
+    ip_tokens = backend._buckets[f'ip:{CLIENT_IP}'][0]
+
+    assert limiter.check('RFX-KEY', CLIENT_IP) > 0
+    assert backend._buckets[f'ip:{CLIENT_IP}'][0] == ip_tokens
+
+
+def test_filtered_key_charges_only_ip_bucket():
+    backend = MemoryBuckets()
+    limiter = _limiter(backend, ip_burst=2, ip_rate=1)
+    assert limiter.check(None, CLIENT_IP) == 0
+    assert limiter.check(None, CLIENT_IP) == 0
+    assert limiter.check(None, CLIENT_IP) > 0
+
+    assert list(backend._buckets) == [f'ip:{CLIENT_IP}']
+    assert limiter.stats()['throttled_ip'] == 1
+
+
+def test_disabled_limiter_allows_everything():
+    backend = MemoryBuckets()
+    limiter = RateLimiter(backend, key_burst=1, enabled=False)
+    assert all(limiter.check('RFX-KEY', CLIENT_IP) == 0 for _ in range(10))
+    assert limiter.check_batch(['RFX-KEY'] * 10, CLIENT_IP) == (0.0, {})
+    assert not backend._buckets
+
+
+
+def test_ip_limit_on_by_default():
+    # Без настроек: лимит по IP включен, по ключу - нет
+    assert rate_limit.rate_limiter.enabled and not rate_limit.rate_limiter.key_enabled
+
+    backend = MemoryBuckets()
+    limiter = RateLimiter(backend, key_burst=1, ip_rate=1, ip_burst=3)
+    assert all(limiter.check('RFX-KEY', CLIENT_IP) == 0 for _ in range(3))
+    assert limiter.check('RFX-KEY', CLIENT_IP) > 0
+    assert limiter.check_batch(['RFX-KEY'] * 10, '198.51.100.1') == (0.0, {})
+    assert sorted(backend._buckets) == ['ip:198.51.100.1', f'ip:{CLIENT_IP}']
+    assert limiter.stats()['throttled_key'] == 0
+
+def test_batch_throttles_keys_over_limit():
+    limiter = _limiter(key_burst=1)
+    limiter.check('RFX-HOT', CLIENT_IP)
+
+    wait, throttled = limiter.check_batch(['RFX-HOT', 'RFX-COLD', 'RFX-COLD'], CLIENT_IP)
+    assert wait == 0
+    assert list(throttled) == ['RFX-HOT']
+
+
+def test_batch_ip_limit_rejects_whole_request():
+    limiter = _limiter(ip_burst=1, ip_rate=1)
+    assert limiter.check_batch(['RFX-A'], CLIENT_IP)[0] == 0
+    wait, throttled = limiter.check_batch(['RFX-B'], CLIENT_IP)
+    assert wait > 0 and throttled == {}
+
+
+def test_sqlite_buckets_shared_between_workers(tmp_path):
+    path = str(tmp_path / 'rate_limits.db')
+    # Два воркера gunicorn - два хранилища на одном файле
+    first = _limiter(SqliteBuckets(path), key_burst=2)
+    second = _limiter(SqliteBuckets(path), key_burst=2)
+
+    assert first.check('RFX-KEY', CLIENT_IP) == 0
+    assert second.check('RFX-KEY', CLIENT_IP) == 0
+    assert first.check('RFX-KEY', CLIENT_IP) > 0
+
+
+@pytest.mark.parametrize('wait, header', [(0.01, '1'), (1.0, '1'), (2.1, '3')])
+def test_retry_after_header(wait, header):
+    assert retry_after_header(wait) == header
+
+
+def test_client_address_trusts_only_configured_proxies():
+    assert client_address('10.0.0.1', '198.51.100.1, 203.0.113.7', trusted_proxies=0) == '10.0.0.1'
+    assert client_address('10.0.0.1', '198.51.100.1, 203.0.113.7', trusted_proxies=1) == '203.0.113.7'
+    assert client_address('10.0.0.1', '203.0.113.7', trusted_proxies=2) == '10.0.0.1'
+
+
+def test_check_license_returns_429_with_retry_after(service_db, monkeypatch):
+    limiter = _limiter(key_burst=1)
+    monkeypatch.setattr(license_service, 'rate_limiter', limiter)
+    license_key = issue_keys(1, path=service_db)[0]
+
+    _, status, _ = license_service.check_license(license_key, '12345', client_ip=CLIENT_IP)
+    assert status == 200
+
+    body, status, headers = license_service.check_license(license_key, '12345', client_ip=CLIENT_IP)
+    assert status == 429
+    assert body['reason'] == 'rate_limited'
+    assert int(headers['Retry-After']) >= 1
+
+
+def test_check_license_unknown_key_charges_ip_only(service_db, monkeypatch):
+    backend = MemoryBuckets()
+    monkeypatch.setattr(license_service, 'rate_limiter', _limiter(backend))
+
+    for _ in range(3):
+        _, status, _ = license_service.check_license(generate_key(), '12345', client_ip=CLIENT_IP)
+        assert status == 404
+    assert list(backend._buckets) == [f'ip:{CLIENT_IP}']
@@ -0,0 +1,86 @@
+import io
+import json
+import threading
+from logging.handlers import QueueHandler
+
+import pytest
+
+import request_logging
+from request_logging import log_verdict, request_logger
+
+
+@pytest.fixture
+def log_lines(monkeypatch):
+    """Лог проверок в буфер; строки читаются после перезапуска слушателя (stop дописывает очередь)"""
+    stream = io.StringIO()
+    monkeypatch.setattr(request_logging, '_listener', None)
+    request_logging.setup_request_logging(stream)
+    listener = request_logging._listener
+
+    def read():
+        listener.stop()
+        listener.start()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    yield read
+    # Слушатель остановит atexit; новые записи в его очередь больше не попадают
+    for handler in list(request_logger.handlers):
+        if isinstance(handler, QueueHandler):
+            request_logger.removeHandler(handler)
+
+
+def test_one_json_record_per_check(log_lines, monkeypatch):
+    monkeypatch.setattr(request_logging, 'REQUEST_LOG_SAMPLE_RATE', 1.0)
+    log_verdict('RFX-KEY', '100', {"valid": True}, 200, 1.23456, cached=True, client_ip='203.0.113.7')
+
+    [record] = log_lines()
+    assert record['event'] == 'license_check'
+    assert record['level'] == 'INFO'
+    assert {key: record[key] for key in ('license_key', 'account_number', 'status', 'cached', 'client_ip')} == {
+        'license_key': 'RFX-KEY', 'account_number': '100', 'status': 200, 'cached': True, 'client_ip': '203.0.113.7'
+    }
+    assert record['duration_ms'] == 1.235
+
+
+def test_rejections_always_logged(log_lines, monkeypatch):
+    monkeypatch.setattr(request_logging, 'REQUEST_LOG_SAMPLE_RATE', 0.0)
+    sampled_out = request_logging.sampled_out
+
+    log_verdict('RFX-KEY', '100', {"valid": True}, 200, 1.0)
+    log_verdict('RFX-KEY', '200', {"valid": False, "reason": "wrong_account"}, 403, 1.0)
+
+    records = log_lines()
+    assert [(record['level'], record['reason'], record['sample_rate']) for record in records] == [
+        ('WARNING', 'wrong_account', 1.0)
+    ]
+    assert request_logging.sampled_out - sampled_out == 1
+
+
+def test_setup_is_idempotent(log_lines):
+    listener = request_logging._listener
+    request_logging.setup_request_logging()
+    assert request_logging._listener is listener
+    assert sum(isinstance(handler, QueueHandler) for handler in request_logger.handlers) == 1
+
+
+def test_record_formatted_by_listener(log_lines, monkeypatch):
+    formatted_in = []
+    format_record = request_logging.JsonFormatter.format
+
+    def tracking_format(self, record):
+        formatted_in.append(threading.current_thread())
+        return format_record(self, record)
+
+    monkeypatch.setattr(request_logging.JsonFormatter, 'format', tracking_format)
+    args = ['RFX-KEY']
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        request_logger.exception("check failed: %s", args)
+    # Аргументы изменились после вызова - в лог попадает значение на момент записи
+    args.append('RFX-OTHER')
+
+    [record] = log_lines()
+    assert record['event'] == "check failed: ['RFX-KEY']"
+    assert 'ValueError: boom' in record['exc']
+    assert formatted_in and threading.current_thread() not in formatted_in
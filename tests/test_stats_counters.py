@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+import db
+import expiry_scheduler
+import main
+import stats_counters
+from db_writer import get_writer
+
+# Эталон - полный подсчет по licenses
+COUNT_SQL = {
+    'total_licenses': 'SELECT COUNT(*) FROM licenses',
+    'active_licenses': 'SELECT COUNT(*) FROM licenses WHERE is_active = 1 AND payment_verified = 1',
+    'pending_payments': 'SELECT COUNT(*) FROM licenses WHERE payment_verified = 0',
+    'total_users': 'SELECT COUNT(DISTINCT telegram_user_id) FROM licenses',
+}
+
+
+def _insert_license(conn, license_key, telegram_user_id, payment_verified=1, days=30):
+    conn.execute('''
+        INSERT INTO licenses (license_key, plan_type, telegram_user_id, expires_at, is_active, payment_verified)
+        VALUES (?, 'monthly', ?, ?, 1, ?)
+    ''', (license_key, telegram_user_id, datetime.now() + timedelta(days=days), payment_verified))
+
+
+def _execute(conn, sql, params=()):
+    conn.execute(sql, params)
+
+
+def _assert_counters_match(path):
+    conn = db.get_connection(path)
+    stored = stats_counters.read_stats(conn)
+    counted = {name: conn.execute(sql).fetchone()[0] for name, sql in COUNT_SQL.items()}
+    assert {name: stored[name] for name in counted} == counted
+    return stored
+
+
+def test_triggers_match_count_after_writes(db_path):
+    writer = get_writer(db_path)
+    writer.execute(_insert_license, 'RFX-A', '1')
+    writer.execute(_insert_license, 'RFX-B', '1', payment_verified=0)
+    writer.execute(_insert_license, 'RFX-C', '2', payment_verified=0)
+    writer.execute(_insert_license, 'RFX-D', None)
+    _assert_counters_match(db_path)
+
+    writer.execute(_execute, "UPDATE licenses SET payment_verified = 1 WHERE license_key = 'RFX-B'")
+    writer.execute(_execute, "UPDATE licenses SET is_active = 0 WHERE license_key = 'RFX-A'")
+    writer.execute(_execute, "UPDATE licenses SET telegram_user_id = '3' WHERE license_key = 'RFX-D'")
+    _assert_counters_match(db_path)
+
+    writer.execute(_execute, "DELETE FROM licenses WHERE license_key IN ('RFX-C', 'RFX-D')")
+    stored = _assert_counters_match(db_path)
+    assert (stored['total_licenses'], stored['active_licenses'], stored['total_users']) == (2, 1, 1)
+
+
+def test_reconcile_corrects_drift(db_path):
+    writer = get_writer(db_path)
+    writer.execute(_insert_license, 'RFX-A', '1')
+    # Правка счетчика в обход триггеров
+    writer.execute(_execute, "UPDATE license_stats SET value = 100 WHERE name = 'total_licenses'")
+
+    assert stats_counters.reconcile_stats(db_path) == {'total_licenses': (100, 1)}
+    _assert_counters_match(db_path)
+    assert stats_counters.reconcile_stats(db_path) == {}
+
+
+def test_reconcile_counts_expired(db_path):
+    get_writer(db_path).execute(_insert_license, 'RFX-OLD', '1', days=-1)
+    assert stats_counters.reconcile_stats(db_path) == {'expired_licenses': (0, 1)}
+
+
+def test_corrections_are_applied_as_deltas(db_path):
+    writer = get_writer(db_path)
+    writer.execute(_insert_license, 'RFX-A', '1')
+    # Запись после снимка сверки не теряется: поправка сдвигает текущее значение
+    writer.execute(_insert_license, 'RFX-B', '1')
+    writer.execute(stats_counters._apply_corrections, {'total_licenses': -1})
+
+    assert stats_counters.read_stats(db.get_connection(db_path))['total_licenses'] == 1
+
+
+def test_expiry_sweep_counts_expired(db_path):
+    writer = get_writer(db_path)
+    writer.execute(_insert_license, 'RFX-OLD', '1', days=-1)
+    writer.execute(_insert_license, 'RFX-NEW', '1')
+
+    assert writer.execute(expiry_scheduler._expire_due, datetime.now(), 100) == ['RFX-OLD']
+    stored = _assert_counters_match(db_path)
+    assert stored['expired_licenses'] == 1
+    # Сверка с ним согласна
+    assert stats_counters.reconcile_stats(db_path) == {}
+
+
+def test_stats_endpoint_reads_counters(service_db):
+    get_writer(service_db).execute(_insert_license, 'RFX-A', '1')
+    get_writer(service_db).execute(_insert_license, 'RFX-B', '2', payment_verified=0)
+
+    body = main.app.test_client().get('/stats').get_json()
+    assert (body['total_licenses'], body['active_licenses'], body['pending_payments'], body['total_users']) == (2, 1, 1, 2)
@@ -0,0 +1,84 @@
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import db
+import telegram_bot
+from db_writer import get_writer
+
+
+def _trials(path, telegram_user_id):
+    return [row[0] for row in db.get_connection(path).execute(
+        "SELECT license_key FROM licenses WHERE telegram_user_id = ? AND plan_type = 'trial'",
+        (str(telegram_user_id),)
+    )]
+
+
+def test_concurrent_requests_issue_one_trial(service_db):
+    expires_at = datetime.now() + timedelta(days=telegram_bot.TRIAL_DAYS)
+    barrier = threading.Barrier(8)
+    results = {}
+
+    def request_trial(i):
+        barrier.wait()
+        results[i] = telegram_bot.save_trial_license(f'RFX-TRIAL-{i}', 1001, expires_at)
+
+    threads = [threading.Thread(target=request_trial, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results.values()) == [False] * 7 + [True]
+    assert len(_trials(service_db, 1001)) == 1
+    assert telegram_bot.has_trial_license(1001)
+
+
+def test_repeated_trial_refused(service_db):
+    expires_at = datetime.now() + timedelta(days=telegram_bot.TRIAL_DAYS)
+    assert telegram_bot.save_trial_license('RFX-TRIAL-A', 1002, expires_at) is True
+    assert telegram_bot.save_trial_license('RFX-TRIAL-B', 1002, expires_at) is False
+    assert _trials(service_db, 1002) == ['RFX-TRIAL-A']
+
+
+def test_unique_index_rejects_duplicate_trial(db_path):
+    writer = get_writer(db_path)
+    expires_at = datetime.now() + timedelta(days=3)
+    writer.execute(telegram_bot._insert_license, 'RFX-T1', 'trial', 7, expires_at, 1, 0)
+    with pytest.raises(sqlite3.IntegrityError):
+        writer.execute(telegram_bot._insert_license, 'RFX-T2', 'trial', 7, expires_at, 1, 0)
+    # Платные лицензии индекс не ограничивает
+    writer.execute(telegram_bot._insert_license, 'RFX-M1', 'monthly', 7, expires_at, 0, 100)
+    writer.execute(telegram_bot._insert_license, 'RFX-M2', 'monthly', 7, expires_at, 0, 100)
+
+
+def test_legacy_duplicate_trials_do_not_break_schema(db_path, caplog):
+    conn = db.get_connection(db_path)
+    conn.execute('DROP INDEX idx_one_trial_per_user')
+    conn.commit()
+    writer = get_writer(db_path)
+    expires_at = datetime.now() + timedelta(days=3)
+    writer.execute(telegram_bot._insert_license, 'RFX-T1', 'trial', 7, expires_at, 1, 0)
+    writer.execute(telegram_bot._insert_license, 'RFX-T2', 'trial', 7, expires_at, 1, 0)
+
+    with caplog.at_level(logging.WARNING):
+        db.init_schema(conn)
+    assert 'idx_one_trial_per_user' in caplog.text
+    assert conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'idx_one_trial_per_user'"
+    ).fetchone() is None
+
+
+def test_key_collision_reported_as_error(service_db):
+    expires_at = datetime.now() + timedelta(days=telegram_bot.TRIAL_DAYS)
+    get_writer(service_db).execute(telegram_bot._insert_license, 'RFX-TAKEN', 'monthly', 2001, expires_at, 0, 0)
+
+    assert telegram_bot.save_trial_license('RFX-TAKEN', 2002, expires_at) is None
+    assert _trials(service_db, 2002) == []
+    # Строка пользователя пишется только вместе с лицензией
+    assert db.get_connection(service_db).execute(
+        "SELECT COUNT(*) FROM users WHERE telegram_user_id = '2002'"
+    ).fetchone()[0] == 0
@@ -0,0 +1,82 @@
+import random
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from update_processor import PerUserUpdateProcessor, update_user_key
+
+
+def _update(user_id):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), effective_chat=None)
+
+
+def test_update_user_key():
+    assert update_user_key(_update(7)) == 7
+    assert update_user_key(SimpleNamespace(effective_user=None, effective_chat=SimpleNamespace(id=9))) == 9
+    assert update_user_key(object()) is None
+
+
+def test_invalid_limit():
+    with pytest.raises(ValueError):
+        PerUserUpdateProcessor(0)
+
+
+def test_same_user_order_under_concurrency():
+    limit = 4
+    users = 6
+    per_user = 10
+    handled = {user_id: [] for user_id in range(users)}
+    running = 0
+    peak = 0
+
+    async def handle(user_id, seq):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        # Разная длительность: без упорядочивания поздние апдейты обгоняли бы ранние
+        await asyncio.sleep(random.uniform(0, 0.005))
+        handled[user_id].append(seq)
+        running -= 1
+
+    async def main():
+        random.seed(14)
+        async with PerUserUpdateProcessor(limit) as processor:
+            # Апдейты приходят вперемешку, как из очереди PTB
+            tasks = [
+                asyncio.create_task(processor.process_update(_update(user_id), handle(user_id, seq)))
+                for seq in range(per_user) for user_id in range(users)
+            ]
+            await asyncio.gather(*tasks)
+            return processor
+
+    processor = asyncio.run(main())
+
+    assert all(sequence == list(range(per_user)) for sequence in handled.values())
+    assert 1 < peak <= limit
+    assert processor.stats()['processed'] == users * per_user
+    assert processor.stats()['users_in_flight'] == 0
+
+
+def test_cancelled_update_keeps_chain_order():
+    order = []
+
+    async def handle(name, delay):
+        await asyncio.sleep(delay)
+        order.append(name)
+
+    async def main():
+        async with PerUserUpdateProcessor(2) as processor:
+            first = asyncio.create_task(processor.process_update(_update(1), handle('first', 0.02)))
+            second = asyncio.create_task(processor.process_update(_update(1), handle('second', 0)))
+            third = asyncio.create_task(processor.process_update(_update(1), handle('third', 0)))
+            await asyncio.sleep(0.005)
+            # Отмененный апдейт в середине цепочки не пропускает следующий вперед
+            second.cancel()
+            await asyncio.gather(first, third, return_exceptions=True)
+            return processor
+
+    processor = asyncio.run(main())
+
+    assert order == ['first', 'third']
+    assert processor.stats()['users_in_flight'] == 0
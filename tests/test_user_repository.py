@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import db
+from db_writer import get_writer
+from user_repository import UserRepository
+
+
+def _insert_license(conn, license_key, telegram_user_id, plan_type, payment_verified, created_at):
+    conn.execute('''
+        INSERT INTO licenses (license_key, plan_type, telegram_user_id, expires_at, is_active,
+                              payment_verified, created_at)
+        VALUES (?, ?, ?, ?, 1, ?, ?)
+    ''', (license_key, plan_type, telegram_user_id, datetime.now() + timedelta(days=30), payment_verified, created_at))
+
+
+def test_ensure_user_persists_and_caches(db_path):
+    repository = UserRepository(db_path)
+    assert repository.get(42) is None
+
+    record = repository.ensure_user(42, 'alice')
+    assert (record.telegram_user_id, record.username, record.has_trial) == ('42', 'alice', False)
+
+    # Повторный /start с тем же именем - из кэша, без записи
+    commits = get_writer(db_path).commits
+    assert repository.ensure_user(42, 'alice') is record
+    assert get_writer(db_path).commits == commits
+
+    # Новый процесс бота видит пользователя в БД
+    assert UserRepository(db_path).get(42).username == 'alice'
+
+
+def test_rename_updates_database(db_path):
+    repository = UserRepository(db_path)
+    repository.ensure_user(42, 'alice')
+    assert repository.ensure_user(42, 'alice_new').username == 'alice_new'
+    row = db.get_connection(db_path).execute("SELECT username FROM users WHERE telegram_user_id = '42'").fetchone()
+    assert row['username'] == 'alice_new'
+
+
+def test_has_trial(db_path):
+    repository = UserRepository(db_path)
+    repository.ensure_user(42, 'alice')
+    assert not repository.has_trial(42)
+
+    get_writer(db_path).execute(_insert_license, 'RFX-T', '42', 'trial', 1, datetime.now())
+    repository.mark_trial(42)
+    assert repository.has_trial(42)
+    # Пользователь без записи в кэше - по БД
+    assert UserRepository(db_path).has_trial(42)
+    assert not UserRepository(db_path).has_trial(43)
+
+
+def test_cache_is_bounded(db_path):
+    repository = UserRepository(db_path, max_size=2)
+    for user_id in (1, 2, 3):
+        repository.ensure_user(user_id, f'user{user_id}')
+
+    assert repository.stats()['size'] == 2
+    assert repository.stats()['evictions'] >= 1
+    # Вытесненная запись загружается из БД
+    assert repository.get(1).username == 'user1'
+
+
+def test_find_unpaid_license_returns_oldest(db_path):
+    writer = get_writer(db_path)
+    now = datetime.now()
+    writer.execute(_insert_license, 'RFX-NEW', '42', 'monthly', 0, now)
+    writer.execute(_insert_license, 'RFX-OLD', '42', 'monthly', 0, now - timedelta(hours=1))
+    writer.execute(_insert_license, 'RFX-PAID', '42', 'monthly', 1, now - timedelta(hours=2))
+
+    repository = UserRepository(db_path)
+    assert repository.find_unpaid_license(42).license_key == 'RFX-OLD'
+    assert repository.find_unpaid_license(43) is None
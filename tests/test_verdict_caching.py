@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import db
+import license_service
+import main
+from db_writer import get_writer
+from license_cache import license_cache
+
+
+def _insert_license(conn, license_key, expires_at, payment_verified=1):
+    conn.execute('''
+        INSERT INTO licenses (license_key, account_number, plan_type, expires_at, is_active, payment_verified)
+        VALUES (?, '100', 'monthly', ?, 1, ?)
+    ''', (license_key, expires_at, payment_verified))
+
+
+def _insert_unbound(conn, license_key):
+    conn.execute('''
+        INSERT INTO licenses (license_key, plan_type, expires_at, is_active, payment_verified)
+        VALUES (?, 'monthly', ?, 1, 1)
+    ''', (license_key, datetime.now() + timedelta(days=30)))
+
+
+def _renew(conn, license_key, expires_at):
+    conn.execute('UPDATE licenses SET expires_at = ? WHERE license_key = ?', (expires_at, license_key))
+
+
+@pytest.fixture
+def client(service_db):
+    writer = get_writer(service_db)
+    writer.execute(_insert_license, 'RFX-PAID', datetime.now() + timedelta(days=30))
+    writer.execute(_insert_license, 'RFX-ENDING', datetime.now() + timedelta(seconds=20))
+    writer.execute(_insert_license, 'RFX-UNPAID', datetime.now() + timedelta(days=30), 0)
+    return main.app.test_client()
+
+
+def _max_age(response):
+    directives = dict(
+        directive.strip().partition('=')[::2] for directive in response.headers['Cache-Control'].split(',')
+    )
+    assert 'public' in directives
+    assert directives['max-age'] == directives['s-maxage']
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    return int(directives['max-age'])
+
+
+def test_etag_stable_between_checks(client):
+    first = client.get('/check_license/RFX-PAID/100')
+    assert first.status_code == 200
+    assert first.headers['ETag'].startswith('W/"')
+    assert _max_age(first) == license_service.VERDICT_MAX_AGE
+
+    # Из кэша и после сброса кэша (другой воркер) - тот же тег
+    assert client.get('/check_license/RFX-PAID/100').headers['ETag'] == first.headers['ETag']
+    license_cache.clear()
+    assert client.get('/check_license/RFX-PAID/100').headers['ETag'] == first.headers['ETag']
+
+
+@pytest.mark.parametrize('if_none_match', ['{etag}', '{opaque}', 'W/"other", {etag}', '*'])
+def test_if_none_match_returns_304(client, if_none_match):
+    etag = client.get('/check_license/RFX-PAID/100').headers['ETag']
+    not_modified = license_service.not_modified
+
+    response = client.get('/check_license/RFX-PAID/100', headers={
+        'If-None-Match': if_none_match.format(etag=etag, opaque=etag[2:])
+    })
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    assert _max_age(response) == license_service.VERDICT_MAX_AGE
+    assert license_service.not_modified - not_modified == 1
+
+
+def test_stale_etag_gets_full_response(client):
+    etag = client.get('/check_license/RFX-PAID/100').headers['ETag']
+    get_writer(db.DATABASE_PATH).execute(_renew, 'RFX-PAID', datetime.now() + timedelta(days=60))
+    license_cache.invalidate('RFX-PAID')
+
+    response = client.get('/check_license/RFX-PAID/100', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['valid'] is True
+
+
+def test_refusals_never_304(client):
+    response = client.get('/check_license/RFX-UNPAID/100')
+    assert response.status_code == 402
+    assert _max_age(response) == license_service.VERDICT_NEGATIVE_MAX_AGE
+
+    response = client.get('/check_license/RFX-UNPAID/100', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 402
+    assert client.get('/check_license/RFX-PAID/200', headers={'If-None-Match': '*'}).status_code == 403
+
+
+def test_max_age_capped_by_expiry(client):
+    assert 0 < _max_age(client.get('/check_license/RFX-ENDING/100')) <= 20
+
+
+def test_binding_request_returns_current_etag(client):
+    get_writer(db.DATABASE_PATH).execute(_insert_unbound, 'RFX-FREE')
+    # Первая проверка привязывает счет: тег уже от новой версии строки
+    first = client.get('/check_license/RFX-FREE/300')
+    assert first.status_code == 200
+    license_cache.clear()
+    second = client.get('/check_license/RFX-FREE/300')
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert client.get('/check_license/RFX-FREE/300', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
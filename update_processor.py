@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+import asyncio
+
+from telegram.ext import BaseUpdateProcessor
+
+# ============================================================================
+# 🔀 ПАРАЛЛЕЛЬНАЯ ОБРАБОТКА АПДЕЙТОВ С ПОРЯДКОМ ВНУТРИ ПОЛЬЗОВАТЕЛЯ
+# ============================================================================
+#
+# Апдейты разных пользователей идут параллельно (не больше max_concurrent),
+# апдейты одного пользователя - строго в порядке поступления: покупка,
+# выбор карты и чек оплаты не обгоняют друг друга.
+#
+# Очередь пользователя не занимает слоты: апдейт, ждущий предыдущий апдейт
+# того же пользователя, не мешает остальным. Поэтому семафор PTB задан с
+# большим запасом, а реальный лимит - собственный семафор после упорядочивания.
+
+# Верхняя граница апдейтов "в работе + в очереди пользователей" для семафора PTB
+MAX_PENDING_UPDATES = 65536
+
+
+def update_user_key(update):
+    """Ключ упорядочивания: пользователь (или чат); None - порядок не важен"""
+    user = getattr(update, 'effective_user', None)
+    if user is not None:
+        return user.id
+    chat = getattr(update, 'effective_chat', None)
+    if chat is not None:
+        return chat.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Шардирование апдейтов по пользователю поверх concurrent_updates PTB"""
+
+    __slots__ = ('limit', '_slots', '_tails', 'processed', 'waited')
+
+    def __init__(self, max_concurrent_updates):
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        # Семафор PTB практически не ограничивает: do_process_update вызывается
+        # без ожидания, т.е. в порядке поступления - на этом держится порядок цепочек.
+        # (Application.concurrent_updates поэтому показывает MAX_PENDING_UPDATES,
+        # фактический лимит - self.limit)
+        super().__init__(MAX_PENDING_UPDATES)
+        self.limit = max_concurrent_updates
+        self._slots = None
+        self._tails = {}
+        self.processed = 0
+        self.waited = 0
+
+    async def initialize(self):
+        self._slots = asyncio.Semaphore(self.limit)
+
+    async def shutdown(self):
+        pass
+
+    async def do_process_update(self, update, coroutine):
+        key = update_user_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            self.processed += 1
+            return
+
+        # Встаем в хвост цепочки пользователя синхронно (до первого await)
+        previous = self._tails.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[key] = done
+        started = False
+        try:
+            if previous is not None and not previous.done():
+                self.waited += 1
+                await asyncio.shield(previous)
+            async with self._slots:
+                started = True
+                await coroutine
+            self.processed += 1
+        finally:
+            if not started:
+                coroutine.close()
+            if previous is not None and not previous.done():
+                # Нас отменили раньше предшественника: следующий ждет и его
+                previous.add_done_callback(lambda _: self._release(key, done))
+            else:
+                self._release(key, done)
+
+    def _release(self, key, done):
+        if not done.done():
+            done.set_result(None)
+        if self._tails.get(key) is done:
+            del self._tails[key]
+
+    def stats(self):
+        """Загрузка для логов/метрик"""
+        return {
+            "max_concurrent": self.limit,
+            "users_in_flight": len(self._tails),
+            "processed": self.processed,
+            "waited_for_previous": self.waited
+        }
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import db
+from db_writer import get_writer
+
+# ============================================================================
+# 👤 ПОЛЬЗОВАТЕЛИ БОТА: ХРАНИЛИЩЕ В БД + ОГРАНИЧЕННЫЙ КЭШ ЗАПИСЕЙ
+# ============================================================================
+#
+# Источник правды - таблицы users/licenses. В памяти держим только
+# компактные записи активных пользователей (LRU), поэтому память не растет
+# вместе с базой и данные переживают перезапуск бота.
+
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+
+
+class UserRecord:
+    """Закэшированные сведения о пользователе (без списков лицензий)"""
+    __slots__ = ('telegram_user_id', 'username', 'has_trial')
+
+    def __init__(self, telegram_user_id, username, has_trial):
+        self.telegram_user_id = telegram_user_id
+        self.username = username
+        self.has_trial = has_trial
+
+
+class UnpaidLicense:
+    """Неоплаченная месячная лицензия, ожидающая подтверждения"""
+    __slots__ = ('license_key', 'expires_at')
+
+    def __init__(self, license_key, expires_at):
+        self.license_key = license_key
+        self.expires_at = expires_at
+
+
+def parse_db_datetime(value):
+    """DATETIME из SQLite (строка) -> datetime"""
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+def _upsert_user(conn, telegram_user_id, username):
+    """Намерение записи: пользователь (имя обновляем, если изменилось)"""
+    conn.execute('''
+        INSERT INTO users (telegram_user_id, username, total_licenses)
+        VALUES (?, ?, 0)
+        ON CONFLICT(telegram_user_id) DO UPDATE SET username = excluded.username
+        WHERE users.username IS NOT excluded.username
+    ''', (telegram_user_id, username))
+
+
+class UserRepository:
+    """Доступ к пользователям бота; методы синхронные (вызывать через run_db)"""
+
+    def __init__(self, path=db.DATABASE_PATH, max_size=USER_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, telegram_user_id):
+        """Запись пользователя или None, если он еще не заходил в бота"""
+        user_id = str(telegram_user_id)
+        with self._lock:
+            record = self._records.get(user_id)
+            if record is not None:
+                self._records.move_to_end(user_id)
+                self.hits += 1
+                return record
+            self.misses += 1
+
+        record = self._load(user_id)
+        if record is not None:
+            self._remember(record)
+        return record
+
+    def ensure_user(self, telegram_user_id, username):
+        """Регистрация при /start (запись в БД только для новых/переименованных)"""
+        record = self.get(telegram_user_id)
+        if record is not None and record.username == username:
+            return record
+
+        get_writer(self.path).execute(_upsert_user, str(telegram_user_id), username)
+        self.invalidate(telegram_user_id)
+        return self.get(telegram_user_id)
+
+    def has_trial(self, telegram_user_id):
+        """Получал ли пользователь триал (индекс по telegram_user_id, plan_type)"""
+        record = self.get(telegram_user_id)
+        if record is not None:
+            return record.has_trial
+        return self._has_trial_in_db(str(telegram_user_id))
+
+    def mark_trial(self, telegram_user_id):
+        """Триал выдан: обновляем закэшированную запись без похода в БД"""
+        with self._lock:
+            record = self._records.get(str(telegram_user_id))
+            if record is not None:
+                record.has_trial = True
+
+    def find_unpaid_license(self, telegram_user_id):
+        """Самая старая неоплаченная месячная лицензия (всегда из БД: оплату могут подтвердить/отклонить в API)"""
+        row = db.get_connection(self.path).execute('''
+            SELECT license_key, expires_at FROM licenses
+            WHERE telegram_user_id = ? AND plan_type = 'monthly' AND payment_verified = 0 AND is_active = 1
+            ORDER BY created_at, id
+            LIMIT 1
+        ''', (str(telegram_user_id),)).fetchone()
+        if row is None:
+            return None
+        return UnpaidLicense(row['license_key'], parse_db_datetime(row['expires_at']))
+
+    def invalidate(self, telegram_user_id):
+        with self._lock:
+            self._records.pop(str(telegram_user_id), None)
+
+    def clear(self):
+        """Сбросить все записи (журнал изменений потерян - см. license_changes)"""
+        with self._lock:
+            self._records.clear()
+
+    def stats(self):
+        """Размер и эффективность кэша записей"""
+        with self._lock:
+            return {
+                "size": len(self._records),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def _load(self, user_id):
+        row = db.get_connection(self.path).execute(
+            'SELECT username FROM users WHERE telegram_user_id = ?', (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return UserRecord(user_id, row['username'], self._has_trial_in_db(user_id))
+
+    def _has_trial_in_db(self, user_id):
+        row = db.get_connection(self.path).execute('''
+            SELECT 1 FROM licenses WHERE telegram_user_id = ? AND plan_type = 'trial' LIMIT 1
+        ''', (user_id,)).fetchone()
+        return row is not None
+
+    def _remember(self, record):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._records[record.telegram_user_id] = record
+            self._records.move_to_end(record.telegram_user_id)
+            while len(self._records) > self.max_size:
+                self._records.popitem(last=False)
+                self.evictions += 1
+
+
+# Общее хранилище процесса бота
+user_repository = UserRepository()